@@ -9,6 +9,7 @@ import logging
 import signal
 import sys
 import time
+from core.network_state import NetworkState
 
 def setup_logging():
     logging.basicConfig(
@@ -89,26 +90,11 @@ def reset_bluetooth():
         logger.error(f"Failed to reset bluetooth adapter: {e}")
         return False
 
-def check_network():
+def check_network(network):
     try:
-        wifi_connected = False
-        rssi = -100
-        wifi_output = subprocess.run(['iwconfig', 'wlan0'], capture_output=True, text=True).stdout
-        
-        if "ESSID:\"" in wifi_output:
-            wifi_connected = True
-            try:
-                rssi = int(wifi_output.split('Signal level=')[1].split(' ')[0])
-            except:
-                rssi = -100
-                
-        eth_connected = subprocess.run(
-            ['cat', '/sys/class/net/eth0/carrier'], 
-            capture_output=True, 
-            text=True
-        ).stdout.strip() == '1'
-        
-        return wifi_connected, eth_connected, rssi
+        state = network.snapshot()
+        rssi = state['rssi'] if state['rssi'] is not None else -100
+        return state['wifi'], state['ethernet'], rssi
         
     except Exception as e:
         logger.error(f"Error checking network: {e}")
@@ -181,7 +167,7 @@ def main():
     def update_loop():
         try:
             # Get network status
-            wifi_on, eth_on, rssi = check_network()
+            wifi_on, eth_on, rssi = check_network(network)
             
             # Update advertisement data
             advertisement.update_manufacturer_data(wifi_on, eth_on, rssi)
@@ -206,11 +192,20 @@ def main():
                 ad_manager.UnregisterAdvertisement(advertisement.path)
         except:
             pass
+        network.stop()
         mainloop.quit()
     
     signal.signal(signal.SIGTERM, cleanup)
     signal.signal(signal.SIGINT, cleanup)
     
+    def on_network_change(state):
+        # Called from the network monitor thread; run the update on the GLib loop
+        GLib.idle_add(lambda: update_loop() and False)
+
+    network = NetworkState()
+    network.start()
+    network.subscribe(on_network_change)
+
     GLib.timeout_add_seconds(60, update_loop)
     update_loop()  # Initial update
     
@@ -0,0 +1 @@
+# Makes core/ and plugins/ importable when pytest runs from the app directory
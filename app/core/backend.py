@@ -2,7 +2,15 @@ import json
 import requests
 import logging
 import socket
+import time
 from config.config import ConfigSettings
+from core import metrics
+from core import plugin_stats
+from core.ble_presence import PRESENCE
+from core.scan_report import ScanReport
+
+API_REQUEST_SECONDS = metrics.histogram('hub_api_request_seconds', 'Latency of requests to the backend API', ['endpoint'])
+API_ERRORS = metrics.counter('hub_api_errors', 'Failed requests to the backend API', ['endpoint', 'reason'])
 
 
 class ApiBackend():
@@ -11,6 +19,9 @@ class ApiBackend():
         self.api_token = ""
         self.refresh_token = ""
         self.location = {}
+        # Deltas only for a backend that asks for them; otherwise once it echoes a sequence
+        self.scan_report = ScanReport(deltas=self.config.config.getboolean('settings', 'scan_report_deltas',
+                                                                            fallback=False))
         pass
     
 
@@ -26,15 +37,22 @@ class ApiBackend():
 
     def make_api_request(self, endpoint, json_data, headers, timeout) -> json:
         url = self.config.get('server', 'server_url') + endpoint
+        endpoint_label = endpoint.split('?')[0]
         logging.debug(f"Making request to: {url}")
+        start = time.perf_counter()
         try:
             if json_data == None:
                 response = requests.get(url, headers=headers, timeout=timeout)
             else:
                 response = requests.post(url, json=json_data, headers=headers, timeout=timeout)
+            API_REQUEST_SECONDS.labels(endpoint_label).observe(time.perf_counter() - start)
+            if response.status_code >= 400:
+                API_ERRORS.labels(endpoint_label, str(response.status_code)).inc()
             try: return json.loads(response.text)
             except: return {'statusCode': response.status_code, 'data': response.text}
         except requests.RequestException as e:
+            API_REQUEST_SECONDS.labels(endpoint_label).observe(time.perf_counter() - start)
+            API_ERRORS.labels(endpoint_label, e.__class__.__name__).inc()
             logging.error(f"Failed to make request to {url} due to {e}")
             return None
 
@@ -102,7 +120,7 @@ class ApiBackend():
             return False
 
 
-    def ping_server(self, serial_hash, logs) -> str:
+    def ping_server(self, serial_hash, logs, stats=None) -> str:
         if self.api_token == "":
             logging.error("No API token found. Cannot ping server")
             self.get_token(serial_hash)
@@ -110,6 +128,9 @@ class ApiBackend():
         
         headers = self.get_headers(include_auth_token=True)
         json_data = logs
+        if stats and isinstance(logs, dict):
+            # Per-plugin resource accounting rides along with the logs
+            json_data = {**logs, "plugin_stats": stats}
 
         response_data = self.make_api_request(self.config.get('endpoints', 'ping_ep'), json_data, headers, int(self.config.get('settings', 'http_timeout')))
 
@@ -179,12 +200,11 @@ class ApiBackend():
             logging.error("No API token found. Cannot post scan results")
             return False
 
-        json_data = {
-            "devices": []
-        }
+        records = []
         for plugin in plugins:
             for device in plugin.devices.values():
-                json_data['devices'].append({
+                presence = PRESENCE.get(device.mac_address)
+                records.append({
                     "ip": device.ip,
                     "mac_address": device.mac_address,
                     "device_name": device.device_name,
@@ -193,20 +213,27 @@ class ApiBackend():
                     "model_no": device.model_no,
                     "serial_no": device.serial_no,
                     "manufacturer": device.manufacturer,
-                    "firmware": device.firmware
+                    "firmware": device.firmware,
+                    "rssi": round(presence.rssi) if presence and presence.rssi is not None else None,
                 })
 
-        
+        # Only new, changed and removed devices, with a periodic full resync, once the backend takes deltas
+        json_data = self.scan_report.build(records)
+        logging.info(f"Scan report {json_data['sequence']} ({'full' if json_data['full'] else 'delta'}): "
+                     f"{len(json_data['devices'])} of {len(records)} devices, {len(json_data.get('removed', []))} removed")
         headers = self.get_headers(include_auth_token=True)
         response_data = self.make_api_request(self.config.get('endpoints', 'scan_data_ep'), json_data, headers, int(self.config.get('settings', 'http_timeout')))
         
         if response_data is None:
             logging.error("Failed to post scan results to server")
+            self.scan_report.reject(json_data['sequence'])
             return False
 
         if response_data.get('statusCode') == 200:
+            self.scan_report.acknowledge(json_data['sequence'], response_data.get('sequence'))
             return True
         else:
+            self.scan_report.reject(json_data['sequence'])
             logging.error(f"Failed to post scan results to server: {response_data.get('statusCode')}")
             logging.debug(json_data)
             logging.debug(response_data)
@@ -217,8 +244,9 @@ class ApiBackend():
         if self.api_token == "":
             logging.error("No API token found. Cannot send collected data")
             return False
+        plugin_stats.record_event()
         
-        logging.info(f"Sending data to API: {data}")
+        logging.debug(f"Sending data to API: {data}")
         headers = self.get_headers(include_auth_token=True)
         response_data = self.make_api_request(self.config.get('endpoints', 'send_data_ep'), data, headers, int(self.config.get('settings', 'http_timeout')))
         
@@ -1,54 +1,261 @@
 
 
 
+import asyncio
 import logging
+import os
+import threading
+from collections import deque
 from bleak import BleakScanner, BleakClient
+from core.plugin_manifest import PluginManifest
+from core import ble_capture
+from core.ble_presence import PRESENCE
+
+# Set by main.py from --ble-capture/--ble-replay; inherited by isolated plugin workers
+CAPTURE_ENV = 'HUB_BLE_CAPTURE'
+REPLAY_ENV = 'HUB_BLE_REPLAY'
+REPLAY_SPEED_ENV = 'HUB_BLE_REPLAY_SPEED'
+SIMULATION_ENV = 'HUB_BLE_SIMULATION'
+MAX_CONNECTIONS = 3  # concurrent GATT connections the hub opens; BlueZ controllers commonly manage 3 to 7
+
+_capture_lock = threading.Lock()
+_capture_writer = None
+_replay_source = None
+_simulator = None
+_connection_slots = None
+
+
+def simulator():
+    """The simulated adapter of this process if --ble-simulate is set, else None."""
+    global _simulator
+    path = os.environ.get(SIMULATION_ENV)
+    if not path:
+        return None
+    with _capture_lock:
+        if _simulator is None:
+            from core.ble_simulator import SimulatedBLE
+            _simulator = SimulatedBLE.from_file(path)
+            logging.info(f"Simulating {len(_simulator.devices)} BLE devices from {path}")
+        return _simulator
+
+
+def connection_limit() -> int:
+    """How many GATT connections plugins should hold at once."""
+    adapter = simulator()
+    return adapter.max_connections if adapter is not None else MAX_CONNECTIONS
+
+
+class ConnectionSlots:
+    """
+    The GATT connection budget of the process, shared by pollers and pools on any event loop.
+
+    acquire() waits in turn for one of `limit` slots; release() hands the slot straight to
+    the oldest waiter, which may run on another loop.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        self.lock = threading.Lock()
+        self.waiters = deque()  # (loop, future) in arrival order
+
+
+    def try_acquire(self) -> bool:
+        with self.lock:
+            if self.in_use < self.limit and not self.waiters:
+                self.in_use += 1
+                return True
+            return False
+
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if self.in_use < self.limit and not self.waiters:
+                self.in_use += 1
+                return
+            waiter = (loop, loop.create_future())
+            self.waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self.lock:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+                    raise
+            # The slot was handed over; wake() passes it on if it has not run yet
+            if not waiter[1].cancelled():
+                self.release()
+            raise
+
+
+    def release(self) -> None:
+        with self.lock:
+            while self.waiters:
+                loop, future = self.waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(self.wake, future)
+                    return
+                except RuntimeError:
+                    continue  # Loop closed, the waiter is gone
+            self.in_use -= 1
+
+
+    def wake(self, future) -> None:
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+
+    def waiting(self) -> int:
+        return len(self.waiters)
+
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+def connection_slots() -> ConnectionSlots:
+    """Slots for connection_limit() GATT connections, shared by every plugin of this process."""
+    global _connection_slots
+    limit = connection_limit()
+    with _capture_lock:
+        if _connection_slots is None:
+            _connection_slots = ConnectionSlots(limit)
+        return _connection_slots
+
+
+def create_client(address, **kwargs):
+    """GATT client for the hub and plugins: a BleakClient, or a client of the simulated adapter."""
+    adapter = simulator()
+    if adapter is not None:
+        return adapter.client(address, **kwargs)
+    return BleakClient(address, **kwargs)
+
+
+def create_scanner(detection_callback=None):
+    """
+    Scanner for the hub and plugins: a BleakScanner, one that also records to the
+    capture file, or one that replays a capture file or simulates devices without a radio.
+    Every advertisement also feeds the presence cache.
+    """
+    global _capture_writer, _replay_source
+    detection_callback = PRESENCE.detection_callback(detection_callback)
+    adapter = simulator()
+    with _capture_lock:
+        if os.environ.get(REPLAY_ENV):
+            if _replay_source is None:
+                _replay_source = ble_capture.ReplaySource(os.environ[REPLAY_ENV], float(os.environ.get(REPLAY_SPEED_ENV) or 1.0))
+                logging.info(f"Replaying {len(_replay_source.records)} BLE advertisements from {os.environ[REPLAY_ENV]}")
+            return ble_capture.ReplayScanner(_replay_source, detection_callback=detection_callback)
+        if adapter is not None:
+            return adapter.scanner(detection_callback=detection_callback)
+        if os.environ.get(CAPTURE_ENV):
+            if _capture_writer is None:
+                _capture_writer = ble_capture.CaptureWriter(os.environ[CAPTURE_ENV])
+                logging.info(f"Recording BLE advertisements to {os.environ[CAPTURE_ENV]}")
+            return ble_capture.RecordingScanner(_capture_writer, detection_callback=detection_callback)
+    return BleakScanner(detection_callback=detection_callback)
+
+
+def matches_filter(search, adv_data) -> bool:
+    if search.scan_filter_method == 'device_name':
+        if adv_data.local_name and search.scan_filter in adv_data.local_name:
+            return True
+    elif search.scan_filter_method == 'uuid':
+        if adv_data.service_uuids and any(search.scan_filter == str(uuid) for uuid in adv_data.service_uuids):
+            return True
+    elif search.scan_filter_method == 'advertisement_data':
+        if adv_data.manufacturer_data:
+            manufacturer_data_bytes = b''
+            for key, value in adv_data.manufacturer_data.items():
+                manufacturer_data_bytes += bytes([key & 0xFF, key >> 8]) + value
+            if search.scan_filter in manufacturer_data_bytes:
+                return True
+    return False
+
 
 class BLEManager:
     def __init__(self):
-        self.scanner = BleakScanner()
+        self.scanner = create_scanner()
         pass
     
 
     async def discover(self, plugin, timeout=5) -> list:
-        logging.info("Scanning for devices in plugin: " + plugin.__class__.__name__ + "...")
-        search = plugin.SearchableDevice()
-        logging.info(f"Filtering by: {search.scan_filter_method} - {search.scan_filter}")
-
-        if search.scan_filter_method == 'emulator':
-            logging.info("Adding emulators:")
-            self.list_devices(plugin)
-            return 
-
-        def filter_func(result: tuple) -> bool:
-            _, adv_data = result
-            if search.scan_filter_method == 'device_name':
-                if adv_data.local_name and search.scan_filter in adv_data.local_name:
-                    return True
-            elif search.scan_filter_method == 'uuid':
-                if adv_data.service_uuids and any(search.scan_filter == str(uuid) for uuid in adv_data.service_uuids):
-                    return True
-            elif search.scan_filter_method == 'advertisement_data':
-                if adv_data.manufacturer_data:
-                    manufacturer_data_bytes = b''
-                    for key, value in adv_data.manufacturer_data.items():
-                        manufacturer_data_bytes += bytes([key & 0xFF, key >> 8]) + value
-                    if search.scan_filter in manufacturer_data_bytes:
-                        return True
-            return False
-        
-        results = await self.scanner.discover(timeout=timeout, return_adv=True)
-        for _, result in results.items():
-            logging.debug(result)
-            if filter_func(result):
-                new_device = plugin.Device(result[0].address, result[0].name)
-                plugin.devices[result[0].address] = new_device
+        await self.discover_plugins([plugin], timeout=timeout)
+
+
+    async def discover_plugins(self, plugins, timeout=5, manifests=(), load_plugin=None, max_age=None) -> None:
+        """
+        Runs one radio scan and hands every result to each plugin whose filter matches.
+        Manifests of plugins that are not imported yet are matched too; the first match
+        imports the plugin through load_plugin(name).
+
+        With max_age, devices from the presence cache are used instead when any scanner
+        reported an advertisement within max_age seconds, so no radio scan is needed.
+        """
+        searches = []
+        for plugin in plugins:
+            logging.info("Scanning for devices in plugin: " + plugin.__class__.__name__ + "...")
+            search = plugin.SearchableDevice()
+            logging.info(f"Filtering by: {search.scan_filter_method} - {search.scan_filter}")
+            if search.scan_filter_method == 'emulator':
+                logging.info("Adding emulators:")
+                self.list_devices(plugin)
+                continue
+            searches.append((plugin, search))
+
+        for manifest in manifests:
+            searches.append((manifest, manifest))
+
+        if not searches:
+            return
+
+        if max_age is not None and PRESENCE.is_fresh(max_age):
+            results = [(entry.device, entry.advertisement_data) for entry in PRESENCE.devices(max_age=max_age)]
+            logging.info(f"Using {len(results)} devices from the presence cache")
+        else:
+            results = list((await self.scan(timeout)).values())
+
+        found = {}  # plugin -> {address: Device}
+        for device, adv_data in results:
+            logging.debug((device, adv_data))
+            for i, (plugin, search) in enumerate(searches):
+                if matches_filter(search, adv_data):
+                    if isinstance(plugin, PluginManifest):
+                        plugin = load_plugin(plugin.name)
+                        if plugin is None:
+                            continue
+                        searches[i] = (plugin, search)
+                    found.setdefault(plugin, {})[device.address] = plugin.Device(device.address, device.name)
+
+        # Plugins may be iterating their devices in their own threads: publish a new dict
+        for plugin, devices in found.items():
+            plugin.devices = {**plugin.devices, **devices}
+            for new_device in devices.values():
                 plugin.associate_flow_node(new_device)
 
-        self.list_devices(plugin)
+        for plugin, _ in searches:
+            if not isinstance(plugin, PluginManifest):
+                self.list_devices(plugin)
         return 
 
 
+    async def scan(self, timeout=5) -> dict:
+        """One radio scan: address -> (device, advertisement data). The scanner feeds the presence cache."""
+        scanner = create_scanner()
+        await scanner.start()
+        await asyncio.sleep(timeout)
+        await scanner.stop()
+        return scanner.discovered_devices_and_advertisement_data
+
+
     def list_devices(self, plugin) -> None:
         for id, device in plugin.devices.items():
             logging.info(f"  {id} - {device.device_name} - {device.device_description}")
@@ -59,7 +266,7 @@ class BLEManager:
 
     async def connect_device(self, device) -> BleakClient:
         logging.info(f"Connecting to device: {device.device_name} ({device.mac_address})")
-        client = BleakClient(device.mac_address)
+        client = create_client(device.mac_address)
         await client.connect()
         return client
 
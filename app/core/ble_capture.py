@@ -0,0 +1,342 @@
+import asyncio
+import bisect
+import inspect
+import logging
+import struct
+import sys
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+MAGIC = b'BLECAP1\n'
+# Per advertisement: Unix time, address, RSSI, then the lengths of what follows:
+# local name (UTF-8), service UUIDs (16 bytes each), manufacturer data entries
+RECORD = struct.Struct('<d6sbBBB')
+MANUFACTURER_ENTRY = struct.Struct('<HB')  # company ID, value length, then the value
+
+Advertisement = namedtuple('Advertisement', 'timestamp address rssi local_name service_uuids manufacturer_data')
+
+
+def encode(timestamp, address, rssi, local_name, service_uuids, manufacturer_data) -> bytes:
+    name = (local_name or "").encode()[:255]
+    uuids = [uuid.UUID(str(u)).bytes for u in (service_uuids or ())][:255]
+    entries = list((manufacturer_data or {}).items())[:255]
+    parts = [RECORD.pack(timestamp, bytes.fromhex(address.replace(':', '')), max(-128, min(127, rssi or 0)),
+                         len(name), len(uuids), len(entries)), name, *uuids]
+    for company_id, value in entries:
+        value = bytes(value)[:255]
+        parts.append(MANUFACTURER_ENTRY.pack(company_id, len(value)))
+        parts.append(value)
+    return b''.join(parts)
+
+
+def read_capture(path) -> list:
+    """
+    All advertisements of a capture file, in recording order. A partially written last
+    record (the file is appended to while we read it) is left out.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a BLE capture file")
+    view = memoryview(data)
+    offset = len(MAGIC)
+    records = []
+    while offset < len(data):
+        record = decode_record(view, offset)
+        if record is None:
+            logging.warning(f"Ignoring {len(data) - offset} bytes of a truncated record at the end of {path}")
+            break
+        advertisement, offset = record
+        records.append(advertisement)
+    return records
+
+
+def decode_record(view, offset):
+    """(Advertisement, offset of the next record), or None if the record is cut short."""
+    end = len(view)
+    if offset + RECORD.size > end:
+        return None
+    timestamp, address, rssi, name_length, uuid_count, entry_count = RECORD.unpack_from(view, offset)
+    offset += RECORD.size
+    if offset + name_length + 16 * uuid_count > end:
+        return None
+    local_name = bytes(view[offset:offset + name_length]).decode(errors='replace') or None
+    offset += name_length
+    service_uuids = [str(uuid.UUID(bytes=bytes(view[offset + 16 * i:offset + 16 * (i + 1)]))) for i in range(uuid_count)]
+    offset += 16 * uuid_count
+    manufacturer_data = {}
+    for _ in range(entry_count):
+        if offset + MANUFACTURER_ENTRY.size > end:
+            return None
+        company_id, length = MANUFACTURER_ENTRY.unpack_from(view, offset)
+        offset += MANUFACTURER_ENTRY.size
+        if offset + length > end:
+            return None
+        manufacturer_data[company_id] = bytes(view[offset:offset + length])
+        offset += length
+    address = ':'.join(f"{b:02X}" for b in address)
+    return Advertisement(timestamp, address, rssi, local_name, service_uuids, manufacturer_data), offset
+
+
+class CaptureWriter:
+    """
+    Appends advertisements to a capture file.
+
+    Each record is written with a single write() on a file opened for appending, so
+    the hub and isolated plugin workers can record into the same file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, 'xb') as f:
+                f.write(MAGIC)
+        except FileExistsError:
+            pass
+        self.file = open(path, 'ab', buffering=0)
+        self.count = 0
+
+
+    def write(self, device, advertisement_data) -> None:
+        try:
+            record = encode(time.time(), device.address, advertisement_data.rssi, advertisement_data.local_name,
+                            advertisement_data.service_uuids, advertisement_data.manufacturer_data)
+        except ValueError:
+            return  # Not a MAC address (only Linux addresses are recorded)
+        with self.lock:
+            self.file.write(record)
+            self.count += 1
+
+
+    def close(self) -> None:
+        with self.lock:
+            self.file.close()
+
+
+class ReplayDevice:
+    """Stands in for bleak's BLEDevice."""
+    def __init__(self, address, name):
+        self.address = address
+        self.name = name
+        self.details = None
+
+    def __repr__(self):
+        return f"{self.address}: {self.name}"
+
+
+class ReplayAdvertisementData:
+    """Stands in for bleak's AdvertisementData."""
+    def __init__(self, record):
+        self.local_name = record.local_name
+        self.manufacturer_data = record.manufacturer_data
+        self.service_uuids = record.service_uuids
+        self.service_data = {}
+        self.tx_power = None
+        self.rssi = record.rssi
+        self.platform_data = ()
+
+    def __repr__(self):
+        return (f"AdvertisementData(local_name={self.local_name!r}, manufacturer_data={self.manufacturer_data!r}, "
+                f"service_uuids={self.service_uuids!r}, rssi={self.rssi})")
+
+
+class ReplaySource:
+    """
+    The timeline of a capture file, shared by all replay scanners of the process.
+
+    Capture time runs `speed` times faster than real time from the first scanner start.
+    As with the radio, scanners only see what is "on air" while they are started. With
+    speed 0 there is no timeline: every scanner start replays the whole capture at once.
+    """
+
+    def __init__(self, path, speed=1.0):
+        self.records = read_capture(path)
+        self.speed = speed
+        first = self.records[0].timestamp if self.records else 0.0
+        self.offsets = [record.timestamp - first for record in self.records]
+        self.started = None
+        self.lock = threading.Lock()
+
+
+    def position(self) -> float:
+        """Seconds of capture time played so far."""
+        with self.lock:
+            if self.started is None:
+                self.started = time.monotonic()
+        return (time.monotonic() - self.started) * self.speed
+
+
+    @property
+    def duration(self) -> float:
+        return self.offsets[-1] if self.offsets else 0.0
+
+
+class ReplayScanner:
+    """
+    Drop-in for the parts of BleakScanner the hub uses (start/stop with a detection
+    callback, discover) that plays back a capture instead of using the radio.
+
+    Callbacks run on the caller's event loop in capture order; coroutine callbacks are
+    awaited, so a slow callback delays the following advertisements rather than piling
+    them up.
+    """
+
+    def __init__(self, source, detection_callback=None, **kwargs):
+        self.source = source
+        self.callbacks = [detection_callback] if detection_callback else []
+        self.task = None
+        self.seen = {}  # address -> (device, advertisement data), like BleakScanner.discovered_devices_and_advertisement_data
+
+
+    def register_detection_callback(self, callback) -> None:
+        self.callbacks.append(callback)
+
+
+    async def start(self) -> None:
+        if self.task is None or self.task.done():
+            self.seen = {}
+            self.task = asyncio.create_task(self.play())
+
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+
+    async def play(self) -> None:
+        source = self.source
+        index = 0 if not source.speed else bisect.bisect_left(source.offsets, source.position())
+        while index < len(source.records):
+            if source.speed:
+                wait = (source.offsets[index] - source.position()) / source.speed
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            record = source.records[index]
+            index += 1
+            device = ReplayDevice(record.address, record.local_name)
+            advertisement_data = ReplayAdvertisementData(record)
+            self.seen[record.address] = (device, advertisement_data)
+            for callback in self.callbacks:
+                result = callback(device, advertisement_data)
+                if inspect.isawaitable(result):
+                    await result
+            if not source.speed and index % 100 == 0:
+                await asyncio.sleep(0)  # Let the callbacks' tasks run
+
+
+    async def discover(self, timeout=5.0, return_adv=False, **kwargs):
+        await self.start()
+        if self.source.speed:
+            await asyncio.sleep(timeout)
+        else:
+            await asyncio.gather(self.task, return_exceptions=True)
+        await self.stop()
+        if return_adv:
+            return dict(self.seen)
+        return [device for device, _ in self.seen.values()]
+
+
+    @property
+    def discovered_devices(self) -> list:
+        return [device for device, _ in self.seen.values()]
+
+
+    @property
+    def discovered_devices_and_advertisement_data(self) -> dict:
+        return dict(self.seen)
+
+
+class RecordingScanner:
+    """Wraps a BleakScanner and writes every advertisement it reports to a CaptureWriter."""
+
+    def __init__(self, writer, detection_callback=None, **kwargs):
+        from bleak import BleakScanner
+        self.writer = writer
+        self.callbacks = [detection_callback] if detection_callback else []
+        self.scanner = BleakScanner(detection_callback=self.detected, **kwargs)
+
+
+    def register_detection_callback(self, callback) -> None:
+        self.callbacks.append(callback)
+
+
+    async def detected(self, device, advertisement_data):
+        # A coroutine function, so bleak runs it as a task and callbacks may be awaited here
+        self.writer.write(device, advertisement_data)
+        for callback in self.callbacks:
+            try:
+                result = callback(device, advertisement_data)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logging.error(f"BLE detection callback failed for {device.address}: {e}")
+
+
+    async def start(self) -> None:
+        await self.scanner.start()
+
+
+    async def stop(self) -> None:
+        await self.scanner.stop()
+
+
+    async def discover(self, timeout=5.0, return_adv=False, **kwargs):
+        await self.scanner.start()
+        await asyncio.sleep(timeout)
+        await self.scanner.stop()
+        results = self.scanner.discovered_devices_and_advertisement_data
+        if return_adv:
+            return results
+        return [device for device, _ in results.values()]
+
+
+    @property
+    def discovered_devices(self) -> list:
+        return self.scanner.discovered_devices
+
+
+    @property
+    def discovered_devices_and_advertisement_data(self) -> dict:
+        return self.scanner.discovered_devices_and_advertisement_data
+
+
+def benchmark(path, speed=0.0) -> dict:
+    """Replays a capture through the plugin scan filters and reports advertisements per second."""
+    from core.ble import matches_filter
+    from core.plugin_manifest import load_manifests
+
+    manifests = [manifest for manifest in load_manifests().values() if manifest.scan_filter_method != 'emulator']
+    matches = {manifest.name: 0 for manifest in manifests}
+    source = ReplaySource(path, speed=speed)
+
+    def callback(device, advertisement_data):
+        for manifest in manifests:
+            if matches_filter(manifest, advertisement_data):
+                matches[manifest.name] += 1
+
+    async def run():
+        scanner = ReplayScanner(source, detection_callback=callback)
+        start = time.perf_counter()
+        await scanner.discover(timeout=source.duration / speed if speed else 0)
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(run())
+    return {
+        'advertisements': len(source.records),
+        'devices': len({record.address for record in source.records}),
+        'capture_seconds': round(source.duration, 2),
+        'replay_seconds': round(elapsed, 3),
+        'per_second': round(len(source.records) / elapsed) if elapsed else 0,
+        'matches': matches,
+    }
+
+
+if __name__ == "__main__":
+    # python -m core.ble_capture <capture file> [speed], from the app directory; speed 0 = as fast as possible
+    logging.basicConfig(level=logging.INFO)
+    print(benchmark(sys.argv[1], float(sys.argv[2]) if len(sys.argv) > 2 else 0.0))
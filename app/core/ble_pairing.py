@@ -0,0 +1,210 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    from dbus_fast import BusType, Message, MessageType, Variant
+    from dbus_fast.aio import MessageBus
+    from dbus_fast.service import ServiceInterface, method
+except ImportError:
+    # Debian's python3-bleak (install.sh) ships with dbus-next, which dbus-fast forked
+    from dbus_next import BusType, Message, MessageType, Variant
+    from dbus_next.aio import MessageBus
+    from dbus_next.service import ServiceInterface, method
+
+from core import metrics
+from core.ble import simulator
+
+PAIRING_STATE_FILE = "log/logs/ble_pairing.json"
+AGENT_PATH = "/com/onio/hub/agent"
+AGENT_CAPABILITY = "KeyboardDisplay"
+PIN_CODE = "0000"  # Answers for devices that ask; Hue lights use Just Works
+PASSKEY = 123456
+
+PAIRING_RESULTS = metrics.counter('hub_ble_pairing', 'Pairing checks by where the answer came from', ['result'])
+
+
+class PairingError(Exception):
+    pass
+
+
+class Agent(ServiceInterface):
+    """BlueZ Agent1 that accepts every request, like `bluetoothctl` with `agent on`."""
+
+    def __init__(self):
+        super().__init__('org.bluez.Agent1')
+
+    @method()
+    def Release(self):
+        pass
+
+    @method()
+    def RequestPinCode(self, device: 'o') -> 's':
+        logging.info(f"Sending PIN code to {device}")
+        return PIN_CODE
+
+    @method()
+    def DisplayPinCode(self, device: 'o', pincode: 's'):
+        logging.info(f"PIN code for {device}: {pincode}")
+
+    @method()
+    def RequestPasskey(self, device: 'o') -> 'u':
+        logging.info(f"Sending passkey to {device}")
+        return PASSKEY
+
+    @method()
+    def DisplayPasskey(self, device: 'o', passkey: 'u', entered: 'q'):
+        logging.info(f"Passkey for {device}: {passkey:06d}")
+
+    @method()
+    def RequestConfirmation(self, device: 'o', passkey: 'u'):
+        pass
+
+    @method()
+    def RequestAuthorization(self, device: 'o'):
+        pass
+
+    @method()
+    def AuthorizeService(self, device: 'o', uuid: 's'):
+        pass
+
+    @method()
+    def Cancel(self):
+        logging.warning("BlueZ cancelled the pairing request")
+
+
+class PairingService:
+    """
+    Pairs and trusts BLE devices through BlueZ over D-Bus, without blocking the event loop.
+
+    Devices found paired and trusted are remembered in PAIRING_STATE_FILE, so after the
+    first run is_trusted() is a dictionary lookup and ensure_paired() does not touch
+    D-Bus. forget() drops a device whose bond was removed, e.g. when connecting fails.
+    """
+
+    def __init__(self, path=PAIRING_STATE_FILE, bus_type=BusType.SYSTEM):
+        self.path = path
+        self.bus_type = bus_type
+        self.lock = threading.Lock()
+        self.trusted = self.load()  # address -> time.time() when found paired and trusted
+
+
+    def load(self) -> dict:
+        try:
+            with open(self.path, 'r') as f:
+                return {address.upper(): checked for address, checked in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.error(f"Failed to read pairing state from {self.path}: {e}")
+            return {}
+
+
+    def save(self) -> None:
+        with self.lock:
+            state = dict(self.trusted)
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(state, f)
+            os.replace(self.path + '.tmp', self.path)
+        except OSError as e:
+            logging.error(f"Failed to write pairing state to {self.path}: {e}")
+
+
+    def is_trusted(self, address) -> bool:
+        return address.upper() in self.trusted
+
+
+    def forget(self, address) -> None:
+        with self.lock:
+            removed = self.trusted.pop(address.upper(), None)
+        if removed is not None:
+            self.save()
+
+
+    async def ensure_paired(self, address, retries=3, delay=5, timeout=30) -> bool:
+        """Pairs and trusts the device unless it is known to be. Retries `retries` times, `delay` seconds apart."""
+        address = address.upper()
+        if self.is_trusted(address) or simulator() is not None:
+            PAIRING_RESULTS.labels('cached').inc()
+            return True
+        for attempt in range(1, retries + 1):
+            logging.info(f"Pairing attempt {attempt} for {address}")
+            try:
+                await asyncio.wait_for(self.pair_and_trust(address), timeout)
+                with self.lock:
+                    self.trusted[address] = time.time()
+                self.save()
+                PAIRING_RESULTS.labels('paired').inc()
+                return True
+            except asyncio.TimeoutError:
+                logging.error(f"Timeout occurred while pairing with {address}")
+            except Exception as e:
+                logging.error(f"Pairing with {address} failed: {e}")
+            if attempt < retries:
+                logging.warning(f"Attempt {attempt} failed. Retrying in {delay} seconds...")
+                await asyncio.sleep(delay)
+        PAIRING_RESULTS.labels('failed').inc()
+        logging.error(f"All {retries} pairing attempts failed for {address}")
+        return False
+
+
+    async def pair_and_trust(self, address) -> None:
+        bus = await MessageBus(bus_type=self.bus_type).connect()
+        try:
+            path, properties = await self.find_device(bus, address)
+            if not properties.get('Paired', Variant('b', False)).value:
+                await self.pair(bus, path)
+                logging.info(f"Successfully paired with {address}")
+            else:
+                logging.info(f"Device {address} is already paired.")
+            if not properties.get('Trusted', Variant('b', False)).value:
+                await call(bus, path, 'org.freedesktop.DBus.Properties', 'Set', 'ssv',
+                           ['org.bluez.Device1', 'Trusted', Variant('b', True)])
+                logging.info(f"Successfully trusted {address}")
+        finally:
+            bus.disconnect()
+
+
+    async def find_device(self, bus, address):
+        """BlueZ object path and Device1 properties of the device, which must have been discovered."""
+        reply = await call(bus, '/', 'org.freedesktop.DBus.ObjectManager', 'GetManagedObjects')
+        for path, interfaces in reply.body[0].items():
+            device = interfaces.get('org.bluez.Device1')
+            if device and device['Address'].value.upper() == address:
+                return path, device
+        raise PairingError(f"Device {address} not found")
+
+
+    async def pair(self, bus, path) -> None:
+        agent = Agent()
+        bus.export(AGENT_PATH, agent)
+        await call(bus, '/org/bluez', 'org.bluez.AgentManager1', 'RegisterAgent', 'os', [AGENT_PATH, AGENT_CAPABILITY])
+        try:
+            await call(bus, '/org/bluez', 'org.bluez.AgentManager1', 'RequestDefaultAgent', 'o', [AGENT_PATH])
+            try:
+                await call(bus, path, 'org.bluez.Device1', 'Pair')
+            except PairingError as e:
+                if 'AlreadyExists' not in str(e):
+                    raise
+        finally:
+            try:
+                await call(bus, '/org/bluez', 'org.bluez.AgentManager1', 'UnregisterAgent', 'o', [AGENT_PATH])
+            except PairingError:
+                pass
+            bus.unexport(AGENT_PATH, agent)
+
+
+async def call(bus, path, interface, member, signature='', body=()):
+    reply = await bus.call(Message(destination='org.bluez', path=path, interface=interface, member=member,
+                                   signature=signature, body=list(body)))
+    if reply.message_type == MessageType.ERROR:
+        raise PairingError(f"{reply.error_name}: {reply.body[0] if reply.body else ''}")
+    return reply
+
+
+PAIRING = PairingService()
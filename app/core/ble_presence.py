@@ -0,0 +1,146 @@
+import inspect
+import threading
+import time
+
+from core import metrics
+
+PRESENT_DEVICES = metrics.gauge('hub_ble_present_devices', 'BLE devices seen within the presence TTL')
+
+RSSI_SMOOTHING = 0.3  # weight of the newest RSSI sample
+RATE_SMOOTHING = 0.2  # weight of the newest advertisement interval
+
+
+class Presence:
+    """What the hub knows about one advertising device."""
+    __slots__ = ('address', 'name', 'device', 'advertisement_data', 'first_seen', 'last_seen', 'count', 'rssi',
+                 'interval')
+
+    def __init__(self, address, now):
+        self.address = address
+        self.name = None
+        self.device = None  # Latest BLEDevice and AdvertisementData as reported by the scanner
+        self.advertisement_data = None
+        self.first_seen = now  # time.time()
+        self.last_seen = now
+        self.count = 0
+        self.rssi = None  # Exponentially smoothed
+        self.interval = None  # Smoothed seconds between advertisements
+
+
+    @property
+    def rate(self) -> float:
+        """Advertisements per second."""
+        return 1.0 / self.interval if self.interval else 0.0
+
+
+    def to_dict(self) -> dict:
+        return {
+            'address': self.address,
+            'name': self.name,
+            'rssi': round(self.rssi, 1) if self.rssi is not None else None,
+            'rate': round(self.rate, 2),
+            'count': self.count,
+            'first_seen': self.first_seen,
+            'last_seen': self.last_seen,
+        }
+
+
+class PresenceCache:
+    """
+    Devices seen by any scanner of the process, expiring `ttl` seconds after their last advertisement.
+
+    observe() is called for every advertisement: continuous scanners like onio_ble's
+    keep it current between the hub's own scans. Queries only return devices seen
+    within the TTL (or a tighter max_age), so stale entries never leak out even
+    between expire() runs.
+    """
+
+    def __init__(self, ttl=300.0):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}  # address -> Presence
+        self.last_observed = 0.0
+        PRESENT_DEVICES.set_function(lambda: len(self.devices()))
+
+
+    def observe(self, device, advertisement_data, now=None) -> None:
+        now = time.time() if now is None else now
+        with self.lock:
+            entry = self.entries.get(device.address)
+            if entry is None:
+                entry = self.entries[device.address] = Presence(device.address, now)
+            elif entry.count:
+                gap = now - entry.last_seen
+                if gap > 0:
+                    entry.interval = gap if entry.interval is None else \
+                        entry.interval + RATE_SMOOTHING * (gap - entry.interval)
+            rssi = getattr(advertisement_data, 'rssi', None)
+            if rssi is not None:
+                entry.rssi = rssi if entry.rssi is None else entry.rssi + RSSI_SMOOTHING * (rssi - entry.rssi)
+            entry.name = getattr(advertisement_data, 'local_name', None) or device.name or entry.name
+            entry.device = device
+            entry.advertisement_data = advertisement_data
+            entry.last_seen = now
+            entry.count += 1
+            self.last_observed = now
+
+
+    def detection_callback(self, callback=None):
+        """A scanner detection callback that feeds the cache and then calls callback, if any."""
+        if inspect.iscoroutinefunction(callback):
+            # Scanners check for coroutine functions to decide whether to schedule the callback
+            async def detected(device, advertisement_data):
+                self.observe(device, advertisement_data)
+                await callback(device, advertisement_data)
+        else:
+            def detected(device, advertisement_data):
+                self.observe(device, advertisement_data)
+                if callback is not None:
+                    return callback(device, advertisement_data)
+        return detected
+
+
+    def get(self, address, max_age=None):
+        """The Presence of a device seen within max_age (default: the TTL), or None."""
+        max_age = self.ttl if max_age is None else min(max_age, self.ttl)
+        with self.lock:
+            entry = self.entries.get(address)
+        if entry is None or time.time() - entry.last_seen > max_age:
+            return None
+        return entry
+
+
+    def devices(self, max_age=None, min_rssi=None, predicate=None) -> list:
+        """Present devices, strongest first. predicate receives (device, advertisement_data)."""
+        max_age = self.ttl if max_age is None else min(max_age, self.ttl)
+        cutoff = time.time() - max_age
+        with self.lock:
+            entries = [entry for entry in self.entries.values() if entry.last_seen >= cutoff]
+        if min_rssi is not None:
+            entries = [entry for entry in entries if entry.rssi is not None and entry.rssi >= min_rssi]
+        if predicate is not None:
+            entries = [entry for entry in entries if predicate(entry.device, entry.advertisement_data)]
+        return sorted(entries, key=lambda entry: -(entry.rssi if entry.rssi is not None else -999))
+
+
+    def is_fresh(self, max_age) -> bool:
+        """Whether any scanner reported an advertisement in the last max_age seconds."""
+        return time.time() - self.last_observed <= max_age
+
+
+    def expire(self) -> int:
+        """Drops devices not seen within the TTL. Returns how many were dropped."""
+        cutoff = time.time() - self.ttl
+        with self.lock:
+            stale = [address for address, entry in self.entries.items() if entry.last_seen < cutoff]
+            for address in stale:
+                del self.entries[address]
+        return len(stale)
+
+
+    def snapshot(self, max_age=None) -> list:
+        return [entry.to_dict() for entry in self.devices(max_age=max_age)]
+
+
+# Shared by every scanner of the process, see core.ble.create_scanner
+PRESENCE = PresenceCache()
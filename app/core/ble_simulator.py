@@ -0,0 +1,362 @@
+import asyncio
+import inspect
+import logging
+import random
+import sys
+import threading
+import time
+import yaml
+from bleak.exc import BleakError
+
+from core.ble_capture import Advertisement, ReplayDevice, ReplayAdvertisementData
+
+DEVICE_DEFAULTS = {
+    'advertising_interval': 1.0,
+    'rssi': -65,
+    'connect_latency': [0.3, 1.2],
+    'connect_failure_rate': 0.0,
+    'read_failure_rate': 0.0,
+    'write_failure_rate': 0.0,
+    'disconnect_rate': 0.0,
+}
+OPERATION_LATENCY = 0.02  # seconds per GATT read or write
+
+
+class SimulatedCharacteristic:
+    """Stands in for bleak's BleakGATTCharacteristic."""
+    def __init__(self, uuid, info):
+        self.uuid = str(uuid).lower()
+        self.description = info.get('description', self.uuid)
+        self.value = bytearray.fromhex(info.get('value', ""))
+        notify = info.get('notify') or {}
+        self.notify_interval = float(notify.get('interval', 0))
+        self.notify_values = [bytearray.fromhex(value) for value in notify.get('values', [])]
+        self.properties = ['read', 'write'] + (['notify'] if self.notify_values else [])
+
+
+class SimulatedService:
+    def __init__(self, uuid, characteristics):
+        self.uuid = uuid
+        self.characteristics = characteristics
+
+
+class VirtualDevice:
+    def __init__(self, info, defaults):
+        settings = {**DEVICE_DEFAULTS, **defaults, **info}
+        self.address = str(settings['address']).upper()
+        self.name = settings.get('name')
+        self.service_uuids = [str(uuid).lower() for uuid in settings.get('service_uuids', [])]
+        self.manufacturer_data = [
+            (int(company_id), [bytes.fromhex(value) for value in values])
+            for company_id, values in (settings.get('manufacturer_data') or {}).items()
+        ]
+        self.advertising_interval = float(settings['advertising_interval'])
+        self.rssi = int(settings['rssi'])
+        latency = settings['connect_latency']
+        self.connect_latency = (float(latency[0]), float(latency[1])) if isinstance(latency, list) else (float(latency),) * 2
+        self.connect_failure_rate = float(settings['connect_failure_rate'])
+        self.read_failure_rate = float(settings['read_failure_rate'])
+        self.write_failure_rate = float(settings['write_failure_rate'])
+        self.disconnect_rate = float(settings['disconnect_rate'])
+        self.characteristics = {
+            char.uuid: char for char in
+            (SimulatedCharacteristic(uuid, value or {}) for uuid, value in (settings.get('characteristics') or {}).items())
+        }
+        self.advertisement_count = 0
+
+
+    def advertisement(self) -> Advertisement:
+        """Next advertisement, cycling through the configured manufacturer data payloads."""
+        index = self.advertisement_count
+        self.advertisement_count += 1
+        manufacturer_data = {company_id: values[index % len(values)] for company_id, values in self.manufacturer_data if values}
+        rssi = self.rssi + random.randint(-3, 3)
+        return Advertisement(time.time(), self.address, rssi, self.name, self.service_uuids, manufacturer_data)
+
+
+class SimulatedBLE:
+    """
+    A BLE adapter with virtual devices, for running the hub and the GATT plugins without a radio.
+
+    Devices advertise at their interval, accept connections after a random latency,
+    and fail connects, reads and writes at configurable rates. Characteristics keep
+    written values, and characteristics with a notify stream push their values to
+    subscribers. The adapter refuses connections beyond max_connections, like a
+    real controller. stats() counts every operation, for benchmarks of connection
+    scheduling and retries.
+    """
+
+    def __init__(self, devices=(), defaults=None, max_connections=5):
+        self.devices = {device.address: device for device in (VirtualDevice(info, defaults or {}) for info in devices)}
+        self.max_connections = max_connections
+        self.lock = threading.Lock()
+        self.connected = set()  # SimulatedClient
+        self.counters = {name: 0 for name in ('connects', 'connect_failures', 'refused', 'disconnects', 'dropped',
+                                              'reads', 'writes', 'failures', 'notifications')}
+        self.peak_connections = 0
+
+
+    @classmethod
+    def from_file(cls, path) -> 'SimulatedBLE':
+        with open(path, 'r') as f:
+            config = yaml.safe_load(f) or {}
+        adapter = config.get('adapter') or {}
+        return cls(config.get('devices') or [], config.get('defaults') or {}, adapter.get('max_connections', 5))
+
+
+    def count(self, name, amount=1) -> None:
+        with self.lock:
+            self.counters[name] += amount
+
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {**self.counters, 'connected': len(self.connected), 'peak_connections': self.peak_connections}
+
+
+    def attach(self, client) -> None:
+        with self.lock:
+            if len(self.connected) >= self.max_connections:
+                self.counters['refused'] += 1
+                raise BleakError(f"Simulated adapter: connection limit of {self.max_connections} reached")
+            self.connected.add(client)
+            self.counters['connects'] += 1
+            self.peak_connections = max(self.peak_connections, len(self.connected))
+
+
+    def detach(self, client) -> None:
+        with self.lock:
+            if client in self.connected:
+                self.connected.discard(client)
+                self.counters['disconnects'] += 1
+
+
+    def scanner(self, detection_callback=None, **kwargs) -> 'SimulatedScanner':
+        return SimulatedScanner(self, detection_callback)
+
+
+    def client(self, address, **kwargs) -> 'SimulatedClient':
+        return SimulatedClient(self, address, **kwargs)
+
+
+class SimulatedScanner:
+    """BleakScanner stand-in: every virtual device advertises at its interval while the scanner runs."""
+
+    def __init__(self, adapter, detection_callback=None):
+        self.adapter = adapter
+        self.callbacks = [detection_callback] if detection_callback else []
+        self.tasks = []
+        self.seen = {}
+
+
+    def register_detection_callback(self, callback) -> None:
+        self.callbacks.append(callback)
+
+
+    async def start(self) -> None:
+        if not self.tasks:
+            self.seen = {}
+            self.tasks = [asyncio.create_task(self.advertise(device)) for device in self.adapter.devices.values()]
+
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+
+    async def advertise(self, device) -> None:
+        # Devices are not in sync with the scan start
+        await asyncio.sleep(random.uniform(0, device.advertising_interval))
+        while True:
+            record = device.advertisement()
+            ble_device = ReplayDevice(record.address, record.local_name)
+            advertisement_data = ReplayAdvertisementData(record)
+            self.seen[record.address] = (ble_device, advertisement_data)
+            for callback in self.callbacks:
+                result = callback(ble_device, advertisement_data)
+                if inspect.isawaitable(result):
+                    await result
+            await asyncio.sleep(device.advertising_interval)
+
+
+    async def discover(self, timeout=5.0, return_adv=False, **kwargs):
+        await self.start()
+        await asyncio.sleep(timeout)
+        await self.stop()
+        if return_adv:
+            return dict(self.seen)
+        return [device for device, _ in self.seen.values()]
+
+
+    @property
+    def discovered_devices(self) -> list:
+        return [device for device, _ in self.seen.values()]
+
+
+    @property
+    def discovered_devices_and_advertisement_data(self) -> dict:
+        return dict(self.seen)
+
+
+class SimulatedClient:
+    """BleakClient stand-in for one virtual device."""
+
+    def __init__(self, adapter, address, disconnected_callback=None, timeout=10.0, **kwargs):
+        self.adapter = adapter
+        self.address = str(address).upper()
+        self.disconnected_callback = disconnected_callback
+        self.timeout = timeout
+        self.is_connected = False
+        self.notify_tasks = {}
+
+
+    @property
+    def device(self) -> VirtualDevice:
+        device = self.adapter.devices.get(self.address)
+        if device is None:
+            raise BleakError(f"Device with address {self.address} was not found.")
+        return device
+
+
+    @property
+    def services(self) -> list:
+        device = self.device
+        uuid = device.service_uuids[0] if device.service_uuids else "simulated"
+        return [SimulatedService(uuid, list(device.characteristics.values()))]
+
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.disconnect()
+
+
+    async def connect(self, **kwargs) -> bool:
+        if self.is_connected:
+            return True
+        device = self.device
+        latency = random.uniform(*device.connect_latency)
+        if latency > self.timeout:
+            await asyncio.sleep(self.timeout)
+            self.adapter.count('connect_failures')
+            raise asyncio.TimeoutError()
+        await asyncio.sleep(latency)
+        if random.random() < device.connect_failure_rate:
+            self.adapter.count('connect_failures')
+            raise BleakError(f"Simulated connection failure to {self.address}")
+        self.adapter.attach(self)
+        self.is_connected = True
+        return True
+
+
+    async def disconnect(self) -> bool:
+        for task in self.notify_tasks.values():
+            task.cancel()
+        self.notify_tasks = {}
+        if self.is_connected:
+            self.is_connected = False
+            self.adapter.detach(self)
+        return True
+
+
+    async def operation(self, failure_rate) -> None:
+        if not self.is_connected:
+            raise BleakError(f"Not connected to {self.address}")
+        await asyncio.sleep(OPERATION_LATENCY)
+        if random.random() < self.device.disconnect_rate:
+            # The link dropped under us
+            self.adapter.count('dropped')
+            await self.disconnect()
+            if self.disconnected_callback:
+                self.disconnected_callback(self)
+            raise BleakError(f"Simulated disconnect from {self.address}")
+        if random.random() < failure_rate:
+            self.adapter.count('failures')
+            raise BleakError(f"Simulated GATT failure on {self.address}")
+
+
+    def characteristic(self, uuid) -> SimulatedCharacteristic:
+        char = self.device.characteristics.get(str(getattr(uuid, 'uuid', uuid)).lower())
+        if char is None:
+            raise BleakError(f"Characteristic {uuid} was not found!")
+        return char
+
+
+    async def read_gatt_char(self, uuid, **kwargs) -> bytearray:
+        char = self.characteristic(uuid)
+        await self.operation(self.device.read_failure_rate)
+        self.adapter.count('reads')
+        return bytearray(char.value)
+
+
+    async def write_gatt_char(self, uuid, data, response=False) -> None:
+        char = self.characteristic(uuid)
+        await self.operation(self.device.write_failure_rate)
+        self.adapter.count('writes')
+        char.value = bytearray(data)
+
+
+    async def start_notify(self, uuid, callback, **kwargs) -> None:
+        char = self.characteristic(uuid)
+        await self.operation(self.device.write_failure_rate)
+        if char.uuid not in self.notify_tasks and char.notify_values:
+            self.notify_tasks[char.uuid] = asyncio.create_task(self.notify(char, callback))
+
+
+    async def stop_notify(self, uuid) -> None:
+        task = self.notify_tasks.pop(self.characteristic(uuid).uuid, None)
+        if task:
+            task.cancel()
+
+
+    async def notify(self, char, callback) -> None:
+        index = 0
+        while self.is_connected:
+            await asyncio.sleep(char.notify_interval or 1.0)
+            char.value = bytearray(char.notify_values[index % len(char.notify_values)])
+            index += 1
+            self.adapter.count('notifications')
+            result = callback(char, bytearray(char.value))
+            if inspect.isawaitable(result):
+                await result
+
+
+def benchmark(path, concurrency=1, rounds=3) -> dict:
+    """Connects to every virtual GATT device and reads all its characteristics, `concurrency` devices at a time."""
+    adapter = SimulatedBLE.from_file(path)
+    devices = [device for device in adapter.devices.values() if device.characteristics]
+    failed = 0
+
+    async def read_device(device, slots):
+        nonlocal failed
+        async with slots:
+            try:
+                async with adapter.client(device.address) as client:
+                    for uuid in device.characteristics:
+                        await client.read_gatt_char(uuid)
+            except (BleakError, asyncio.TimeoutError):
+                failed += 1
+
+    async def run():
+        slots = asyncio.Semaphore(concurrency)
+        for _ in range(rounds):
+            await asyncio.gather(*(read_device(device, slots) for device in devices))
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    stats = adapter.stats()
+    return {'devices': len(devices), 'rounds': rounds, 'concurrency': concurrency, 'seconds': round(elapsed, 2),
+            'failed_sessions': failed, 'reads_per_second': round(stats['reads'] / elapsed, 1), **stats}
+
+
+if __name__ == "__main__":
+    # python -m core.ble_simulator [simulation file] [concurrency], from the app directory
+    logging.basicConfig(level=logging.INFO)
+    print(benchmark(sys.argv[1] if len(sys.argv) > 1 else "ble_simulation.yaml",
+                    int(sys.argv[2]) if len(sys.argv) > 2 else 1))
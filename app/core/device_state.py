@@ -0,0 +1,89 @@
+import time
+import threading
+from numbers import Number
+
+from core import metrics
+
+STATE_UPDATES = metrics.counter('hub_device_state_updates', 'Device readings offered to the state store', ['result'])
+
+
+class DeviceStateStore:
+    """
+    Latest reading per device, and the reading last passed downstream.
+
+    update() stores a reading and tells whether it is worth emitting: the first reading
+    of a device, a change in any compared field, or `heartbeat` seconds since the last
+    emission (0 disables the heartbeat). Numeric fields listed in `deadbands` count as
+    changed only when they moved by more than the deadband since the last emitted value;
+    other fields on any change. Fields in `ignore` (signal strength, raw bytes) are
+    stored but never compared, so a reading that is an event in itself (a button
+    press repeats the previous state and differs only in its frame counter) is
+    passed with event=True and always emitted.
+    """
+
+    def __init__(self, deadbands=None, heartbeat=60.0, ignore=('rssi', 'raw_data')):
+        self.deadbands = dict(deadbands or {})
+        self.heartbeat = heartbeat
+        self.ignore = frozenset(ignore)
+        self.lock = threading.Lock()
+        self.latest = {}   # address -> (data, time.monotonic())
+        self.emitted = {}  # address -> (data, time.monotonic())
+
+
+    def update(self, address, data, now=None, event=False):
+        """
+        Stores data for address. Returns the changed fields (empty on a heartbeat or an
+        unchanged event) if data should be emitted, else None.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.latest[address] = (data, now)
+            previous = self.emitted.get(address)
+            if previous is None:
+                changed = [field for field in data if field not in self.ignore]
+            else:
+                changed = self.changed_fields(previous[0], data)
+                if not changed and not event and not (self.heartbeat and now - previous[1] >= self.heartbeat):
+                    STATE_UPDATES.labels("suppressed").inc()
+                    return None
+            self.emitted[address] = (data, now)
+        STATE_UPDATES.labels("emitted").inc()
+        return changed
+
+
+    def changed_fields(self, old, new) -> list:
+        changed = []
+        for field, value in new.items():
+            if field in self.ignore:
+                continue
+            if field not in old:
+                changed.append(field)
+                continue
+            deadband = self.deadbands.get(field)
+            old_value = old[field]
+            if deadband is not None and isinstance(value, Number) and isinstance(old_value, Number):
+                if abs(value - old_value) > deadband:
+                    changed.append(field)
+            elif value != old_value:
+                changed.append(field)
+        return changed
+
+
+    def get(self, address):
+        """Latest data of a device, or None."""
+        with self.lock:
+            entry = self.latest.get(address)
+        return entry[0] if entry else None
+
+
+    def age(self, address):
+        """Seconds since the latest data of a device, or None."""
+        with self.lock:
+            entry = self.latest.get(address)
+        return time.monotonic() - entry[1] if entry else None
+
+
+    def forget(self, address) -> None:
+        with self.lock:
+            self.latest.pop(address, None)
+            self.emitted.pop(address, None)
@@ -1,5 +1,7 @@
 
 from core.backend import ApiBackend
+from core import metrics
+from core import plugin_stats
 import logging
 import json
 import asyncio
@@ -7,6 +9,9 @@ import time
 import threading
 from datetime import datetime
 
+FLOW_NODE_EXECUTIONS = metrics.counter('hub_flow_node_executions', 'Flow node executions', ['node'])
+FLOW_EXECUTION_SECONDS = metrics.histogram('hub_flow_execution_seconds', 'Time to run a flow triggered by device data')
+
 
 class Flow():
     def __init__(self):
@@ -126,6 +131,7 @@ class Flow():
             logging.error("Node is None, skipping execution")
             return
 
+        FLOW_NODE_EXECUTIONS.labels(node.node_name).inc()
         if node.function is None:
             logging.error(f"Node {node.node_name} has no function. passing data and resolving children")
         else:
@@ -156,12 +162,14 @@ class Flow():
     
 
     async def receive_device_data_to_flow(self, device_id, data) -> None:
+        plugin_stats.record_event()
         logging.info(f"################################################")
         for node in self.flow_table:
             if node.node_data.get('mac_address') == device_id:
                 node.node_data.update(data)
                 logging.info(f"Received data for node: {node.node_name} - {data}")
-                await self.execute_node(node)
+                with FLOW_EXECUTION_SECONDS.time():
+                    await self.execute_node(node)
                 return
         return
     
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+
+from core import metrics
+from core.ble import ConnectionSlots, connection_slots
+
+SYNC_INTERVAL = 5.0  # seconds between checks of the device dict for added or removed devices
+STAGGER_WINDOW = 30.0  # default seconds over which first polls are spread; the slots pace them too
+
+GATT_READ_SECONDS = metrics.histogram('hub_gatt_read_seconds', 'Duration of successful GATT polls, connect included',
+                                      ['plugin'])
+GATT_READ_LATENCY = metrics.gauge('hub_gatt_read_latency_seconds', 'Duration of the last successful GATT poll per device',
+                                  ['plugin', 'address'])
+GATT_READ_FAILURES = metrics.counter('hub_gatt_read_failures', 'GATT poll attempts that failed', ['plugin'])
+GATT_SLOTS_IN_USE = metrics.gauge('hub_gatt_slots_in_use', 'GATT connections held by the poller', ['plugin'])
+
+
+class DevicePoll:
+    """Schedule and latency of one polled device."""
+    __slots__ = ('device', 'task', 'due', 'attempts', 'successes', 'failures', 'latency', 'last_success', 'last_error')
+
+    def __init__(self, device):
+        self.device = device
+        self.task = None
+        self.due = 0.0  # time.monotonic() of the next poll
+        self.attempts = 0
+        self.successes = 0
+        self.failures = 0
+        self.latency = None  # seconds, smoothed over successful polls
+        self.last_success = None  # time.time()
+        self.last_error = None
+
+
+    def to_dict(self) -> dict:
+        return {
+            'attempts': self.attempts,
+            'successes': self.successes,
+            'failures': self.failures,
+            'latency': round(self.latency, 3) if self.latency is not None else None,
+            'last_success': self.last_success,
+            'last_error': self.last_error,
+        }
+
+
+class GattPoller:
+    """
+    Polls GATT devices on one event loop, at most `concurrency` connections at a time.
+
+    Connections also take a slot from `connections`, by default the budget shared with
+    the other plugins of the process (core.ble.connection_slots()). Each device runs its
+    own schedule: first polls are staggered over a short window so a cycle never starts
+    with every device connecting at once, and later polls keep that cadence. A poll that
+    fails is retried with exponential backoff and jitter, without holding a connection
+    slot while it waits. read(device) is awaited for each poll and returns the data or
+    raises; on_data(device, data) runs in a thread, so it may block on the backend.
+    """
+
+    def __init__(self, name, read, on_data, interval=900.0, concurrency=3, retries=3, backoff=2.0, timeout=30.0,
+                 stagger=None, connections=None):
+        self.name = name
+        self.read = read
+        self.on_data = on_data
+        self.interval = interval
+        self.stagger = min(interval, STAGGER_WINDOW) if stagger is None else stagger  # seconds over which first polls are spread
+        self.connections = connections
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.devices = dict  # returns the plugin's current address -> device dict
+        self.polls = {}  # address -> DevicePoll
+        self.loop = None
+        self.thread = None
+        self.stop_event = None
+        self.slots = None
+        self.started = threading.Event()
+        self.in_use = 0
+        GATT_SLOTS_IN_USE.labels(name).set_function(lambda: self.in_use)
+
+
+    def start(self, devices) -> None:
+        """
+        Polls the devices in the dict (address -> device) returned by devices() until stop().
+        Devices the plugin adds or removes later are picked up within SYNC_INTERVAL.
+        """
+        self.devices = devices
+        if self.thread is None or not self.thread.is_alive():
+            self.started.clear()
+            self.thread = threading.Thread(target=lambda: asyncio.run(self.run()), name=f"{self.name}-gatt-poller",
+                                           daemon=True)
+            self.thread.start()
+            self.started.wait(timeout=5.0)
+
+
+    def stop(self, timeout=5.0) -> None:
+        loop = self.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self.stop_event.set)
+            except RuntimeError:
+                pass  # Loop already closed
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout=timeout)
+
+
+    async def run(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        self.slots = asyncio.Semaphore(self.concurrency)
+        if self.connections is None:
+            self.connections = connection_slots()
+        self.started.set()
+        try:
+            while not self.stop_event.is_set():
+                self.sync(dict(self.devices()))
+                try:
+                    await asyncio.wait_for(self.stop_event.wait(), SYNC_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            tasks = [poll.task for poll in self.polls.values() if poll.task]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.polls = {}
+            self.loop = None
+
+
+    def sync(self, devices) -> None:
+        for address in list(self.polls):
+            if address in devices:
+                # A rescan creates new Device objects; the schedule stays
+                self.polls[address].device = devices[address]
+            else:
+                self.polls.pop(address).task.cancel()
+        new = [address for address in devices if address not in self.polls]
+        now = time.monotonic()
+        for index, address in enumerate(new):
+            poll = self.polls[address] = DevicePoll(devices[address])
+            # Spread new devices evenly over the stagger window
+            poll.due = now + self.stagger * index / len(new)
+            poll.task = asyncio.create_task(self.poll_device(address, poll))
+
+
+    async def poll_device(self, address, poll) -> None:
+        while True:
+            await asyncio.sleep(max(0.0, poll.due - time.monotonic()))
+            data = await self.poll_once(address, poll)
+            if data:
+                try:
+                    await asyncio.to_thread(self.on_data, poll.device, data)
+                except Exception as e:
+                    logging.error(f"{self.name}: handling data from {address} failed: {e}")
+            poll.due += self.interval
+            if poll.due < time.monotonic():
+                # Fell behind (slow retries or a sleeping host): poll again one interval from now
+                poll.due = time.monotonic() + self.interval
+
+
+    async def poll_once(self, address, poll):
+        """One poll with retries. Returns the data, or None once all attempts failed."""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = self.backoff * 2 ** (attempt - 1)
+                await asyncio.sleep(delay + random.uniform(0, delay / 2))
+            poll.attempts += 1
+            async with self.slots, self.connections:
+                self.in_use += 1
+                start = time.perf_counter()
+                try:
+                    data = await asyncio.wait_for(self.read(poll.device), self.timeout)
+                except Exception as e:
+                    poll.failures += 1
+                    poll.last_error = str(e) or e.__class__.__name__  # asyncio.TimeoutError has no message
+                    GATT_READ_FAILURES.labels(self.name).inc()
+                    logging.warning(f"{self.name}: poll of {address} failed (attempt {attempt + 1}): {poll.last_error}")
+                    continue
+                finally:
+                    self.in_use -= 1
+            elapsed = time.perf_counter() - start
+            poll.successes += 1
+            poll.last_success = time.time()
+            poll.latency = elapsed if poll.latency is None else poll.latency + 0.3 * (elapsed - poll.latency)
+            GATT_READ_SECONDS.labels(self.name).observe(elapsed)
+            GATT_READ_LATENCY.labels(self.name, address).set(elapsed)
+            return data
+        logging.error(f"{self.name}: giving up on {address} until its next poll")
+        return None
+
+
+    def stats(self) -> dict:
+        return {address: poll.to_dict() for address, poll in list(self.polls.items())}
+
+
+def benchmark(count=30, concurrency=5, failure_rate=0.1) -> dict:
+    """One polling cycle over `count` simulated Flower Care sensors: seconds until every device was read."""
+    from core.ble_simulator import SimulatedBLE
+    adapter = SimulatedBLE([{
+        'address': f"C4:7C:8D:6A:{index // 256:02X}:{index % 256:02X}",
+        'connect_failure_rate': failure_rate,
+        'characteristics': {'00001a01-0000-1000-8000-00805f9b34fb': {'value': "e80000a00f00001f8c0002000000000000"},
+                            '00001a02-0000-1000-8000-00805f9b34fb': {'value': "5c1f332e322e34"}},
+    } for index in range(count)], max_connections=concurrency)
+    done = threading.Event()
+    received = []
+
+    async def read(device):
+        async with adapter.client(device) as client:
+            for uuid in adapter.devices[device].characteristics:
+                await client.read_gatt_char(uuid)
+        return {'address': device}
+
+    def on_data(device, data):
+        received.append(device)
+        if len(received) == count:
+            done.set()
+
+    # Every device is due at once; the connection slots alone pace the cycle
+    poller = GattPoller("benchmark", read, on_data, interval=3600.0, concurrency=concurrency, backoff=0.2, stagger=0.0,
+                        connections=ConnectionSlots(concurrency))
+    start = time.perf_counter()
+    poller.start(lambda: {address: address for address in adapter.devices})
+    done.wait(timeout=600)
+    elapsed = time.perf_counter() - start
+    poller.stop()
+    return {'devices': count, 'concurrency': concurrency, 'seconds': round(elapsed, 2), 'read': len(set(received)),
+            **adapter.stats()}
+
+
+if __name__ == "__main__":
+    # python -m core.gatt_poller [devices] [concurrency], from the app directory
+    import sys
+    logging.basicConfig(level=logging.ERROR)
+    print(benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 30, int(sys.argv[2]) if len(sys.argv) > 2 else 5))
@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from core import metrics
+from core.ble import create_client, connection_limit, connection_slots
+
+POOL_CONNECTIONS = metrics.gauge('hub_gatt_pool_connections', 'Open connections in a GATT connection pool', ['pool'])
+POOL_REQUESTS = metrics.counter('hub_gatt_pool_requests', 'Operations run through a GATT connection pool',
+                                ['pool', 'connection'])
+POOL_CLOSED = metrics.counter('hub_gatt_pool_closed', 'Pooled connections closed', ['pool', 'reason'])
+POOL_OPERATION_SECONDS = metrics.histogram('hub_gatt_pool_operation_seconds',
+                                           'Duration of pooled operations, connect included', ['pool'])
+
+MAINTENANCE_INTERVAL = 5.0  # seconds between idle and health checks
+
+
+class PooledConnection:
+    __slots__ = ('address', 'client', 'lock', 'last_used', 'last_checked', 'uses')
+
+    def __init__(self, address, client):
+        self.address = address
+        self.client = client
+        self.lock = asyncio.Lock()  # One operation at a time per device
+        self.last_used = time.monotonic()
+        self.last_checked = self.last_used
+        self.uses = 0
+
+
+class ConnectionPool:
+    """
+    Keeps GATT connections to recently used devices open, so commands skip the connect.
+
+    run(address, operation) awaits operation(client) on a connected client, from any
+    event loop: the connections live on the pool's own loop thread, because a BLE
+    client belongs to the loop that connected it. At most `capacity` connections are
+    open, each holding a slot of the process-wide connection budget
+    (core.ble.connection_slots()); the least recently used idle one is closed to make
+    room, and idle ones are closed when other plugins wait for a slot. A connection that
+    dropped is reconnected and the operation retried once. Connections idle for
+    idle_timeout seconds are closed, and idle ones are checked every health_interval
+    seconds with health_check(client), if given.
+    """
+
+    def __init__(self, name, capacity=None, idle_timeout=120.0, connect_timeout=10.0, health_check=None,
+                 health_interval=30.0, connections=None):
+        self.name = name
+        self.capacity = capacity or connection_limit()
+        self.connections = connections or connection_slots()
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.health_check = health_check
+        self.health_interval = health_interval
+        self.entries = OrderedDict()  # address -> PooledConnection, least recently used first
+        self.loop = None
+        self.thread = None
+        self.changed = None  # asyncio.Condition, notified when a connection is released or closed
+        self.stop_event = None
+        self.start_lock = threading.Lock()
+        POOL_CONNECTIONS.labels(name).set_function(lambda: len(self.entries))
+
+
+    def start(self) -> None:
+        with self.start_lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            started = threading.Event()
+            self.thread = threading.Thread(target=lambda: asyncio.run(self.serve(started)),
+                                           name=f"{self.name}-gatt-pool", daemon=True)
+            self.thread.start()
+            started.wait(timeout=5.0)
+
+
+    def stop(self, timeout=5.0) -> None:
+        """Closes all connections and stops the pool thread. The next run() starts it again."""
+        loop = self.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self.stop_event.set)
+            except RuntimeError:
+                pass  # Loop already closed
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout=timeout)
+
+
+    async def serve(self, started) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.changed = asyncio.Condition()
+        self.stop_event = asyncio.Event()
+        started.set()
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    await asyncio.wait_for(self.stop_event.wait(), MAINTENANCE_INTERVAL)
+                except asyncio.TimeoutError:
+                    await self.maintain()
+        finally:
+            for entry in list(self.entries.values()):
+                await self.close(entry, 'stopped')
+            self.loop = None
+
+
+    async def run(self, address, operation):
+        """Result of operation(client) for the device at address. Errors of the operation are raised."""
+        self.start()
+        if asyncio.get_running_loop() is self.loop:
+            return await self.execute(address, operation)
+        future = asyncio.run_coroutine_threadsafe(self.execute(address, operation), self.loop)
+        return await asyncio.wrap_future(future)
+
+
+    async def execute(self, address, operation):
+        start = time.perf_counter()
+        for attempt in range(2):
+            entry = await self.acquire(address)
+            try:
+                async with entry.lock:
+                    if entry.client.is_connected:
+                        POOL_REQUESTS.labels(self.name, 'reused').inc()
+                    else:
+                        POOL_REQUESTS.labels(self.name, 'new' if not entry.uses else 'reconnected').inc()
+                        await asyncio.wait_for(entry.client.connect(), self.connect_timeout)
+                    try:
+                        result = await operation(entry.client)
+                    finally:
+                        entry.uses += 1
+                        entry.last_used = time.monotonic()
+                POOL_OPERATION_SECONDS.labels(self.name).observe(time.perf_counter() - start)
+                return result
+            except Exception as e:
+                if entry.client.is_connected or attempt:
+                    raise
+                # The link is gone: drop it and try once more on a fresh connection
+                logging.warning(f"{self.name}: connection to {address} lost ({str(e) or e.__class__.__name__}), reconnecting")
+                await self.close(entry, 'lost')
+            finally:
+                await self.notify()
+
+
+    async def acquire(self, address) -> PooledConnection:
+        while True:
+            entry = self.entries.get(address)
+            if entry is not None:
+                self.entries.move_to_end(address)
+                return entry
+            victim = next((entry for entry in self.entries.values() if not entry.lock.locked()), None)
+            if len(self.entries) < self.capacity:
+                if self.connections.try_acquire():
+                    break
+                if victim is None:
+                    # Other plugins hold the budget: wait for their slot
+                    await self.connections.acquire()
+                    break
+            if victim is not None:
+                await self.close(victim, 'evicted')
+                continue
+            # Every connection is busy: wait for one to be released
+            async with self.changed:
+                await self.changed.wait()
+        if address in self.entries:
+            # Opened by a concurrent acquire while we waited for the slot
+            self.connections.release()
+            self.entries.move_to_end(address)
+            return self.entries[address]
+        entry = self.entries[address] = PooledConnection(address, create_client(address))
+        return entry
+
+
+    async def close(self, entry, reason) -> None:
+        if self.entries.get(entry.address) is not entry:
+            return  # Closed already
+        del self.entries[entry.address]
+        self.connections.release()
+        POOL_CLOSED.labels(self.name, reason).inc()
+        try:
+            await entry.client.disconnect()
+        except Exception as e:
+            logging.debug(f"{self.name}: disconnecting {entry.address} failed: {e}")
+        await self.notify()
+
+
+    async def notify(self) -> None:
+        async with self.changed:
+            self.changed.notify_all()
+
+
+    async def maintain(self) -> None:
+        now = time.monotonic()
+        for entry in list(self.entries.values()):
+            if entry.lock.locked():
+                continue
+            if now - entry.last_used > self.idle_timeout:
+                await self.close(entry, 'idle')
+            elif self.connections.waiting():
+                await self.close(entry, 'yielded')
+            elif not entry.client.is_connected:
+                await self.close(entry, 'lost')
+            elif self.health_check is not None and now - entry.last_checked > self.health_interval:
+                entry.last_checked = now
+                try:
+                    async with entry.lock:
+                        await asyncio.wait_for(self.health_check(entry.client), self.connect_timeout)
+                except Exception as e:
+                    logging.warning(f"{self.name}: health check of {entry.address} failed: {str(e) or e.__class__.__name__}")
+                    await self.close(entry, 'unhealthy')
+
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {entry.address: {'uses': entry.uses, 'idle': round(now - entry.last_used, 1),
+                                'connected': entry.client.is_connected} for entry in list(self.entries.values())}
@@ -5,21 +5,42 @@ import threading
 import importlib
 import subprocess
 import os
+import sys
 import logging
 import asyncio
+import json
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from hashlib import md5
 from config.config import ConfigSettings
 from core.ble import BLEManager
+from core.ble_presence import PRESENCE
 from core.backend import ApiBackend
 from core.flow import Flow
+from core import metrics
+from core.import_profiler import ImportProfiler
+from core.network_state import NetworkState
+from core.plugin_manifest import load_manifests
+from core.remote_plugin import RemotePlugin, FlowRunner
+from core.plugin_stats import ACCOUNTING
+from core.system_monitor import HUB_STATUS_FILE
 from log.log import CloudLogger
 
+LOADED_PLUGINS = metrics.gauge('hub_plugins_loaded', 'Plugins currently loaded')
+STARTUP_SECONDS = metrics.gauge('hub_startup_seconds', 'Duration of each startup phase', ['phase'])
+SCAN_CACHE_MAX_AGE = 30  # seconds; a scan_devices command answers from the presence cache when it is this fresh
+
+
 class Hub:
-    def __init__(self, serial_no):
+    def __init__(self, serial_no, isolate_plugins=False, trace_memory=False):
         self.config = ConfigSettings()
         self.cloud_logger = CloudLogger()
         self.plugin_dir = "plugins"
         self.plugins = []
+        self.manifests = load_manifests()
+        self.pending_plugins = {}  # name -> manifest, imported on first matching device or flow node
+        self.pending_lock = threading.Lock()  # Guards pending_plugins and loading
+        self.loading = set()  # Names of plugins being imported right now
 
         self.serial = serial_no
         self.serial_hash = md5(self.serial.encode()).hexdigest() # Hash the serial number for security
@@ -27,8 +48,22 @@ class Hub:
         self.api = ApiBackend()
         self.ble = BLEManager()
         self.flow = Flow()
+        self.network = NetworkState()
+        # Run every plugin in its own worker process (see core/remote_plugin.py)
+        self.isolate_plugins = isolate_plugins
+        self.flow_runner = FlowRunner() if isolate_plugins else None
+        # Per-plugin CPU, thread, event, error and memory accounting
+        ACCOUNTING.install(trace_memory=trace_memory)
         
         self.command = ""
+        self.last_status = None
+        self.scan_lock = threading.Lock()
+        # self.plugins is replaced, never mutated, so threads iterating it keep a consistent list
+        self.plugins_lock = threading.Lock()
+        # BLE plugins start once the initial scan is done: no second radio scan next to it
+        self.initial_scan_done = threading.Event()
+        self.startup_timings = {}
+        LOADED_PLUGINS.set_function(lambda: len(self.plugins))
         
 
         # Load plugins
@@ -44,37 +79,77 @@ class Hub:
         # self.load_plugin("sonos") # Sonos plugin
         # self.load_plugin("flic") # Flic plugin (no work)
 
-    def startup(self):
-        self.get_plugins_from_file()
+    @contextmanager
+    def timed(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_timings[phase] = time.perf_counter() - start
+            STARTUP_SECONDS.labels(phase).set(round(self.startup_timings[phase], 3))
 
 
-        # Disable this to avoid unnecessary geolocation requests and costs.
-        # local_ap_list = self.wifi.scan_wifi_networks()
-        # if local_ap_list is not None:
-        #     if self.api.gapi_geolocation(local_ap_list):
-        #         logging.info("Successfully geolocated with Google API")
-        #     else:
-        #         logging.error("Failed to get location from Google API")
+    def startup(self, network_timeout=15):
+        start = time.perf_counter()
 
-            
-        if self.api.get_token(self.serial_hash): 
-            logging.info("Successfully retrieved token from server")
+        # Plugin imports are local work: run them while waiting for the network and the backend
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="PluginLoader") as executor:
+            plugins_loaded = executor.submit(self.load_plugins_timed)
+
+            with self.timed("network"):
+                self.network.start()
+                if not self.network.wait_for_connectivity(network_timeout):
+                    logging.warning(f"No network connection after {network_timeout} seconds, continuing startup")
+
+
+            # Disable this to avoid unnecessary geolocation requests and costs.
+            # local_ap_list = self.wifi.scan_wifi_networks()
+            # if local_ap_list is not None:
+            #     if self.api.gapi_geolocation(local_ap_list):
+            #         logging.info("Successfully geolocated with Google API")
+            #     else:
+            #         logging.error("Failed to get location from Google API")
 
-        if self.api.set_location(): 
-            logging.info("Successfully updated hub location")
+            with self.timed("token"):
+                if self.api.get_token(self.serial_hash): 
+                    logging.info("Successfully retrieved token from server")
 
-        if self.flow.set_flow(self.api.get_flow()):
-            logging.info("Successfully retrieved flow")
+            if self.api.set_location(): 
+                logging.info("Successfully updated hub location")
+
+            with self.timed("flow"):
+                if self.flow.set_flow(self.api.get_flow()):
+                    logging.info("Successfully retrieved flow")
+
+            plugins_loaded.result()
+
+        self.send_flow_to_workers()
+
+        self.load_plugins_for_flow()
+        self.startup_timings["total"] = time.perf_counter() - start
+        STARTUP_SECONDS.labels("total").set(round(self.startup_timings["total"], 3))
+        self.report_startup_timings()
 
         logging.info("Startup complete... Beginning main routine\n")
         self.cloud_logger.add_log_line("SYSTEM", "Startup complete... Beginning main routine")
         return True
+
+
+    def load_plugins_timed(self):
+        with self.timed("plugins"):
+            self.get_plugins_from_file()
+
+
+    def report_startup_timings(self):
+        breakdown = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.startup_timings.items())
+        logging.info(f"Startup timing: {breakdown}")
+        self.cloud_logger.add_log_line("SYSTEM", f"Startup timing: {breakdown}")
     
 
     def loop(self, auto_collect, period=5):
 
-        # Initial scan
-        self.scan_for_devices()
+        # Initial scan runs in the background so plugins start processing right away
+        threading.Thread(target=self.initial_scan, name="InitialScan", daemon=True).start()
         get_flow_delay = 0
 
         while True:
@@ -84,7 +159,7 @@ class Hub:
                     self.shutdown()
 
                 elif self.command == "scan_devices":
-                    self.scan_for_devices()
+                    self.scan_for_devices(max_age=SCAN_CACHE_MAX_AGE, load_pending=True)
 
 
                     if not self.api.post_scan_results(self.plugins):
@@ -106,22 +181,31 @@ class Hub:
 
                 elif self.command.startswith("unload_plugin"):
                     plugin_name = self.command.split(":")[1]
-                    for plugin in self.plugins:
-                        if plugin.__class__.__name__ == plugin_name:
-                            self.plugins.remove(plugin)
-                            logging.info("Plugin unloaded: " + plugin_name)
-                            break
+                    with self.pending_lock:
+                        self.pending_plugins.pop(plugin_name, None)
+                    self.remove_plugin(plugin_name)
+
+                elif self.command.startswith("reload_plugin"):
+                    plugin_name = self.command.split(":")[1]
+                    self.reload_plugin(plugin_name)
 
                 
                 self.command = ""
+                ACCOUNTING.update()
+                PRESENCE.expire()
+                self.write_status()
+                metrics.REGISTRY.write()
                 time.sleep(period)
-                self.command = self.api.ping_server(self.serial_hash, self.cloud_logger.format_logs_to_json())
+                self.command = self.api.ping_server(self.serial_hash, self.cloud_logger.format_logs_to_json(),
+                                                    ACCOUNTING.snapshot())
 
                 # Get flow every 50 cycles. This should be replaced by
                 # a command from the server whenever a new flow is activated
                 if get_flow_delay > 50:
                     if self.flow.set_flow(self.api.get_flow()):
                         logging.info("Successfully retrieved flow")
+                        self.send_flow_to_workers()
+                        self.load_plugins_for_flow()
                     get_flow_delay = 0
                 else:
                     get_flow_delay += 1
@@ -154,66 +238,257 @@ class Hub:
                 with open("plugins.txt", "a") as f:
                     f.write(plugin_name)
                     f.write("\n")
+        # The initial scan thread and the main loop may both ask for a deferred plugin
+        with self.pending_lock:
+            if plugin_name in self.loading or self.find_plugin(plugin_name) is not None:
+                return self.find_plugin(plugin_name)
+            self.pending_plugins.pop(plugin_name, None)
+            self.loading.add(plugin_name)
         try:
-            module = importlib.import_module(f"{self.plugin_dir}.{plugin_name}")
+            return self.import_plugin(plugin_name)
+        finally:
+            with self.pending_lock:
+                self.loading.discard(plugin_name)
+
+
+    def import_plugin(self, plugin_name):
+        if self.isolate_plugins:
+            return self.load_plugin_isolated(plugin_name)
+        try:
+            with ImportProfiler() as profiler:
+                module = importlib.import_module(f"{self.plugin_dir}.{plugin_name}")
             if not hasattr(module, plugin_name):
                 logging.error(f"Plugin not found: {plugin_name}")
-                return
+                return None
             plugin_class = getattr(module, plugin_name)
             plugin = plugin_class(api=self.api, flow=self.flow)
-            self.plugins.append(plugin)
+            self.add_plugin(plugin)
         except ModuleNotFoundError:
             logging.error(f"Plugin not found: {plugin_name}")
-            return
-        logging.info("Plugin loaded: " + str(plugin.__class__.__name__))
+            return None
+        logging.info(f"Plugin loaded: {plugin.__class__.__name__} (import {profiler.total() / 1000:.1f} ms)")
+        logging.info(f"Import time for plugin {plugin_name}:\n{profiler.report()}")
+        return plugin
 
 
-    def unload_plugin(self, plugin_name):
+    def load_plugin_isolated(self, plugin_name):
+        if not os.path.exists(os.path.join(self.plugin_dir, f"{plugin_name}.py")):
+            logging.error(f"Plugin not found: {plugin_name}")
+            return None
+        # Named after the plugin so lookups by class name keep working
+        plugin_class = type(plugin_name, (RemotePlugin,), {})
+        plugin = plugin_class(plugin_name, self.api, self.flow, self.flow_runner, self.manifests.get(plugin_name))
+        if not plugin.ready.wait(timeout=10):
+            logging.warning(f"Plugin worker {plugin_name} has not reported in yet")
+        self.add_plugin(plugin)
+        logging.info(f"Plugin loaded in worker process: {plugin_name}")
+        return plugin
+
+
+    def add_plugin(self, plugin):
+        with self.plugins_lock:
+            self.plugins = self.plugins + [plugin]
+
+
+    def send_flow_to_workers(self):
+        for plugin in self.plugins:
+            if isinstance(plugin, RemotePlugin):
+                plugin.send_flow()
+
+
+    def defer_plugin(self, plugin_name):
+        """Registers a plugin from its manifest; the code is imported when it is first needed."""
+        with self.pending_lock:
+            self.pending_plugins[plugin_name] = self.manifests[plugin_name]
+        logging.info(f"Plugin deferred until a matching device or flow node appears: {plugin_name}")
+
+
+    def load_plugins_for_flow(self):
+        with self.pending_lock:
+            pending = list(self.pending_plugins.items())
+        for name, manifest in pending:
+            if manifest.handles_flow(self.flow):
+                logging.info(f"Flow uses nodes of plugin {name}, loading it")
+                self.load_plugin(name)
+
+
+    def find_plugin(self, plugin_name):
         for plugin in self.plugins:
             if plugin.__class__.__name__ == plugin_name:
-                self.plugins.remove(plugin)
-                logging.info("Plugin unloaded: " + plugin_name)
-                # Remove plugin name from plugins.txt
-                with open("plugins.txt", "r") as f:
-                    lines = f.readlines()
-                    for i, line in enumerate(lines):
-                        if line == plugin_name:
-                            lines.pop(i)
-                            break
-                
-                with open("plugins.txt", "w") as f:
-                    f.writelines(lines)
-                return
+                return plugin
+        return None
+
+
+    def stop_plugin(self, plugin, drain_timeout=0.5):
+        """Lets in-flight work finish, then stops the plugin's threads and detaches it from the flow."""
+        try:
+            if not plugin.drain(timeout=drain_timeout):
+                logging.warning(f"Plugin {plugin.__class__.__name__} did not drain within {drain_timeout}s")
+            plugin.stop()
+        except Exception as e:
+            logging.error(f"Error stopping plugin {plugin.__class__.__name__}: {e}")
+        self.unbind_flow_nodes(plugin)
+
+
+    def unbind_flow_nodes(self, plugin):
+        owned = [plugin, *plugin.devices.values()]
+        for node in self.flow.flow_table:
+            if node.function is None:
+                continue
+            owner = getattr(node.function, '__self__', None) or getattr(node.function, 'plugin', None)
+            if any(owner is candidate for candidate in owned):
+                node.function = None
+                node.device = None
+
+
+    def remove_plugin(self, plugin_name):
+        plugin = self.find_plugin(plugin_name)
+        if plugin is None:
+            return None
+        with self.plugins_lock:
+            self.plugins = [running for running in self.plugins if running is not plugin]
+        self.stop_plugin(plugin)
+        logging.info("Plugin unloaded: " + plugin_name)
+        return plugin
+
+
+    def reload_plugin(self, plugin_name):
+        """
+        Replaces a running plugin with freshly imported code, without a restart or re-scan.
+        Its helper modules (plugins/<name>_*.py) are imported afresh too. Devices are carried
+        over to the new instance and its flow nodes are bound again; the next cycle of the
+        main loop starts it.
+        """
+        old_plugin = self.find_plugin(plugin_name)
+        if old_plugin is None:
+            logging.info(f"Plugin {plugin_name} is not running, loading it")
+            return self.load_plugin(plugin_name)
+
+        start = time.perf_counter()
+        if isinstance(old_plugin, RemotePlugin):
+            # A new worker process imports the current code; known devices are replayed to it
+            old_plugin.reload()
+            logging.info(f"Plugin reloaded: {plugin_name} in {(time.perf_counter() - start) * 1000:.0f} ms")
+            return old_plugin
+
+        self.stop_plugin(old_plugin)
+        state = old_plugin.export_state()
+        try:
+            importlib.invalidate_caches()
+            # Dropped rather than reloaded one by one, so the plugin's imports load them in dependency order
+            for name in [name for name in sys.modules if name.startswith(f"{self.plugin_dir}.{plugin_name}_")]:
+                del sys.modules[name]
+            module = importlib.reload(sys.modules[f"{self.plugin_dir}.{plugin_name}"])
+            plugin = getattr(module, plugin_name)(api=self.api, flow=self.flow)
+            plugin.import_state(state)
+        except Exception as e:
+            # Keep the old code running rather than losing the plugin
+            logging.error(f"Failed to reload plugin {plugin_name}, restarting the previous version: {e}")
+            plugin = old_plugin
+
+        # Plugin-level nodes first: a plugin without devices yet must not leave them unbound
+        plugin.associate_flow_node()
+        for device in plugin.devices.values():
+            plugin.associate_flow_node(device)
+        with self.plugins_lock:
+            self.plugins = [plugin if running is old_plugin else running for running in self.plugins]
+        logging.info(f"Plugin reloaded: {plugin_name} in {(time.perf_counter() - start) * 1000:.0f} ms")
+        return plugin
+
+
+    def unload_plugin(self, plugin_name):
+        if self.remove_plugin(plugin_name) is None:
+            return
+        # Remove plugin name from plugins.txt
+        with open("plugins.txt", "r") as f:
+            lines = f.readlines()
+            for i, line in enumerate(lines):
+                if line == plugin_name:
+                    lines.pop(i)
+                    break
+
+        with open("plugins.txt", "w") as f:
+            f.writelines(lines)
             
 
     def get_plugins_from_file(self):
         with open("plugins.txt", "r") as f:
             plugins = f.readlines()
             for plugin in plugins:
-                if plugin.startswith("#"):
+                plugin = plugin.strip()
+                if not plugin or plugin.startswith("#"):
                     continue
-                self.load_plugin(plugin.strip())
+                manifest = self.manifests.get(plugin)
+                if manifest is not None and not manifest.eager:
+                    self.defer_plugin(plugin)
+                else:
+                    self.load_plugin(plugin)
         return
 
 
-    def scan_for_devices(self):
-        for plugin in self.plugins:
-            if plugin.protocol == 'BLE':
-                asyncio.run(self.ble.discover(plugin, timeout=5))
-                
-            elif plugin.protocol == 'WiFi':
-                plugin.discover()
-                
+    def initial_scan(self):
+        try:
+            self.scan_for_devices()
+        finally:
+            self.initial_scan_done.set()
+
+
+    def scan_for_devices(self, max_age=None, load_pending=False):
+        """
+        With max_age, BLE devices seen by any scanner within max_age seconds are used instead of a new radio scan.
+        With load_pending, deferred non-BLE plugins are imported so they can discover devices; otherwise they
+        wait for a flow that uses them.
+        """
+        with self.scan_lock:
+            start = time.perf_counter()
+            with self.pending_lock:
+                pending = list(self.pending_plugins.items())
+            # One radio scan serves all BLE plugins
+            ble_plugins = [plugin for plugin in self.plugins if plugin.protocol == 'BLE']
+            ble_pending = [manifest for _, manifest in pending if manifest.protocol == 'BLE']
+            if ble_plugins or ble_pending:
+                asyncio.run(self.ble.discover_plugins(ble_plugins, timeout=5, manifests=ble_pending,
+                                                      load_plugin=self.load_plugin, max_age=max_age))
+
+            # Other protocols need the plugin code to discover anything
+            if load_pending:
+                for name, manifest in pending:
+                    if manifest.protocol != 'BLE':
+                        self.load_plugin(name)
+
+            for plugin in self.plugins:
+                if plugin.protocol == 'WiFi':
+                    with ACCOUNTING.owner(plugin.__class__.__name__):
+                        plugin.discover()
+
+                elif plugin.protocol == 'Zigbee':
+                    pass
+                elif plugin.protocol == 'Zwave':
+                    pass
+            logging.info(f"Device scan took {time.perf_counter() - start:.2f}s")
 
-            elif plugin.protocol == 'Zigbee':
-                pass
-            elif plugin.protocol == 'Zwave':
-                pass
+
+    def write_status(self):
+        # Shared with the local web server, which runs in a separate process
+        status = {
+            "plugins": {plugin.__class__.__name__: len(plugin.devices) for plugin in self.plugins},
+            "plugin_stats": ACCOUNTING.snapshot(),
+        }
+        if status == self.last_status:
+            return
+        try:
+            with open(HUB_STATUS_FILE, "w") as f:
+                json.dump(status, f)
+            self.last_status = status
+        except OSError as e:
+            logging.error(f"Failed to write hub status: {e}")
 
 
     def execute_plugins(self):
         for plugin in self.plugins:
             if plugin.active:
                 continue
-            thread = threading.Thread(target=plugin.execute)
-            thread.start()
+            if plugin.protocol == 'BLE' and not self.initial_scan_done.is_set():
+                continue
+            with ACCOUNTING.owner(plugin.__class__.__name__):
+                plugin.start()
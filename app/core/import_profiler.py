@@ -0,0 +1,97 @@
+import sys
+import threading
+import time
+
+
+class TimedLoader:
+    """Wraps a module loader and reports how long the module took to execute."""
+    def __init__(self, loader, fullname, profiler):
+        self.loader = loader
+        self.fullname = fullname
+        self.profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        self.profiler.enter(self.fullname)
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.profiler.exit()
+            # Do not keep the wrapper (and the profiler) alive through the module
+            module.__loader__ = self.loader
+            if getattr(module, '__spec__', None) is not None:
+                module.__spec__.loader = self.loader
+
+
+class ImportProfiler:
+    """
+    Records self and cumulative import time per module, like `python -X importtime`.
+
+    While active it sits first on sys.meta_path, resolves specs through the other
+    finders and wraps their loaders. Only modules imported for the first time show up.
+
+        with ImportProfiler() as profiler:
+            importlib.import_module("plugins.onio_ble")
+        logging.info(profiler.report())
+    """
+
+    def __init__(self):
+        self.records = []  # (depth, fullname, self us, cumulative us), in completion order
+        self.stack = []  # [fullname, start, children us]
+        self.resolving = set()
+        self.thread_id = None
+
+    def __enter__(self):
+        # Only imports from the entering thread are profiled
+        self.thread_id = threading.get_ident()
+        sys.meta_path.insert(0, self)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+        return False
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname in self.resolving or threading.get_ident() != self.thread_id:
+            return None
+        self.resolving.add(fullname)
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, 'find_spec'):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self.resolving.discard(fullname)
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = TimedLoader(spec.loader, fullname, self)
+        return spec
+
+    def enter(self, fullname):
+        self.stack.append([fullname, time.perf_counter(), 0])
+
+    def exit(self):
+        fullname, start, children = self.stack.pop()
+        cumulative = int((time.perf_counter() - start) * 1_000_000)
+        if self.stack:
+            self.stack[-1][2] += cumulative
+        self.records.append((len(self.stack), fullname, cumulative - children, cumulative))
+
+    def total(self) -> int:
+        """Cumulative microseconds of the top-level imports."""
+        return sum(cumulative for depth, _, _, cumulative in self.records if depth == 0)
+
+    def report(self) -> str:
+        lines = ["import time: self [us] | cumulative | imported package"]
+        for depth, fullname, self_us, cumulative in self.records:
+            lines.append(f"import time: {self_us:>9} | {cumulative:>10} | {'  ' * depth}{fullname}")
+        return "\n".join(lines)
@@ -0,0 +1,87 @@
+import pickle
+import socket
+import struct
+import threading
+
+
+# Frame: 4 byte payload length, 1 byte message type, pickled payload
+HEADER = struct.Struct('!IB')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+# Worker -> hub
+HELLO = 1        # {'protocol', 'scan_filter_method', 'scan_filter'}
+DATA = 2         # payload for ApiBackend.send_collected_data
+EVENT = 3        # (device_id, data) for Flow.receive_device_data_to_flow
+TELEMETRY = 4    # {'active', 'devices': {address: {field: value}}}
+BIND = 5         # [node_id, ...] flow nodes the plugin provides a function for
+RESULT = 6       # (call_id, result)
+STATS = 7        # resource accounting of the worker, see core/plugin_stats.py
+
+# Hub -> worker
+EXECUTE = 10     # None
+FLOW = 11        # flow as returned by ApiBackend.get_flow
+DISCOVERED = 12  # (address, name) of a device found by the hub's BLE scan
+DISCOVER = 13    # (call_id,) run plugin.discover(), answered with RESULT
+CALL = 14        # (call_id, node_id, data) run a flow node function, answered with RESULT
+STOP = 15        # None
+
+
+class Channel:
+    """
+    Message channel over a connected stream socket (one end of a socketpair).
+
+    Both ends are our own processes, so payloads are pickled; the framing keeps
+    message boundaries without any parsing. send() can be called from any thread,
+    recv() from one reader thread.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.send_lock = threading.Lock()
+
+
+    def send(self, message_type, payload=None) -> bool:
+        data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            with self.send_lock:
+                self.sock.sendall(HEADER.pack(len(data), message_type) + data)
+            return True
+        except OSError:
+            return False
+
+
+    def recv(self):
+        """Blocks for the next message. Returns (message type, payload), or None once the peer is gone."""
+        header = self.recv_exactly(HEADER.size)
+        if header is None:
+            return None
+        length, message_type = HEADER.unpack(header)
+        if length > MAX_FRAME_SIZE:
+            raise ValueError(f"IPC frame of {length} bytes exceeds the limit")
+        data = self.recv_exactly(length)
+        if data is None:
+            return None
+        return message_type, pickle.loads(data)
+
+
+    def recv_exactly(self, size):
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            try:
+                count = self.sock.recv_into(view[received:])
+            except OSError:
+                return None
+            if count == 0:
+                return None
+            received += count
+        return buffer
+
+
+    def close(self) -> None:
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
@@ -0,0 +1,286 @@
+import os
+import threading
+import time
+import logging
+
+
+METRICS_FILE = "log/logs/hub_metrics.prom"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(labelnames, labelvalues, extra=None) -> str:
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def format_value(value) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Base class for metrics. A metric with label names holds one child per label value
+    combination, created on first use through labels(). Hot paths should keep a
+    reference to the child instead of calling labels() every time.
+    """
+    type = "untyped"
+    family_suffix = ""  # Appended to the name in HELP/TYPE, so they name the same series as the samples
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.children = {}
+
+    def labels(self, *labelvalues):
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        child = self.children.get(labelvalues)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(labelvalues, self.new_child())
+        return child
+
+    def new_child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        """Yields (suffix, labelvalues, extra label, value) for every child."""
+        for labelvalues, child in list(self.children.items()):
+            for suffix, extra, value in child.samples():
+                yield suffix, labelvalues, extra, value
+
+    def render(self) -> str:
+        family = self.name + self.family_suffix
+        lines = [f"# HELP {family} {self.documentation}", f"# TYPE {family} {self.type}"]
+        for suffix, labelvalues, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_labels(self.labelnames, labelvalues, extra)} {format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+    family_suffix = "_total"
+
+    class Child:
+        def __init__(self):
+            self.value = 0
+            self.lock = threading.Lock()
+
+        def inc(self, amount=1) -> None:
+            with self.lock:
+                self.value += amount
+
+        def samples(self):
+            yield "_total", None, self.value
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self.children[()] = self.new_child()
+
+    def new_child(self):
+        return self.Child()
+
+    def inc(self, amount=1) -> None:
+        self.children[()].inc(amount)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    class Child:
+        def __init__(self):
+            self.value = 0
+            self.function = None
+            self.lock = threading.Lock()
+
+        def set(self, value) -> None:
+            with self.lock:
+                self.value = value
+
+        def inc(self, amount=1) -> None:
+            with self.lock:
+                self.value += amount
+
+        def dec(self, amount=1) -> None:
+            with self.lock:
+                self.value -= amount
+
+        def set_function(self, function) -> None:
+            """Evaluate the gauge lazily at render time, costing nothing on the hot path."""
+            self.function = function
+
+        def samples(self):
+            if self.function is None:
+                yield "", None, self.value
+                return
+            try:
+                value = self.function()
+            except Exception as e:
+                logging.debug(f"Gauge callback failed: {e}")
+                return
+            if value is not None:
+                yield "", None, value
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self.children[()] = self.new_child()
+
+    def new_child(self):
+        return self.Child()
+
+    def set(self, value) -> None:
+        self.children[()].set(value)
+
+    def inc(self, amount=1) -> None:
+        self.children[()].inc(amount)
+
+    def dec(self, amount=1) -> None:
+        self.children[()].dec(amount)
+
+    def set_function(self, function) -> None:
+        self.children[()].set_function(function)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    class Child:
+        def __init__(self, buckets):
+            self.buckets = buckets
+            self.counts = [0] * len(buckets)
+            self.sum = 0.0
+            self.count = 0
+            self.lock = threading.Lock()
+
+        def observe(self, value) -> None:
+            with self.lock:
+                self.sum += value
+                self.count += 1
+                for i, bound in enumerate(self.buckets):
+                    if value <= bound:
+                        self.counts[i] += 1
+                        break
+
+        def time(self):
+            return Timer(self)
+
+        def samples(self):
+            with self.lock:
+                counts, total, count = list(self.counts), self.sum, self.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield "_bucket", ("le", format_value(bound)), cumulative
+            yield "_bucket", ("le", "+Inf"), count
+            yield "_sum", None, total
+            yield "_count", None, count
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self.children[()] = self.new_child()
+
+    def new_child(self):
+        return self.Child(self.buckets)
+
+    def observe(self, value) -> None:
+        self.children[()].observe(value)
+
+    def time(self):
+        return self.children[()].time()
+
+
+class Timer:
+    """Context manager observing the elapsed wall time into a histogram."""
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} already registered with a different type or labels")
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+    def write(self, path=METRICS_FILE) -> bool:
+        """Writes the text exposition atomically so another process can serve it."""
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(self.render())
+            os.replace(tmp_path, path)
+            return True
+        except OSError as e:
+            logging.error(f"Failed to write metrics: {e}")
+            return False
+
+
+def merge(*expositions) -> str:
+    """
+    Concatenates text expositions, keeping only the first family of each name: a metric
+    registered in several processes would otherwise repeat its HELP/TYPE block.
+    """
+    seen = set()
+    lines = []
+    for exposition in expositions:
+        skipping = False
+        family = None
+        for line in exposition.splitlines():
+            if line.startswith("# HELP ") or line.startswith("# TYPE "):
+                name = line.split(" ", 3)[2]
+                if name != family:
+                    family = name
+                    skipping = name in seen
+                    seen.add(name)
+            if line and not skipping:
+                lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
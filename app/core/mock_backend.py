@@ -0,0 +1,134 @@
+import json
+import time
+import random
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from config.config import ConfigSettings
+
+MOCK_TOKEN = "mock-access-token"
+
+
+class MockBackend:
+    """
+    Local stand-in for the _api_smarthub endpoints, for load tests that must not touch UAT.
+
+    Answers in the format ApiBackend expects. latency (seconds) is added to every
+    request, error_rate is the fraction answered with HTTP 500, and at most
+    max_concurrent requests are served at once; the rest get HTTP 503, so client-side
+    backpressure can be observed.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0, max_concurrent=64):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.lock = threading.Lock()
+        self.requests = {}  # path -> count
+        self.rejected = 0
+        self.failed = 0
+
+        config = ConfigSettings()
+        self.routes = {
+            config.get('endpoints', 'auth_fetch_token_ep'): self.token,
+            config.get('endpoints', 'auth_refresh_token_ep'): self.token,
+            config.get('endpoints', 'ping_ep'): self.ping,
+            config.get('endpoints', 'get_flow_ep'): self.flow,
+            config.get('endpoints', 'send_data_ep'): self.ok,
+            config.get('endpoints', 'scan_data_ep'): self.ok,
+            config.get('endpoints', 'set_location_ep'): self.ok,
+        }
+        self.public = {config.get('endpoints', 'auth_fetch_token_ep'), config.get('endpoints', 'auth_refresh_token_ep')}
+
+        backend = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                backend.handle(self)
+
+            def do_POST(self):
+                backend.handle(self)
+
+            def log_message(self, format, *args):
+                pass  # One line per request would dominate a load test
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.server.serve_forever, name="MockBackend", daemon=True)
+        self.thread.start()
+        logging.info(f"Mock backend listening on {self.url}")
+
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+    def handle(self, request) -> None:
+        length = int(request.headers.get('Content-Length') or 0)
+        body = request.rfile.read(length) if length else b""
+        path = request.path.split('?')[0]
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            return self.respond(request, 503, {'statusCode': 503, 'message': 'Too many requests'})
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            route = self.routes.get(path)
+            if route is None:
+                return self.respond(request, 404, {'statusCode': 404, 'message': 'Not found'})
+            if path not in self.public and request.headers.get('Auth') != f"Bearer {MOCK_TOKEN}":
+                return self.respond(request, 401, {'statusCode': 401, 'message': 'Unauthorized'})
+            if self.error_rate and random.random() < self.error_rate:
+                with self.lock:
+                    self.failed += 1
+                return self.respond(request, 500, {'statusCode': 500, 'message': 'Injected failure'})
+            self.respond(request, 200, {'statusCode': 200, 'data': route(body)})
+        finally:
+            self.slots.release()
+
+
+    def respond(self, request, status, payload) -> None:
+        data = json.dumps(payload).encode()
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
+
+
+    def token(self, body) -> dict:
+        return {'accessToken': MOCK_TOKEN, 'refreshToken': "mock-refresh-token"}
+
+
+    def ping(self, body) -> dict:
+        return {'command': ""}
+
+
+    def flow(self, body) -> dict:
+        return {'flow': {}, 'md5_out': "mock", 'creation_date': "", 'id': "mock", 'name': "Mock flow"}
+
+
+    def ok(self, body) -> dict:
+        return {}
+
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'requests': dict(self.requests), 'rejected': self.rejected, 'injected_failures': self.failed}
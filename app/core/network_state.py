@@ -0,0 +1,352 @@
+import fcntl
+import logging
+import select
+import socket
+import struct
+import subprocess
+import threading
+import time
+
+
+PROC_WIRELESS = "/proc/net/wireless"
+PROC_IF_INET6 = "/proc/net/if_inet6"
+SYSFS_NET = "/sys/class/net"
+SIOCGIFADDR = 0x8915
+
+# rtnetlink constants (linux/netlink.h, linux/rtnetlink.h, linux/if_link.h, linux/if_addr.h)
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+IFLA_IFNAME = 3
+IFLA_OPERSTATE = 16
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IF_OPER_UP = 6
+
+NLMSGHDR = struct.Struct('=LHHLL')
+IFINFOMSG = struct.Struct('=BxHiII')
+IFADDRMSG = struct.Struct('=BBBBI')
+RTATTR = struct.Struct('=HH')
+
+
+def parse_attributes(data, offset) -> dict:
+    attributes = {}
+    while offset + RTATTR.size <= len(data):
+        length, attribute_type = RTATTR.unpack_from(data, offset)
+        if length < RTATTR.size:
+            break
+        attributes[attribute_type] = data[offset + RTATTR.size:offset + length]
+        offset += (length + 3) & ~3
+    return attributes
+
+
+def read_wireless_rssi(interface) -> int:
+    """Signal level in dBm from /proc/net/wireless, or None if the interface is not listed."""
+    try:
+        with open(PROC_WIRELESS, 'r') as f:
+            for line in f:
+                name, _, values = line.partition(':')
+                if name.strip() == interface:
+                    return int(float(values.split()[2]))
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def read_interface_state():
+    """
+    Links and addresses without netlink: (links, addresses) shaped like NetworkState's.
+    IPv4 comes from SIOCGIFADDR (the primary address only), IPv6 from /proc/net/if_inet6.
+    """
+    links, addresses = {}, {}
+    try:
+        interfaces = socket.if_nameindex()
+    except OSError:
+        return links, addresses
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for index, name in interfaces:
+            try:
+                with open(f"{SYSFS_NET}/{name}/operstate", 'r') as f:
+                    up = f.read().strip() == 'up'
+            except OSError:
+                up = False
+            links[index] = {'name': name, 'operstate': IF_OPER_UP if up else 0}
+            try:
+                request = struct.pack('16s16x', name.encode()[:15])
+                reply = fcntl.ioctl(sock.fileno(), SIOCGIFADDR, request)
+                addresses.setdefault(index, set()).add((socket.AF_INET, socket.inet_ntoa(reply[20:24])))
+            except OSError:
+                pass  # No IPv4 address
+    try:
+        with open(PROC_IF_INET6, 'r') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 6:
+                    continue
+                address = socket.inet_ntop(socket.AF_INET6, bytes.fromhex(fields[0]))
+                addresses.setdefault(int(fields[1], 16), set()).add((socket.AF_INET6, address))
+    except (OSError, ValueError):
+        pass
+    return links, addresses
+
+
+def read_ssid(interface) -> str:
+    try:
+        result = subprocess.run(['iwgetid', '-r', interface], capture_output=True, text=True, timeout=2)
+        return result.stdout.strip()
+    except (subprocess.TimeoutExpired, OSError):
+        return ""
+
+
+class NetworkState:
+    """
+    Tracks link and address state of the network interfaces from rtnetlink events.
+
+    A background thread listens on a NETLINK_ROUTE socket, so link and address
+    changes are seen as they happen instead of by polling command-line tools.
+    RSSI is read from /proc/net/wireless on a timer and the SSID is looked up only
+    when the Wi-Fi link changes. Without netlink, links and addresses are polled
+    from sysfs and ioctls on the same timer. Subscribers are called with a fresh
+    snapshot from the monitor thread whenever link, address or SSID state changes.
+    RSSI jitters on every read, so it is left out of change notifications: readers
+    get the current value from `rssi` (or a snapshot) when they sample it.
+    """
+
+    def __init__(self, ethernet='eth0', wifi='wlan0', rssi_interval=5):
+        self.ethernet = ethernet
+        self.wifi = wifi
+        self.rssi_interval = rssi_interval
+        self.links = {}  # ifindex -> {'name': str, 'operstate': int}
+        self.addresses = {}  # ifindex -> set of (family, address)
+        self.ssid = ""
+        self.rssi = None
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.subscribers = []
+        self.last_snapshot = None
+        self.sequence = 0
+        self.sock = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+
+    def start(self) -> None:
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        try:
+            self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+            self.sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+            self.dump(RTM_GETLINK)
+            self.dump(RTM_GETADDR)
+        except OSError as e:
+            logging.error(f"Failed to open rtnetlink socket: {e}")
+            if self.sock:
+                self.sock.close()
+            self.sock = None
+            self.poll_interfaces()
+        self.update_wifi(refresh_ssid=True)
+        self.notify()
+        self.thread = threading.Thread(target=self.run, name="NetworkState", daemon=True)
+        self.thread.start()
+
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=self.rssi_interval + 1)
+        self.thread = None
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+
+    def run(self) -> None:
+        while not self.stop_event.is_set():
+            if self.sock is None:
+                self.stop_event.wait(self.rssi_interval)
+                self.poll_interfaces()
+                self.update_wifi(refresh_ssid=True)
+                self.notify()
+                continue
+            readable, _, _ = select.select([self.sock], [], [], self.rssi_interval)
+            wifi_was_up = self.is_up(self.wifi)
+            if readable:
+                try:
+                    self.handle(self.sock.recv(65536))
+                except OSError as e:
+                    logging.error(f"Failed to read rtnetlink socket: {e}")
+                    self.stop_event.wait(1)
+            self.update_wifi(refresh_ssid=self.is_up(self.wifi) != wifi_was_up)
+            self.notify()
+
+
+    def dump(self, message_type) -> None:
+        """Requests a full dump of links or addresses and processes the reply."""
+        self.sequence += 1
+        request = NLMSGHDR.pack(NLMSGHDR.size + 4, message_type, NLM_F_REQUEST | NLM_F_DUMP, self.sequence, 0)
+        self.sock.send(request + struct.pack('=B3x', socket.AF_UNSPEC))
+        while not self.handle(self.sock.recv(65536)):
+            pass
+
+
+    def handle(self, data) -> bool:
+        """Processes a netlink datagram. Returns True once a dump is complete."""
+        done = False
+        offset = 0
+        with self.lock:
+            while offset + NLMSGHDR.size <= len(data):
+                length, message_type, _, _, _ = NLMSGHDR.unpack_from(data, offset)
+                if length < NLMSGHDR.size:
+                    break
+                body = offset + NLMSGHDR.size
+                if message_type in (NLMSG_DONE, NLMSG_ERROR):
+                    done = True
+                elif message_type in (RTM_NEWLINK, RTM_DELLINK):
+                    _, _, index, _, _ = IFINFOMSG.unpack_from(data, body)
+                    if message_type == RTM_DELLINK:
+                        self.links.pop(index, None)
+                        self.addresses.pop(index, None)
+                    else:
+                        attributes = parse_attributes(data[:offset + length], body + IFINFOMSG.size)
+                        link = self.links.setdefault(index, {'name': '', 'operstate': 0})
+                        if IFLA_IFNAME in attributes:
+                            link['name'] = attributes[IFLA_IFNAME].rstrip(b'\0').decode()
+                        if IFLA_OPERSTATE in attributes:
+                            link['operstate'] = attributes[IFLA_OPERSTATE][0]
+                elif message_type in (RTM_NEWADDR, RTM_DELADDR):
+                    family, _, _, _, index = IFADDRMSG.unpack_from(data, body)
+                    attributes = parse_attributes(data[:offset + length], body + IFADDRMSG.size)
+                    raw = attributes.get(IFA_LOCAL) or attributes.get(IFA_ADDRESS)
+                    if raw:
+                        address = (family, socket.inet_ntop(family, raw))
+                        if message_type == RTM_NEWADDR:
+                            self.addresses.setdefault(index, set()).add(address)
+                        else:
+                            self.addresses.get(index, set()).discard(address)
+                offset += (length + 3) & ~3
+        return done
+
+
+    def poll_interfaces(self) -> None:
+        """Netlink fallback: replaces links and addresses with a fresh read."""
+        links, addresses = read_interface_state()
+        with self.lock:
+            self.links = links
+            self.addresses = addresses
+
+
+    def update_wifi(self, refresh_ssid=False) -> None:
+        up = self.is_up(self.wifi)
+        rssi = read_wireless_rssi(self.wifi) if up else None
+        ssid = self.ssid
+        if refresh_ssid:
+            ssid = read_ssid(self.wifi) if up else ""
+        with self.lock:
+            self.rssi = rssi
+            self.ssid = ssid
+
+
+    def notify(self) -> None:
+        snapshot = self.snapshot()
+        with self.lock:
+            if self.last_snapshot is not None and dict(snapshot, rssi=None) == dict(self.last_snapshot, rssi=None):
+                return
+            self.last_snapshot = snapshot
+            subscribers = list(self.subscribers)
+            self.changed.notify_all()
+        for callback in subscribers:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logging.error(f"Network state subscriber failed: {e}")
+
+
+    def subscribe(self, callback) -> None:
+        with self.lock:
+            self.subscribers.append(callback)
+
+
+    def unsubscribe(self, callback) -> None:
+        with self.lock:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
+
+
+    def index_of(self, name) -> int:
+        for index, link in self.links.items():
+            if link['name'] == name:
+                return index
+        return None
+
+
+    def is_up(self, name) -> bool:
+        with self.lock:
+            index = self.index_of(name)
+            return index is not None and self.links[index]['operstate'] == IF_OPER_UP
+
+
+    def ip_addresses(self, name=None) -> list:
+        """Addresses like `hostname -I`: no loopback or link-local, optionally for one interface."""
+        with self.lock:
+            addresses = []
+            for index, entries in self.addresses.items():
+                if name is not None and self.links.get(index, {}).get('name') != name:
+                    continue
+                for family, address in sorted(entries):
+                    if address.startswith('127.') or address == '::1' or address.startswith('fe80'):
+                        continue
+                    addresses.append(address)
+            return addresses
+
+
+    def is_ethernet_connected(self) -> bool:
+        return self.is_up(self.ethernet)
+
+
+    def is_wifi_connected(self) -> bool:
+        return self.is_up(self.wifi) and bool(self.ip_addresses(self.wifi))
+
+
+    def snapshot(self) -> dict:
+        return {
+            'ethernet': self.is_ethernet_connected(),
+            'wifi': self.is_wifi_connected(),
+            'ssid': self.ssid,
+            'rssi': self.rssi,
+            'ip_addresses': self.ip_addresses(),
+        }
+
+
+    def is_connected(self) -> bool:
+        return self.is_ethernet_connected() or self.is_wifi_connected()
+
+
+    def wait_for_connectivity(self, timeout) -> bool:
+        """Blocks until Ethernet or Wi-Fi is up with an address. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        while not self.is_connected():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            # Short waits so a change published between the check and the wait is not missed for long
+            self.wait_for_change(min(remaining, 0.5))
+        return True
+
+
+    def wait_for_change(self, timeout=None) -> dict:
+        """Blocks until the next published change (or timeout) and returns the snapshot."""
+        with self.lock:
+            self.changed.wait(timeout)
+            return self.last_snapshot
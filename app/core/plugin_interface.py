@@ -1,6 +1,9 @@
 
+import logging
+import threading
 from core.backend import ApiBackend
 from core.flow import Flow
+from core import plugin_stats
 
 class PluginInterface:
     def __init__(self, api: ApiBackend, flow: Flow):
@@ -17,6 +20,42 @@ class PluginInterface:
     
     def display_devices(self) -> None:
         raise NotImplementedError("Plugins must implement the 'display_devices' method.")
+
+    # Lifecycle hooks. The defaults suit plugins whose execute() runs to completion.
+
+    def start(self) -> None:
+        """Begins work without blocking the caller."""
+        threading.Thread(target=self.run_execute, name=f"{self.__class__.__name__}-execute", daemon=True).start()
+
+    def run_execute(self) -> None:
+        plugin_stats.ACCOUNTING.record_task()
+        try:
+            self.execute()
+        except Exception as e:
+            logging.error(f"Plugin {self.__class__.__name__} failed to execute: {e}")
+            return
+        plugin_stats.record_execute()
+
+    def drain(self, timeout=0.5) -> bool:
+        """Stops taking new work and waits for work in flight. Returns False if it did not finish in time."""
+        return True
+
+    def stop(self) -> None:
+        """Stops all threads and scanners the plugin started."""
+        self.active = False
+
+    def export_state(self) -> dict:
+        """State handed to the replacement instance when the plugin is reloaded."""
+        return {'devices': self.devices}
+
+    def import_state(self, state) -> None:
+        """Adopts devices from the previous instance, rebuilt on the reloaded Device class."""
+        for address, old_device in state.get('devices', {}).items():
+            if address in self.devices:
+                continue
+            device = self.Device.__new__(self.Device)
+            device.__dict__.update(old_device.__dict__)
+            self.devices[address] = device
     
     class SearchableDeviceInterface:
         def __init__(self):
@@ -25,6 +64,8 @@ class PluginInterface:
             self.scan_filter = ""
 
     class DeviceInterface:
+        __slots__ = ()  # Lets table-backed devices (see plugins/null.py) do without an instance dict
+
         def __init__(self):
             self.manufacturer = ""
             self.ip = ""
@@ -0,0 +1,38 @@
+import logging
+import os
+import yaml
+
+
+MANIFEST_FILE = "plugins/manifest.yaml"
+
+
+class PluginManifest:
+    """
+    Static description of a plugin. Has the attributes of a plugin's SearchableDevice,
+    so it can be used as a scan filter before the plugin is imported.
+    """
+    def __init__(self, name, info):
+        self.name = name
+        self.protocol = info.get('protocol', 'BLE')
+        self.scan_filter_method = info.get('scan_filter_method', '')
+        self.scan_filter = info.get('scan_filter', '')
+        if self.scan_filter_method == 'advertisement_data':
+            self.scan_filter = bytes.fromhex(self.scan_filter)
+        self.nodes = set(info.get('nodes', []))
+        self.eager = info.get('eager', False)
+
+    def handles_flow(self, flow) -> bool:
+        return any(node.node_name in self.nodes for node in flow.flow_table)
+
+
+def load_manifests(path=MANIFEST_FILE) -> dict:
+    if not os.path.exists(path):
+        logging.warning(f"Plugin manifest not found: {path}")
+        return {}
+    try:
+        with open(path, 'r') as f:
+            manifests = yaml.safe_load(f) or {}
+        return {name: PluginManifest(name, info or {}) for name, info in manifests.get('plugins', {}).items()}
+    except (yaml.YAMLError, ValueError, AttributeError) as e:
+        logging.error(f"Failed to read plugin manifest: {e}")
+        return {}
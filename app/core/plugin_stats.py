@@ -0,0 +1,269 @@
+import time
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from core import metrics
+
+PLUGIN_CPU_SECONDS = metrics.gauge('hub_plugin_cpu_seconds', 'CPU time used by the threads of a plugin', ['plugin'])
+PLUGIN_THREADS = metrics.gauge('hub_plugin_threads', 'Live threads started by a plugin', ['plugin'])
+PLUGIN_EVENTS = metrics.counter('hub_plugin_events', 'Device events and uploads produced by a plugin', ['plugin'])
+PLUGIN_ERRORS = metrics.counter('hub_plugin_errors', 'Errors logged from the threads of a plugin', ['plugin'])
+PLUGIN_MEMORY_BYTES = metrics.gauge('hub_plugin_memory_delta_bytes', 'Memory allocated by plugin code since tracing started', ['plugin'])
+PLUGIN_LAST_EXECUTE = metrics.gauge('hub_plugin_last_execute_timestamp', 'Unix time of the last successful execute, or work cycle of a long-running one', ['plugin'])
+
+MEMORY_SAMPLE_INTERVAL = 60  # seconds, tracemalloc snapshots are expensive
+ORIGINAL_THREAD_START = threading.Thread.start
+
+owner = threading.local()
+
+
+def current_plugin() -> str:
+    """Name of the plugin the calling thread belongs to, or None for hub threads."""
+    return getattr(owner, 'plugin', None)
+
+
+def thread_cpu_seconds(thread) -> float:
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+    except (OSError, TypeError, ValueError):
+        return 0.0  # The thread just exited
+
+
+class PluginStats:
+    def __init__(self, name):
+        self.name = name
+        self.threads = set()
+        self.finished_cpu = 0.0
+        self.tasks_started = 0
+        self.events = 0
+        self.errors = 0
+        self.last_execute = None
+        self.memory_baseline = None
+        self.memory_delta = 0
+        self.previous = (time.monotonic(), 0, 0)  # (when, events, errors) at the last rate update
+        self.events_per_second = 0.0
+        self.errors_per_minute = 0.0
+
+
+    def cpu_seconds(self) -> float:
+        return self.finished_cpu + sum(thread_cpu_seconds(thread) for thread in list(self.threads))
+
+
+    def update_rates(self) -> None:
+        now = time.monotonic()
+        when, events, errors = self.previous
+        elapsed = now - when
+        if elapsed <= 0:
+            return
+        self.events_per_second = (self.events - events) / elapsed
+        self.errors_per_minute = (self.errors - errors) * 60 / elapsed
+        self.previous = (now, self.events, self.errors)
+
+
+    def to_dict(self) -> dict:
+        return {
+            'cpu_seconds': round(self.cpu_seconds(), 3),
+            'threads': len(self.threads),
+            'tasks_started': self.tasks_started,
+            'events': self.events,
+            'events_per_second': round(self.events_per_second, 2),
+            'errors': self.errors,
+            'errors_per_minute': round(self.errors_per_minute, 2),
+            'last_execute': self.last_execute,
+            'memory_delta_bytes': self.memory_delta,
+        }
+
+
+class ErrorCounter(logging.Handler):
+    """Counts error records logged from plugin threads."""
+    def __init__(self, accounting):
+        super().__init__(level=logging.ERROR)
+        self.accounting = accounting
+
+    def emit(self, record):
+        name = current_plugin()
+        if name is not None:
+            self.accounting.get(name).errors += 1
+            PLUGIN_ERRORS.labels(name).inc()
+
+
+class PluginAccounting:
+    """
+    Attributes threads, CPU time, events, errors and memory to plugins.
+
+    Ownership is a thread-local plugin name. Code run inside owner(name), and every
+    thread started from there (transitively, including executor and to_thread
+    workers), counts for that plugin. Thread.start is patched while any owned context
+    or thread is alive, which for plugins whose execute() runs until stopped means as
+    long as they run; threads started outside a plugin go straight to the original
+    start and are not changed. CPU time is read from per-thread CPU clocks; threads
+    that exit add their final CPU time. Memory is attributed from tracemalloc
+    snapshots to allocations with a frame in plugins/<name>*.py, which covers the
+    plugin's helper modules, and is only traced when enabled, since tracing slows
+    down every allocation. Plugins whose execute() runs until stopped record their
+    own successful executes, once per work cycle.
+    """
+
+    def __init__(self):
+        self.stats = {}
+        self.remote = {}  # name -> stats reported by a plugin worker process
+        self.lock = threading.Lock()
+        self.installed = False
+        self.owned = 0  # owner() contexts and owned threads alive
+        self.patched_start = None
+        self.trace_memory = False
+        self.last_memory_sample = 0
+
+
+    def install(self, trace_memory=False, frames=5) -> None:
+        if self.installed:
+            return
+        self.installed = True
+        # A plain function, so it binds to the thread when set as Thread.start
+        self.patched_start = lambda thread: self.start_owned(thread)
+        logging.getLogger().addHandler(ErrorCounter(self))
+
+        if trace_memory:
+            self.trace_memory = True
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+
+
+    def enter(self) -> None:
+        """Counts one owned context or thread; Thread.start is patched while any exists."""
+        with self.lock:
+            self.owned += 1
+            if self.owned == 1 and self.installed:
+                threading.Thread.start = self.patched_start
+
+
+    def leave(self) -> None:
+        with self.lock:
+            self.owned -= 1
+            if self.owned == 0 and threading.Thread.start is self.patched_start:
+                threading.Thread.start = ORIGINAL_THREAD_START
+
+
+    def start_owned(self, thread) -> None:
+        """Thread.start while plugin code runs: the thread inherits the caller's plugin."""
+        name = current_plugin()
+        if name is None:
+            return ORIGINAL_THREAD_START(thread)
+        run = thread.run
+
+        def run_owned():
+            owner.plugin = name
+            stats = self.get(name)
+            stats.threads.add(thread)
+            try:
+                run()
+            finally:
+                stats.threads.discard(thread)
+                stats.finished_cpu += time.thread_time()
+                self.leave()
+
+        thread.run = run_owned
+        self.enter()
+        try:
+            ORIGINAL_THREAD_START(thread)
+        except BaseException:
+            self.leave()
+            raise
+
+
+    def get(self, name) -> PluginStats:
+        stats = self.stats.get(name)
+        if stats is None:
+            with self.lock:
+                stats = self.stats.setdefault(name, PluginStats(name))
+        return stats
+
+
+    @contextmanager
+    def owner(self, name):
+        previous = current_plugin()
+        owner.plugin = name
+        self.enter()
+        try:
+            yield
+        finally:
+            self.leave()
+            owner.plugin = previous
+
+
+    def record_event(self, count=1) -> None:
+        name = current_plugin()
+        if name is not None:
+            self.get(name).events += count
+            PLUGIN_EVENTS.labels(name).inc(count)
+
+
+    def record_task(self) -> None:
+        name = current_plugin()
+        if name is not None:
+            self.get(name).tasks_started += 1
+
+
+    def record_execute(self) -> None:
+        name = current_plugin()
+        if name is not None:
+            self.get(name).last_execute = time.time()
+
+
+    def sample_memory(self) -> None:
+        snapshot = tracemalloc.take_snapshot()
+        for name, stats in list(self.stats.items()):
+            traced = snapshot.filter_traces([tracemalloc.Filter(True, f"*/plugins/{name}*.py", all_frames=True)])
+            size = sum(statistic.size for statistic in traced.statistics('filename'))
+            if stats.memory_baseline is None:
+                stats.memory_baseline = size
+            stats.memory_delta = size - stats.memory_baseline
+
+
+    def update(self) -> None:
+        """Refreshes rates, gauges and (when due) memory. Called periodically by the hub."""
+        if self.trace_memory and time.monotonic() - self.last_memory_sample >= MEMORY_SAMPLE_INTERVAL:
+            self.last_memory_sample = time.monotonic()
+            self.sample_memory()
+        for name, stats in list(self.stats.items()):
+            stats.update_rates()
+            PLUGIN_CPU_SECONDS.labels(name).set(round(stats.cpu_seconds(), 3))
+            PLUGIN_THREADS.labels(name).set(len(stats.threads))
+            if stats.last_execute is not None:
+                PLUGIN_LAST_EXECUTE.labels(name).set(int(stats.last_execute))
+            if self.trace_memory:
+                PLUGIN_MEMORY_BYTES.labels(name).set(stats.memory_delta)
+
+
+    def update_remote(self, name, reported) -> None:
+        """Takes over the stats a plugin worker process reported about itself."""
+        previous = self.remote.get(name, {})
+        for key, counter in (('events', PLUGIN_EVENTS), ('errors', PLUGIN_ERRORS)):
+            delta = reported[key] - previous.get(key, 0)
+            # A restarted worker counts from zero again
+            counter.labels(name).inc(delta if delta >= 0 else reported[key])
+        PLUGIN_CPU_SECONDS.labels(name).set(reported['cpu_seconds'])
+        PLUGIN_THREADS.labels(name).set(reported['threads'])
+        if reported['last_execute'] is not None:
+            PLUGIN_LAST_EXECUTE.labels(name).set(int(reported['last_execute']))
+        if self.trace_memory:
+            PLUGIN_MEMORY_BYTES.labels(name).set(reported['memory_delta_bytes'])
+        self.remote[name] = reported
+
+
+    def snapshot(self) -> dict:
+        snapshot = {name: stats.to_dict() for name, stats in list(self.stats.items())}
+        snapshot.update(self.remote)
+        return snapshot
+
+
+ACCOUNTING = PluginAccounting()
+
+
+def record_event(count=1) -> None:
+    ACCOUNTING.record_event(count)
+
+
+def record_execute() -> None:
+    ACCOUNTING.record_execute()
@@ -0,0 +1,198 @@
+import sys
+import time
+import socket
+import logging
+import asyncio
+import inspect
+import importlib
+import threading
+from core.flow import Flow
+from core.ipc import Channel
+from core import ipc
+from core import plugin_stats
+from core.plugin_stats import ACCOUNTING
+
+TELEMETRY_INTERVAL = 2  # seconds
+DEVICE_FIELDS = ('mac_address', 'ip', 'device_name', 'device_description', 'com_protocol',
+                 'model_no', 'serial_no', 'manufacturer', 'firmware')
+
+
+class WorkerApi:
+    """Stands in for ApiBackend in the worker: uploads go through the hub, which holds the token."""
+    def __init__(self, channel):
+        self.channel = channel
+
+    def send_collected_data(self, data) -> bool:
+        plugin_stats.record_event()
+        return self.channel.send(ipc.DATA, data)
+
+
+class WorkerFlow(Flow):
+    """Local copy of the hub's flow. Plugins bind node functions here; device data goes to the hub."""
+    def __init__(self, channel):
+        super().__init__()
+        self.channel = channel
+
+    async def receive_device_data_to_flow(self, device_id, data) -> None:
+        plugin_stats.record_event()
+        self.channel.send(ipc.EVENT, (device_id, data))
+
+
+class PluginWorker:
+    """
+    Runs a single plugin in its own process, driven by the hub over a Channel.
+
+    The main thread reads commands, execute() runs in its own thread as it does in
+    the hub, and flow node functions run on a dedicated event loop so a slow node
+    does not block the channel.
+    """
+
+    def __init__(self, plugin_name, channel):
+        self.plugin_name = plugin_name
+        self.channel = channel
+        self.api = WorkerApi(channel)
+        self.flow = WorkerFlow(channel)
+        module = importlib.import_module(f"plugins.{plugin_name}")
+        self.plugin = getattr(module, plugin_name)(api=self.api, flow=self.flow)
+        self.execute_thread = None
+        self.last_telemetry = None
+        self.stop_event = threading.Event()
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="FlowCalls", daemon=True).start()
+
+
+    def run(self) -> None:
+        search = self.plugin.SearchableDevice()
+        self.channel.send(ipc.HELLO, {
+            'protocol': self.plugin.protocol,
+            'scan_filter_method': search.scan_filter_method,
+            'scan_filter': search.scan_filter,
+        })
+        self.send_telemetry()
+        threading.Thread(target=self.telemetry_loop, name="Telemetry", daemon=True).start()
+
+        while True:
+            message = self.channel.recv()
+            if message is None:
+                logging.info(f"Hub closed the channel, stopping plugin worker {self.plugin_name}")
+                break
+            message_type, payload = message
+            if message_type == ipc.STOP:
+                break
+            try:
+                self.handle(message_type, payload)
+            except Exception as e:
+                logging.error(f"Plugin worker {self.plugin_name} failed to handle message {message_type}: {e}")
+        self.stop_event.set()
+
+
+    def handle(self, message_type, payload) -> None:
+        if message_type == ipc.EXECUTE:
+            if self.execute_thread is None or not self.execute_thread.is_alive():
+                self.execute_thread = threading.Thread(target=self.plugin.run_execute, name="Execute", daemon=True)
+                self.execute_thread.start()
+
+        elif message_type == ipc.FLOW:
+            self.flow.set_flow(payload)
+            self.bind_flow_nodes()
+
+        elif message_type == ipc.DISCOVERED:
+            address, name = payload
+            if address not in self.plugin.devices:
+                device = self.plugin.Device(address, name)
+                self.plugin.devices[address] = device
+                self.plugin.associate_flow_node(device)
+                self.send_bindings()
+            self.send_telemetry()
+
+        elif message_type == ipc.DISCOVER:
+            call_id, = payload
+            threading.Thread(target=self.discover, args=(call_id,), daemon=True).start()
+
+        elif message_type == ipc.CALL:
+            call_id, node_id, data = payload
+            node = self.flow.get_node_by_id(node_id)
+            if node is None or node.function is None:
+                self.channel.send(ipc.RESULT, (call_id, False))
+                return
+            future = asyncio.run_coroutine_threadsafe(node.function(data=data), self.loop)
+            future.add_done_callback(lambda future: self.send_result(call_id, future))
+
+
+    def discover(self, call_id) -> None:
+        try:
+            self.plugin.discover()
+        except Exception as e:
+            logging.error(f"Discovery failed in plugin worker {self.plugin_name}: {e}")
+        self.send_telemetry()
+        self.channel.send(ipc.RESULT, (call_id, True))
+
+
+    def send_result(self, call_id, future) -> None:
+        try:
+            result = bool(future.result())
+        except Exception as e:
+            logging.error(f"Flow node function failed in plugin worker {self.plugin_name}: {e}")
+            result = False
+        self.channel.send(ipc.RESULT, (call_id, result))
+
+
+    def bind_flow_nodes(self) -> None:
+        """Re-runs the plugin's flow association against the new local flow table."""
+        associate = self.plugin.associate_flow_node
+        parameters = list(inspect.signature(associate).parameters.values())
+        if parameters and parameters[0].default is not inspect.Parameter.empty:
+            # Plugins like onio_ble bind by node name and take no device
+            associate()
+        for device in list(self.plugin.devices.values()):
+            associate(device)
+        self.send_bindings()
+
+
+    def send_bindings(self) -> None:
+        bound = [node.node_id for node in self.flow.flow_table if node.function is not None]
+        self.channel.send(ipc.BIND, bound)
+
+
+    def telemetry_loop(self) -> None:
+        while not self.stop_event.wait(TELEMETRY_INTERVAL):
+            self.send_telemetry()
+            self.send_stats()
+
+
+    def send_stats(self) -> None:
+        ACCOUNTING.update()
+        stats = ACCOUNTING.get(self.plugin_name).to_dict()
+        # The whole process belongs to the plugin
+        stats['cpu_seconds'] = round(time.process_time(), 3)
+        stats['threads'] = threading.active_count()
+        self.channel.send(ipc.STATS, stats)
+
+
+    def send_telemetry(self) -> None:
+        telemetry = {
+            'active': bool(self.plugin.active),
+            'devices': {
+                address: {field: getattr(device, field, "") for field in DEVICE_FIELDS}
+                for address, device in list(self.plugin.devices.items())
+            },
+        }
+        if telemetry == self.last_telemetry:
+            return
+        if self.channel.send(ipc.TELEMETRY, telemetry):
+            self.last_telemetry = telemetry
+
+
+def main(plugin_name, fd, log_level, trace_memory="0"):
+    logging.basicConfig(level=int(log_level), format=f'%(levelname)s - [{plugin_name}:%(funcName)s] - %(message)s')
+    ACCOUNTING.install(trace_memory=trace_memory == "1")
+    channel = Channel(socket.socket(fileno=int(fd)))
+    try:
+        with ACCOUNTING.owner(plugin_name):
+            PluginWorker(plugin_name, channel).run()
+    finally:
+        channel.close()
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:5])
@@ -0,0 +1,311 @@
+import os
+import sys
+import time
+import socket
+import asyncio
+import logging
+import itertools
+import threading
+import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor
+from core.ipc import Channel
+from core import ipc
+from core import metrics
+from core.plugin_stats import ACCOUNTING
+
+WORKER_RESTARTS = metrics.counter('hub_plugin_worker_restarts', 'Plugin worker processes restarted after a crash', ['plugin'])
+IPC_MESSAGES = metrics.counter('hub_plugin_ipc_messages', 'Messages received from plugin workers', ['plugin', 'type'])
+
+MAX_RESTART_BACKOFF = 60  # seconds
+STABLE_RUNTIME = 60  # a worker running this long resets its backoff
+CALL_TIMEOUT = 30  # seconds
+
+
+class FlowRunner:
+    """
+    Event loop thread running flows triggered by plugin workers.
+
+    Worker reader threads hand coroutines over and go back to reading, so a flow
+    that calls a node in another worker (or the same one) never waits on itself.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="FlowRunner", daemon=True)
+        self.thread.start()
+
+    def submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+
+class RemoteDevice:
+    """Hub-side record of a device owned by a plugin worker, filled from its telemetry."""
+    def __init__(self, mac_address, device_name="", **fields):
+        self.mac_address = mac_address
+        self.device_name = device_name
+        self.ip = ""
+        self.device_description = ""
+        self.com_protocol = ""
+        self.model_no = ""
+        self.serial_no = ""
+        self.manufacturer = ""
+        self.firmware = ""
+        self.__dict__.update(fields)
+
+
+class RemoteSearchableDevice:
+    def __init__(self, protocol, scan_filter_method, scan_filter):
+        self.protocol = protocol
+        self.scan_filter_method = scan_filter_method
+        self.scan_filter = scan_filter
+
+
+class RemotePlugin:
+    """
+    Hub-side proxy for a plugin running in its own worker process.
+
+    Looks like a plugin to the hub (protocol, devices, active, execute, discover,
+    SearchableDevice, Device, associate_flow_node), so scanning, status and scan
+    result upload work unchanged. The hub creates a subclass named after the plugin,
+    keeping plugin.__class__.__name__ lookups intact.
+
+    Device events are fed into the hub's flow, flow nodes bound in the worker are
+    replaced by calls over the channel, and uploads go through the hub's ApiBackend.
+    A worker that exits unexpectedly is restarted with exponential backoff, the flow
+    and known devices are replayed to it, and the hub's next cycle executes it again.
+    """
+
+    def __init__(self, name, api, flow, flow_runner, manifest=None):
+        self.name = name
+        self.api = api
+        self.flow = flow
+        self.flow_runner = flow_runner
+        self.protocol = manifest.protocol if manifest is not None else None
+        self.search = manifest
+        self.devices = {}
+        self.active = False
+        self.ready = threading.Event()
+        self.channel = None
+        self.process = None
+        self.started_at = None
+        self.backoff = 1
+        self.stopping = False
+        self.call_ids = itertools.count(1)
+        self.pending_calls = {}  # call_id -> Future
+        self.uploads = ThreadPoolExecutor(max_workers=2, thread_name_prefix=f"{name}-upload")
+        self.spawn()
+
+
+    def spawn(self) -> None:
+        hub_end, worker_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'core.plugin_worker', self.name, str(worker_end.fileno()),
+             str(logging.getLogger().getEffectiveLevel()), str(int(ACCOUNTING.trace_memory))],
+            cwd=app_dir, pass_fds=(worker_end.fileno(),))
+        worker_end.close()
+        self.channel = Channel(hub_end)
+        self.started_at = time.monotonic()
+        self.ready.clear()
+        threading.Thread(target=self.read_loop, args=(self.channel, self.process),
+                         name=f"{self.name}-worker", daemon=True).start()
+        logging.info(f"Started worker process {self.process.pid} for plugin {self.name}")
+
+
+    def stop(self, timeout=5) -> None:
+        self.stopping = True
+        self.stop_worker(timeout)
+        self.uploads.shutdown(wait=False)
+
+
+    def stop_worker(self, timeout) -> None:
+        self.active = False
+        if self.channel:
+            self.channel.send(ipc.STOP)
+        if self.process:
+            try:
+                self.process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self.channel:
+            self.channel.close()
+
+
+    def reload(self, timeout=5) -> None:
+        """Replaces the worker with a fresh process, which imports the current plugin code."""
+        # Still stopping until spawn() has replaced self.process: the old worker's
+        # on_worker_exit may run in between and must not schedule a restart
+        self.stopping = True
+        self.stop_worker(timeout)
+        self.backoff = 1
+        try:
+            self.spawn()
+        finally:
+            self.stopping = False
+
+
+    def read_loop(self, channel, process) -> None:
+        while True:
+            try:
+                message = channel.recv()
+            except Exception as e:
+                logging.error(f"Invalid message from plugin worker {self.name}: {e}")
+                message = None
+            if message is None:
+                break
+            message_type, payload = message
+            IPC_MESSAGES.labels(self.name, message_type).inc()
+            try:
+                self.handle(message_type, payload)
+            except Exception as e:
+                logging.error(f"Failed to handle message {message_type} from plugin worker {self.name}: {e}")
+        self.on_worker_exit(channel, process)
+
+
+    def handle(self, message_type, payload) -> None:
+        if message_type == ipc.HELLO:
+            if self.search is None:
+                self.search = RemoteSearchableDevice(**payload)
+                self.protocol = payload['protocol']
+            self.ready.set()
+            self.send_flow()
+            for device in list(self.devices.values()):
+                self.channel.send(ipc.DISCOVERED, (device.mac_address, device.device_name))
+
+        elif message_type == ipc.DATA:
+            self.uploads.submit(self.api.send_collected_data, payload)
+
+        elif message_type == ipc.EVENT:
+            device_id, data = payload
+            self.flow_runner.submit(self.flow.receive_device_data_to_flow(device_id, data))
+
+        elif message_type == ipc.TELEMETRY:
+            self.active = payload['active']
+            self.devices = {address: RemoteDevice(**fields) for address, fields in payload['devices'].items()}
+
+        elif message_type == ipc.BIND:
+            bound = set(payload)
+            for node in self.flow.flow_table:
+                if node.node_id in bound:
+                    node.function = self.remote_node_function(node.node_id)
+
+        elif message_type == ipc.STATS:
+            ACCOUNTING.update_remote(self.name, payload)
+
+        elif message_type == ipc.RESULT:
+            call_id, result = payload
+            future = self.pending_calls.pop(call_id, None)
+            if future is not None:
+                future.set_result(result)
+
+
+    def on_worker_exit(self, channel, process) -> None:
+        returncode = process.wait()
+        channel.close()
+        if process is not self.process:
+            return  # Replaced by reload()
+        self.active = False
+        for call_id in list(self.pending_calls):
+            future = self.pending_calls.pop(call_id, None)
+            if future is not None:
+                future.set_result(False)
+        if self.stopping:
+            return
+
+        runtime = time.monotonic() - self.started_at
+        if runtime >= STABLE_RUNTIME:
+            self.backoff = 1
+        logging.error(f"Plugin worker {self.name} exited with code {returncode} after {runtime:.0f} seconds, "
+                      f"restarting in {self.backoff} seconds")
+        timer = threading.Timer(self.backoff, self.restart, args=(process,))
+        timer.daemon = True
+        timer.start()
+        self.backoff = min(self.backoff * 2, MAX_RESTART_BACKOFF)
+
+
+    def restart(self, process) -> None:
+        """Replaces the worker that exited, unless it was stopped or replaced meanwhile."""
+        if self.stopping or process is not self.process:
+            return
+        WORKER_RESTARTS.labels(self.name).inc()
+        try:
+            self.spawn()
+        except OSError as e:
+            logging.error(f"Failed to restart plugin worker {self.name}: {e}")
+
+
+    def call(self, message_type, *payload) -> Future:
+        call_id = next(self.call_ids)
+        future = Future()
+        self.pending_calls[call_id] = future
+        if not self.channel.send(message_type, (call_id, *payload)):
+            self.pending_calls.pop(call_id, None)
+            future.set_result(False)
+        return future
+
+
+    def remote_node_function(self, node_id):
+        async def function(data):
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(self.call(ipc.CALL, node_id, data)), CALL_TIMEOUT)
+            except asyncio.TimeoutError:
+                logging.error(f"Flow node {node_id} timed out in plugin worker {self.name}")
+                return False
+        function.plugin = self  # lets the hub unbind it on unload
+        return function
+
+
+    def send_flow(self) -> None:
+        if not self.flow.flow_json:
+            return
+        self.channel.send(ipc.FLOW, {
+            'flow': self.flow.flow_json,
+            'md5_out': self.flow.md5,
+            'creation_date': self.flow.creation_date,
+            'id': self.flow.id,
+            'name': self.flow.name,
+        })
+
+
+    # Plugin interface, as used by the hub
+
+    def execute(self) -> None:
+        self.channel.send(ipc.EXECUTE)
+
+
+    def start(self) -> None:
+        self.execute()
+
+
+    def drain(self, timeout=0.5) -> bool:
+        return True
+
+
+    def discover(self) -> None:
+        try:
+            self.call(ipc.DISCOVER).result(timeout=CALL_TIMEOUT)
+        except TimeoutError:
+            logging.error(f"Discovery timed out in plugin worker {self.name}")
+
+
+    def SearchableDevice(self):
+        if not self.ready.wait(timeout=10) and self.search is None:
+            raise RuntimeError(f"Plugin worker {self.name} did not start")
+        return self.search
+
+
+    def Device(self, mac_address, device_name):
+        return RemoteDevice(mac_address, device_name)
+
+
+    def associate_flow_node(self, device=None):
+        # The worker creates the real device and binds its flow nodes
+        if device is None:
+            return
+        self.channel.send(ipc.DISCOVERED, (device.mac_address, device.device_name))
+
+
+    def display_devices(self) -> None:
+        for id, device in self.devices.items():
+            logging.info(f"  {id} - {device.device_name} - {device.device_description}")
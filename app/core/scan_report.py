@@ -0,0 +1,94 @@
+import threading
+import time
+
+from core import metrics
+
+SCAN_REPORTS = metrics.counter('hub_scan_reports', 'Scan result payloads built for the backend', ['kind'])
+SCAN_REPORT_DEVICES = metrics.counter('hub_scan_report_devices', 'Devices in scan result payloads', ['change'])
+
+# Fields that identify a device to the backend; a change in any of them is reported
+IDENTITY_FIELDS = ('ip', 'mac_address', 'device_name', 'device_description', 'com_protocol', 'model_no',
+                   'serial_no', 'manufacturer', 'firmware')
+FULL_RESYNC_INTERVAL = 3600  # seconds
+
+
+class ScanReport:
+    """
+    Tracks which devices the backend knows about, so scans only report what changed.
+
+    Every payload carries a sequence number. A full payload lists every device under
+    "devices"; a delta lists new and changed devices under "devices" and the MAC
+    addresses of devices that are gone under "removed". The first payload after a
+    start, the first after a failed post and one every FULL_RESYNC_INTERVAL seconds
+    are full, so the backend recovers from anything it missed. Only the identity
+    fields are compared: a new RSSI alone does not make a device changed.
+
+    A backend that does not know about deltas would take one for the complete device
+    list, so every payload is full until deltas are enabled, either up front or by
+    the backend echoing a sequence number in its response.
+    """
+
+    def __init__(self, full_resync_interval=FULL_RESYNC_INTERVAL, deltas=False):
+        self.full_resync_interval = full_resync_interval
+        self.deltas = deltas
+        self.lock = threading.Lock()
+        self.sequence = 0
+        self.reported = {}  # mac_address -> identity tuple the backend acknowledged
+        self.last_full = None  # time.monotonic() of the last acknowledged full payload
+        self.pending = None  # (sequence, identities, full, time) of the payload in flight
+
+
+    @staticmethod
+    def identity(record) -> tuple:
+        return tuple(record.get(field) for field in IDENTITY_FIELDS)
+
+
+    def build(self, records, now=None) -> dict:
+        """The payload for the current device records (dicts as sent to the backend)."""
+        now = time.monotonic() if now is None else now
+        current = {record['mac_address']: record for record in records}
+        with self.lock:
+            self.sequence += 1
+            full = (not self.deltas or self.last_full is None
+                    or now - self.last_full >= self.full_resync_interval)
+            if full:
+                devices = list(current.values())
+                removed = []
+            else:
+                devices = [record for mac, record in current.items()
+                           if self.reported.get(mac) != self.identity(record)]
+                removed = [mac for mac in self.reported if mac not in current]
+            self.pending = (self.sequence, {mac: self.identity(record) for mac, record in current.items()}, full, now)
+            sequence = self.sequence
+
+        SCAN_REPORTS.labels('full' if full else 'delta').inc()
+        SCAN_REPORT_DEVICES.labels('upsert').inc(len(devices))
+        SCAN_REPORT_DEVICES.labels('removed').inc(len(removed))
+        payload = {"sequence": sequence, "full": full, "devices": devices}
+        if not full:
+            payload["removed"] = removed
+        return payload
+
+
+    def acknowledge(self, sequence, echoed=None) -> None:
+        """
+        The backend accepted the payload with this sequence number. A backend that
+        echoes it back (echoed) understands sequences, and from now on gets deltas.
+        """
+        with self.lock:
+            if self.pending is None or self.pending[0] != sequence:
+                return
+            if echoed is not None and echoed == sequence:
+                self.deltas = True
+            _, self.reported, full, now = self.pending
+            if full:
+                self.last_full = now
+            self.pending = None
+
+
+    def reject(self, sequence) -> None:
+        """The payload may not have arrived: the next one is a full resync."""
+        with self.lock:
+            if self.pending is not None and self.pending[0] == sequence:
+                self.pending = None
+            self.last_full = None
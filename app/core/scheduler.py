@@ -0,0 +1,90 @@
+import heapq
+import random
+import threading
+import time
+
+
+class Scheduler:
+    """
+    Priority queue of items keyed by their next due time (time.monotonic()).
+
+    pop_due() sleeps exactly until the earliest item is due; scheduling an earlier
+    item wakes it up. Each key is scheduled at most once: a popped item is out of the
+    heap until its owner schedules it again, so work still in progress can never be
+    queued a second time. Adding and popping are O(log n), so tens of thousands of
+    items cost nothing while none of them is due.
+    """
+
+    def __init__(self):
+        self.heap = []  # (due, sequence, key)
+        self.items = {}  # key -> (item, sequence) for scheduled keys
+        self.sequence = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+
+    def __len__(self):
+        return len(self.items)
+
+
+    def schedule(self, key, item, due, spread=0.0) -> bool:
+        """Schedules item at due, moved randomly by up to +-spread seconds. False if key is already scheduled."""
+        if spread:
+            due += random.uniform(-spread, spread)
+        with self.condition:
+            if self.closed or key in self.items:
+                return False
+            self.sequence += 1
+            self.items[key] = (item, self.sequence)
+            heapq.heappush(self.heap, (due, self.sequence, key))
+            if self.heap[0][1] == self.sequence:
+                # New earliest item: the waiter has to recompute its sleep
+                self.condition.notify()
+            return True
+
+
+    def cancel(self, key) -> None:
+        with self.condition:
+            # The heap entry is skipped when it comes up
+            self.items.pop(key, None)
+
+
+    def overdue(self) -> int:
+        """Number of scheduled items whose due time has passed."""
+        now = time.monotonic()
+        with self.condition:
+            return sum(1 for due, sequence, key in self.heap
+                       if due <= now and self.items.get(key, (None, None))[1] == sequence)
+
+
+    def pop_due(self, timeout=None):
+        """
+        Blocks until an item is due and returns (key, item, due).
+        Returns None on timeout or once the scheduler is closed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while not self.closed:
+                while self.heap and self.items.get(self.heap[0][2], (None, None))[1] != self.heap[0][1]:
+                    heapq.heappop(self.heap)  # Cancelled or rescheduled entry
+                now = time.monotonic()
+                if self.heap and self.heap[0][0] <= now:
+                    due, _, key = heapq.heappop(self.heap)
+                    item, _ = self.items.pop(key)
+                    return key, item, due
+                wait = None if not self.heap else self.heap[0][0] - now
+                if deadline is not None:
+                    if now >= deadline:
+                        return None
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                self.condition.wait(wait)
+            return None
+
+
+    def close(self) -> None:
+        """Wakes all waiters; pop_due() returns None from now on."""
+        with self.condition:
+            self.closed = True
+            self.items.clear()
+            self.heap.clear()
+            self.condition.notify_all()
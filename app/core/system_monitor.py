@@ -0,0 +1,283 @@
+import json
+import logging
+import subprocess
+import threading
+import time
+from collections import deque
+from queue import Queue, Full
+from core.network_state import NetworkState
+from log.log import CloudLogger
+
+
+THERMAL_ZONE = "/sys/class/thermal/thermal_zone0/temp"
+PROC_MEMINFO = "/proc/meminfo"
+DEVICE_MODEL = "/sys/firmware/devicetree/base/model"
+HUB_STATUS_FILE = "log/logs/hub_status.json"
+
+# Cloud log lines are cleared by the hub on every ping, so keep our own tail
+recent_logs = deque(maxlen=20)
+
+
+def read_file(path) -> str:
+    """Reads a small /proc or /sys file and returns its stripped content."""
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def run_command(command, timeout=5) -> str:
+    """Runs a command and returns the output, or an empty string on failure."""
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, check=True, timeout=timeout)
+        return result.stdout.strip()
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+        logging.debug(f"Command '{' '.join(command)}' failed: {e}")
+        return ""
+
+
+def read_temperature() -> float:
+    """SoC temperature in °C from the sysfs thermal zone (millidegrees)."""
+    value = read_file(THERMAL_ZONE)
+    if value:
+        return round(int(value) / 1000, 1)
+    output = run_command(['vcgencmd', 'measure_temp'])
+    if '=' in output:
+        return float(output.split('=')[1].split('\'')[0])
+    return 0.0
+
+
+def read_system_voltage() -> str:
+    output = run_command(['vcgencmd', 'measure_volts', 'core'])
+    if '=' in output:
+        return output.split('=')[1].split('V')[0]
+    return "N/A"
+
+
+def read_memory_usage() -> float:
+    """Used memory in percent, computed from MemTotal and MemAvailable."""
+    meminfo = {}
+    for line in read_file(PROC_MEMINFO).splitlines():
+        key, _, value = line.partition(':')
+        meminfo[key] = int(value.split()[0])
+    total = meminfo.get('MemTotal', 0)
+    if not total:
+        return 0
+    return round((total - meminfo.get('MemAvailable', total)) / total * 100, 0)
+
+
+def read_connection_status() -> str:
+    output = run_command(['ping', '-I', 'wlan0', '-c', '1', '-W', '2', 'google.com'])
+    return "Connected" if output else ""
+
+
+def read_service_status(service='SmarthubManager.service') -> str:
+    output = run_command(['systemctl', 'is-active', service])
+    return "Running" if output == "active" else "Stopped"
+
+
+def read_recent_logs() -> list:
+    try:
+        lines = CloudLogger().get_recent_logs(recent_logs.maxlen)
+    except OSError:
+        return list(recent_logs)
+    for line in lines:
+        line = line.rstrip()
+        if line and line not in recent_logs:
+            recent_logs.append(line)
+    return list(recent_logs)
+
+
+def read_hub_status() -> dict:
+    """Status last written by the hub process."""
+    try:
+        with open(HUB_STATUS_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def read_plugin_devices() -> dict:
+    """Device count per plugin."""
+    return read_hub_status().get('plugins', {})
+
+
+def read_plugin_stats() -> dict:
+    """CPU, threads, events, errors and memory per plugin, see core/plugin_stats.py."""
+    return read_hub_status().get('plugin_stats', {})
+
+
+class SystemMonitor:
+    """
+    Samples system metrics in a background thread and caches the results.
+
+    Every metric has its own sampling interval. Cheap values are read directly from
+    /proc and /sys, the few that still need a subprocess are sampled less often.
+    Readers never block on sampling: they get the last cached value.
+
+    Network metrics come from a NetworkState and are resampled as soon as it
+    reports a change; the Wi-Fi signal strength only on its own interval.
+
+    Subscribers get a queue that receives only the metrics that changed since the
+    previous sampling pass, so any number of dashboard clients share one sampler.
+    """
+
+    NETWORK_METRICS = ('current_ethernet', 'signal_strength', 'current_ssid', 'ip_address', 'connection_status')
+
+    def __init__(self, samplers=None, network=None):
+        self.network = network or NetworkState()
+        # name -> (interval in seconds, function)
+        self.samplers = samplers or {
+            'temperature': (5, read_temperature),
+            'memory_usage': (5, read_memory_usage),
+            'current_ethernet': (30, self.read_ethernet_status),
+            'signal_strength': (30, self.read_wifi_signal),
+            'current_ssid': (30, self.read_current_ssid),
+            'ip_address': (30, self.read_ip_address),
+            'service_status': (10, read_service_status),
+            'connection_status': (30, read_connection_status),
+            'system_voltage': (60, read_system_voltage),
+            'recent_logs': (2, read_recent_logs),
+            'plugin_devices': (5, read_plugin_devices),
+            'plugin_stats': (5, read_plugin_stats),
+        }
+        self.cache = {}  # name -> (timestamp, value)
+        self.next_due = {name: 0 for name in self.samplers}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.wake_event = threading.Event()
+        self.thread = None
+        self.subscribers = []
+        self.changes = {}
+
+
+    def read_ethernet_status(self) -> str:
+        return "Connected" if self.network.is_ethernet_connected() else "Disconnected"
+
+
+    def read_wifi_signal(self) -> str:
+        rssi = self.network.rssi
+        return str(rssi) if rssi is not None else "N/A"
+
+
+    def read_current_ssid(self) -> str:
+        return self.network.ssid
+
+
+    def read_ip_address(self) -> str:
+        return " ".join(self.network.ip_addresses())
+
+
+    def on_network_change(self, snapshot) -> None:
+        for name in self.NETWORK_METRICS:
+            self.refresh(name)
+
+
+    def add_sampler(self, name, interval, function) -> None:
+        self.samplers[name] = (interval, function)
+        self.next_due[name] = 0
+
+
+    def start(self) -> None:
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.network.subscribe(self.on_network_change)
+        self.network.start()
+        self.thread = threading.Thread(target=self.run, name="SystemMonitor", daemon=True)
+        self.thread.start()
+
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        self.wake_event.set()
+        if self.thread:
+            self.thread.join(timeout=5.0)
+        self.thread = None
+        self.network.unsubscribe(self.on_network_change)
+        self.network.stop()
+
+
+    def run(self) -> None:
+        while not self.stop_event.is_set():
+            now = time.monotonic()
+            for name, (interval, function) in self.samplers.items():
+                if self.next_due[name] <= now:
+                    self.sample(name, function)
+                    self.next_due[name] = now + interval
+            self.publish()
+            wait = min(self.next_due.values()) - time.monotonic()
+            self.wake_event.wait(max(wait, 0.1))
+            self.wake_event.clear()
+
+
+    def refresh(self, name) -> None:
+        """Request an immediate resample of a metric, e.g. after a state-changing action."""
+        if name in self.next_due:
+            self.next_due[name] = 0
+            self.wake_event.set()
+
+
+    def sample(self, name, function) -> None:
+        try:
+            value = function()
+        except Exception as e:
+            logging.error(f"Failed to sample {name}: {e}")
+            return
+        with self.lock:
+            previous = self.cache.get(name)
+            self.cache[name] = (time.time(), value)
+            if previous is None or previous[1] != value:
+                self.changes[name] = value
+
+
+    def subscribe(self, maxsize=32, limit=None):
+        """A queue receiving every published delta, or None if `limit` subscribers exist already."""
+        subscriber = Queue(maxsize=maxsize)
+        with self.lock:
+            if limit is not None and len(self.subscribers) >= limit:
+                return None
+            self.subscribers.append(subscriber)
+        return subscriber
+
+
+    def unsubscribe(self, subscriber) -> None:
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+
+    def publish(self) -> None:
+        """Push the metrics changed in the last pass to every subscriber."""
+        with self.lock:
+            if not self.changes:
+                return
+            delta, self.changes = self.changes, {}
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(delta)
+            except Full:
+                # Slow client: drop its backlog and let it resync from a full snapshot
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait(self.snapshot())
+
+
+    def get(self, name, default=None):
+        with self.lock:
+            entry = self.cache.get(name)
+        return entry[1] if entry else default
+
+
+    def age(self, name) -> float:
+        """Seconds since the metric was last sampled, or None if never sampled."""
+        with self.lock:
+            entry = self.cache.get(name)
+        return time.time() - entry[0] if entry else None
+
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {name: value for name, (_, value) in self.cache.items()}
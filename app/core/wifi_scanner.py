@@ -0,0 +1,112 @@
+import logging
+import subprocess
+import threading
+import time
+
+
+def parse_iwlist(output, min_signal_strength=-70) -> list:
+    """
+    Parses `iwlist <interface> scan` output in a single pass.
+    Returns (ssid, signal strength in dBm) tuples, strongest first, one entry per SSID.
+    """
+    strongest = {}
+    essid = signal_strength = None
+
+    def add_cell():
+        if essid and signal_strength is not None and signal_strength >= min_signal_strength:
+            if signal_strength > strongest.get(essid, -1000):
+                strongest[essid] = signal_strength
+
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith('Cell '):
+            add_cell()
+            essid = signal_strength = None
+        elif line.startswith('ESSID:'):
+            essid = line[6:].strip().strip('"')
+        elif 'Signal level=' in line:
+            level = line.split('Signal level=', 1)[1].split(None, 1)[0]
+            try:
+                # Either "-40 dBm" or a relative "70/100"
+                signal_strength = int(level.split('/')[0])
+            except ValueError:
+                signal_strength = None
+    add_cell()
+
+    return sorted(strongest.items(), key=lambda network: network[1], reverse=True)
+
+
+def scan_wifi_networks(interface='wlan0', min_signal_strength=-70, timeout=5) -> list:
+    """Runs a blocking scan. Returns None if the scan itself failed."""
+    try:
+        result = subprocess.run(['iwlist', interface, 'scan'], capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logging.error(f"Wi-Fi scan timed out after {timeout} seconds.")
+        return None
+    except OSError as e:
+        logging.error(f"Failed to scan Wi-Fi networks: {e}")
+        return None
+    if result.returncode != 0:
+        logging.debug(f"Wi-Fi scan failed: {result.stderr.strip()}")
+        return None
+    return parse_iwlist(result.stdout, min_signal_strength)
+
+
+class WifiScanner:
+    """
+    Keeps a cache of nearby Wi-Fi networks, refreshed by a background thread.
+
+    Readers get the cached list immediately. A stale cache or an explicit
+    request_scan() wakes the scanner; concurrent requests coalesce into one scan.
+    A failed scan (e.g. while wlan0 runs the hotspot) keeps the previous result.
+    """
+
+    def __init__(self, interface='wlan0', refresh_interval=60, min_signal_strength=-70):
+        self.interface = interface
+        self.refresh_interval = refresh_interval
+        self.min_signal_strength = min_signal_strength
+        self.networks = []
+        self.last_scan = None
+        self.scanning = False
+        self.scan_requested = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+
+    def start(self) -> None:
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="WifiScanner", daemon=True)
+        self.thread.start()
+
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        self.scan_requested.set()
+        if self.thread:
+            self.thread.join(timeout=10.0)
+        self.thread = None
+
+
+    def run(self) -> None:
+        while not self.stop_event.is_set():
+            self.scanning = True
+            networks = scan_wifi_networks(self.interface, self.min_signal_strength)
+            self.scanning = False
+            if networks is not None:
+                self.networks = networks
+                self.last_scan = time.time()
+            self.scan_requested.wait(self.refresh_interval)
+            self.scan_requested.clear()
+
+
+    def request_scan(self) -> None:
+        self.scan_requested.set()
+
+
+    def get_networks(self, max_age=None) -> list:
+        """Cached networks. Schedules a background rescan if older than max_age seconds."""
+        if max_age is not None and not self.scanning and (self.last_scan is None or time.time() - self.last_scan > max_age):
+            self.request_scan()
+        return self.networks
@@ -42,7 +42,22 @@ def get_hardware_id() -> str:
 @click.option('--serial-number', help='The serial number of the hub', default='')
 @click.option('--auto-scan', help='Automatically scan for devices', default=False, is_flag=True)
 @click.option('--auto-collect', help='Automatically collect data from emulator device', default=False, is_flag=True)
-def main(log_level, serial_number, auto_scan, auto_collect):
+@click.option('--isolate-plugins', help='Run each plugin in its own worker process', default=False, is_flag=True)
+@click.option('--trace-memory', help='Track memory allocated by each plugin (slows the hub down)', default=False, is_flag=True)
+@click.option('--ble-capture', help='Record received BLE advertisements to this file', default='', metavar='PATH')
+@click.option('--ble-replay', help='Replay BLE advertisements from a capture file instead of using the radio', default='', metavar='PATH')
+@click.option('--ble-replay-speed', help='Replay speed factor, 0 = as fast as possible', default=1.0, type=float)
+@click.option('--ble-simulate', help='Use simulated BLE devices from this file instead of the radio', default='', metavar='PATH')
+@click.option('--load-test', help='Send emulated data through the backend client at a fixed rate, report throughput and latency, then exit', default=False, is_flag=True)
+@click.option('--load-devices', help='Number of emulated devices in the load test', default=100, type=int)
+@click.option('--load-rate', help='Target messages per second in the load test', default=10.0, type=float)
+@click.option('--load-ramp', help='Seconds to ramp up linearly to the target rate', default=0.0, type=float)
+@click.option('--load-duration', help='Duration of the load test in seconds', default=60.0, type=float)
+@click.option('--mock-backend', help='Run the load test against a local mock of the backend API', default=False, is_flag=True)
+@click.option('--mock-latency', help='Seconds the mock backend waits before answering', default=0.0, type=float)
+@click.option('--mock-error-rate', help='Fraction of requests the mock backend fails', default=0.0, type=float)
+def main(log_level, serial_number, auto_scan, auto_collect, isolate_plugins, trace_memory,
+         ble_capture, ble_replay, ble_replay_speed, ble_simulate, load_test, load_devices, load_rate, load_ramp, load_duration, mock_backend, mock_latency, mock_error_rate):
     setup_logging(log_level)
 
     if serial_number == '':
@@ -59,27 +74,28 @@ def main(log_level, serial_number, auto_scan, auto_collect):
     logging.info(f"Hostname: {hostname}")
     logging.info("Control panel: http://" + hostname + ".local")
 
-
-    hub = Hub(serial_number)
+    # Environment, so isolated plugin workers pick it up too (see core/ble.py)
+    if ble_replay:
+        os.environ['HUB_BLE_REPLAY'] = os.path.abspath(ble_replay)
+        os.environ['HUB_BLE_REPLAY_SPEED'] = str(ble_replay_speed)
+    elif ble_capture:
+        os.environ['HUB_BLE_CAPTURE'] = os.path.abspath(ble_capture)
+    if ble_simulate:
+        os.environ['HUB_BLE_SIMULATION'] = os.path.abspath(ble_simulate)
+
+    if load_test:
+        from plugins.null_load import run_load_test
+        run_load_test(serial_number, load_devices, load_rate, load_ramp, load_duration,
+                      mock=mock_backend, mock_latency=mock_latency, mock_error_rate=mock_error_rate)
+        os._exit(0)
+
+    hub = Hub(serial_number, isolate_plugins=isolate_plugins, trace_memory=trace_memory)
     
     if auto_scan:
         hub.command = "scan_devices"
 
-    # delay before starting the loop
-    startup_delay = 15
-    # ping google
-    res = os.system("ping -c 1 google.com")
-    if res == 0:
-        startup_delay = 0
-    else:
-        logging.info(f"Startup delayed to allow for network connection to be established")
-        
-    while startup_delay > 0:
-        logging.info(f"Starting in {startup_delay} seconds...")
-        time.sleep(1)
-        startup_delay -= 1
-    
-    if hub.startup(): 
+    # Waits for an actual link/address event instead of a fixed delay
+    if hub.startup(network_timeout=15): 
         hub.loop(auto_collect, period=5)
     else:
         logging.error("Failed to start Smart Hub.")
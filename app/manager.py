@@ -1,7 +1,11 @@
 import os
 import gpiod
 import time
+import heapq
+import signal
+import selectors
 import subprocess
+from core.network_state import NetworkState
 
 # Determine the script's directory
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -11,123 +15,215 @@ main_py = os.path.join(script_dir, 'main.py')
 portal_py = os.path.join(script_dir, 'portal.py')
 
 START_AP_PIN = 26
+NETWORK_CHECK_DELAY = 60  # seconds after startup before falling back to the hotspot
+MAX_RESTART_BACKOFF = 60  # seconds
+STABLE_RUNTIME = 60  # a child running this long resets its backoff
+
+
+class Child:
+    """A supervised child process."""
+    def __init__(self, name, script, restart=True):
+        self.name = name
+        self.script = script
+        self.restart = restart
+        self.process = None
+        self.started_at = None
+        self.backoff = 1
+
+    def is_running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(self) -> None:
+        print(f"Starting {self.name}...")
+        self.process = subprocess.Popen(['python3', self.script], cwd=script_dir)
+        self.started_at = time.monotonic()
+
+    def stop(self, timeout=10) -> None:
+        if not self.is_running():
+            return
+        print(f"Stopping {self.name}...")
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class Supervisor:
+    """
+    Event-driven supervisor for the hub and the captive portal.
+
+    Holds the child process handles and sleeps in a selector until something happens:
+    SIGCHLD (via the signal wakeup fd) when a child exits, a GPIO edge on the portal
+    button line, or a scheduled timer. Nothing is forked while the children are healthy.
+    """
+
+    def __init__(self, line):
+        self.line = line
+        self.hub = Child('hub', main_py, restart=True)
+        self.portal = Child('portal', portal_py, restart=False)
+        self.children = [self.hub, self.portal]
+        self.timers = []  # heap of (due, sequence, callback)
+        self.timer_sequence = 0
+        self.running = True
+        self.network = NetworkState()
+
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_read, wakeup_write = os.pipe()
+        os.set_blocking(self.wakeup_read, False)
+        os.set_blocking(wakeup_write, False)
+        signal.set_wakeup_fd(wakeup_write)
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        signal.signal(signal.SIGTERM, self.on_terminate)
+        signal.signal(signal.SIGINT, self.on_terminate)
+        self.selector.register(self.wakeup_read, selectors.EVENT_READ, self.on_signal)
+        self.selector.register(self.line.event_get_fd(), selectors.EVENT_READ, self.on_gpio_event)
+
+
+    def schedule(self, delay, callback) -> None:
+        self.timer_sequence += 1
+        heapq.heappush(self.timers, (time.monotonic() + delay, self.timer_sequence, callback))
+
+
+    def run(self) -> None:
+        self.network.start()
+        self.hub.start()
+        if self.line.get_value() == 1:
+            self.start_portal()
+        self.schedule(NETWORK_CHECK_DELAY, lambda: check_network(self))
+
+        while self.running:
+            timeout = None
+            if self.timers:
+                timeout = max(0, self.timers[0][0] - time.monotonic())
+            for key, _ in self.selector.select(timeout):
+                key.data()
+            while self.timers and self.timers[0][0] <= time.monotonic():
+                _, _, callback = heapq.heappop(self.timers)
+                callback()
+
+        for child in self.children:
+            child.stop()
+        self.network.stop()
+
+
+    def on_signal(self) -> None:
+        try:
+            while os.read(self.wakeup_read, 512):
+                pass
+        except BlockingIOError:
+            pass
+        self.reap_children()
+
+
+    def reap_children(self) -> None:
+        for child in self.children:
+            if child.process is None or child.process.poll() is None:
+                continue
+            returncode = child.process.returncode
+            runtime = time.monotonic() - child.started_at
+            child.process = None
+            print(f"{child.name} exited with code {returncode} after {runtime:.0f} seconds")
+            if not child.restart or not self.running:
+                continue
+            if runtime >= STABLE_RUNTIME:
+                child.backoff = 1
+            print(f"Restarting {child.name} in {child.backoff} seconds...")
+            self.schedule(child.backoff, lambda child=child: self.restart_child(child))
+            child.backoff = min(child.backoff * 2, MAX_RESTART_BACKOFF)
+
+
+    def restart_child(self, child) -> None:
+        if self.running and not child.is_running():
+            child.start()
+
+
+    def on_gpio_event(self) -> None:
+        event = self.line.event_read()
+        if event.type == gpiod.LineEvent.RISING_EDGE:
+            self.start_portal()
+
+
+    def start_portal(self) -> None:
+        if not self.portal.is_running():
+            self.portal.start()
+
+
+    def on_terminate(self, signum, frame) -> None:
+        self.running = False
+
+
+def check_network(supervisor):
+    """After startup: start the hotspot without Wi-Fi, otherwise resolve hostname conflicts."""
+    if not supervisor.network.is_wifi_connected():
+        print("No WiFi connection detected. Starting hotspot...")
+        supervisor.start_portal()
+    else:
+        resolve_hostname_conflict()
+
+
+def resolve_hostname_conflict():
+    print("Checking for hostname conflict...")
+    hostname = subprocess.run(['hostname'], stdout=subprocess.PIPE).stdout.decode().strip()
+    # If there are any other devices with my hostname, change my hostname by adding a numeric suffix
+    if subprocess.run(['ping', '-c', '1', f'{hostname}.local'], stdout=subprocess.PIPE).returncode != 0:
+        return
+
+    print("Hostname conflict detected. Changing hostname...")
+    hostname_suffix = 1
+    while subprocess.run(['ping', '-c', '1', f'{hostname}-{hostname_suffix}.local'], stdout=subprocess.PIPE).returncode == 0:
+        hostname_suffix += 1
 
-chip = gpiod.Chip('gpiochip4')
-line = chip.get_line(START_AP_PIN)
-line.request(consumer='manager', type=gpiod.LINE_REQ_DIR_OUT, default_vals=[0])
+    new_hostname = f'{hostname}{hostname_suffix}'
 
-def is_portal_running():
-    result = subprocess.run(['pgrep', '-f', 'portal.py'], stdout=subprocess.PIPE)
-    return result.stdout != b''
+    # Update hostname
+    subprocess.run(['hostnamectl', 'set-hostname', new_hostname])
 
-def start_portal():
-    subprocess.run(['python3', portal_py])
-
-def stop_portal():
-    subprocess.run(['pkill', '-f', 'portal.py'])
-
-def is_hub_running():
-    result = subprocess.run(['pgrep', '-f', 'main.py'], stdout=subprocess.PIPE)
-    return result.stdout != b''
-
-def start_hub():
-    subprocess.run(['python3', main_py])
-
-def stop_hub():
-    subprocess.run(['pkill', '-f', 'main.py'])
-
-def ensure_hub_running():
-    """Ensure exactly one instance of the hub is running."""
-    if not is_hub_running():
-        print("Starting hub...")
-        start_hub()
+    # Update /etc/hosts file
+    try:
+        # Read current hosts file
+        with open('/etc/hosts', 'r') as file:
+            hosts_content = file.readlines()
+
+        # Create new hosts content
+        new_hosts_content = []
+        for hosts_line in hosts_content:
+            if hosts_line.startswith('127.0.0.1'):
+                # Keep the IP and 'localhost', add new hostname
+                new_hosts_content.append(f'127.0.0.1\tlocalhost {new_hostname}\n')
+            elif hosts_line.startswith('::1'):
+                new_hosts_content.append(f'::1\tlocalhost {new_hostname}\n')
+            else:
+                new_hosts_content.append(hosts_line)
+
+        # Write new hosts file
+        with open('/etc/hosts', 'w') as file:
+            file.writelines(new_hosts_content)
+
+        print(f"Hostname changed to {new_hostname} and /etc/hosts updated. Rebooting...")
+        subprocess.run(['reboot'])
 
-def is_wifi_connected():
-    result = subprocess.run(['iwgetid', '-r'], stdout=subprocess.PIPE)
-    ssid = result.stdout.decode().strip()
-    connection_status = subprocess.run(['ping', '-I', 'wlan0', '-c', '1', '8.8.8.8'], stdout=subprocess.PIPE)
-    if connection_status.returncode == 0:
-        return True
-    return ssid != ''
+    except Exception as e:
+        print(f"Error updating /etc/hosts: {e}")
+        # Still reboot even if hosts file update fails
+        subprocess.run(['reboot'])
 
 
 if __name__ == '__main__':
+    chip = gpiod.Chip('gpiochip4')
+    line = chip.get_line(START_AP_PIN)
+    line.request(consumer='manager', type=gpiod.LINE_REQ_EV_RISING_EDGE)
+
     try:
-        network_check_delay = 0
-        while True:
-            ensure_hub_running()
-
-            if line.get_value() == 1 and not is_portal_running():
-                print("Starting portal...")
-                start_portal()
-            
-            time.sleep(2)  
-
-            if network_check_delay == 30: # After 60 seconds, the script will check if the WiFi connection is established. If not, it will start the hotspot.
-                if not is_wifi_connected():
-                    print("No WiFi connection detected. Starting hotspot...")
-                    if not is_portal_running():
-                        start_portal()
-
-                else:
-                    print("Checking for hostname conflict...")
-                    hostname = subprocess.run(['hostname'], stdout=subprocess.PIPE).stdout.decode().strip()
-                    # If there are any other devices with my hostname, change my hostname by adding a numeric suffix
-                    if subprocess.run(['ping', '-c', '1', f'{hostname}.local'], stdout=subprocess.PIPE).returncode == 0:
-                        print("Hostname conflict detected. Changing hostname...")
-                        hostname_suffix = 1
-                        while subprocess.run(['ping', '-c', '1', f'{hostname}-{hostname_suffix}.local'], stdout=subprocess.PIPE).returncode == 0:
-                            hostname_suffix += 1
-                        
-                        new_hostname = f'{hostname}{hostname_suffix}'
-                        
-                        # Update hostname
-                        subprocess.run(['hostnamectl', 'set-hostname', new_hostname])
-                        
-                        # Update /etc/hosts file
-                        try:
-                            # Read current hosts file
-                            with open('/etc/hosts', 'r') as file:
-                                hosts_content = file.readlines()
-                            
-                            # Create new hosts content
-                            new_hosts_content = []
-                            for line in hosts_content:
-                                if line.startswith('127.0.0.1') or line.startswith('::1'):
-                                    # Split the line into parts
-                                    parts = line.split()
-                                    # Keep the IP and 'localhost', add new hostname
-                                    if line.startswith('127.0.0.1'):
-                                        new_hosts_content.append(f'127.0.0.1\tlocalhost {new_hostname}\n')
-                                    else:  # ::1
-                                        new_hosts_content.append(f'::1\tlocalhost {new_hostname}\n')
-                                else:
-                                    new_hosts_content.append(line)
-                            
-                            # Write new hosts file
-                            with open('/etc/hosts', 'w') as file:
-                                file.writelines(new_hosts_content)
-                            
-                            print(f"Hostname changed to {new_hostname} and /etc/hosts updated. Rebooting...")
-                            subprocess.run(['reboot'])
-                            
-                        except Exception as e:
-                            print(f"Error updating /etc/hosts: {e}")
-                            # Still reboot even if hosts file update fails
-                            subprocess.run(['reboot'])
-
-
-            network_check_delay += 1
+        Supervisor(line).run()
 
     except Exception as e:
         print("Error in manager: ", e)
-        line.release()
-        chip.close()
 
     except KeyboardInterrupt:
-        line.release()
-        chip.close()
+        pass
 
     finally:
         line.release()
-        chip.close()
\ No newline at end of file
+        chip.close()
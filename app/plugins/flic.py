@@ -2,7 +2,8 @@ import logging
 from core.plugin_interface import PluginInterface
 from core.backend import ApiBackend
 from core.flow import Flow
-from bleak import BleakClient, BleakGATTCharacteristic
+from bleak import BleakGATTCharacteristic
+from core.ble import create_client
 import asyncio
 from plugins.flic_assistant import FlicClient, ScanWizard, ScanWizardResult
 
@@ -78,7 +79,7 @@ class flic(PluginInterface):
 
 
         async def connect_and_subscribe(self):
-            async with BleakClient(self.mac_address) as client:                
+            async with create_client(self.mac_address) as client:                
                 logging.info(f"Connected to {self.mac_address} - {self.device_name}")
 
             #     await self.introspect(client)
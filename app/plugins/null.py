@@ -2,19 +2,26 @@ import logging
 from core.plugin_interface import PluginInterface
 from config.config import ConfigSettings as config
 from datetime import datetime
-from math import sin, cos, pi
 from core.backend import ApiBackend
 from core.flow import Flow
+from core import metrics, plugin_stats
+from core.scheduler import Scheduler
+from plugins.null_devices import DeviceTable
 import random
-from hashlib import md5
 import yaml
 import os
 import time
 
-from typing import Dict, Any
 import threading
 from queue import Queue, Empty
 
+QUEUE_DEPTH = metrics.gauge('null_queue_depth', 'Emulated devices waiting for a worker')
+MESSAGES_SENT = metrics.counter('null_messages_sent', 'Emulated data points sent to the backend', ['result'])
+
+SCHEDULE_JITTER = 0.1  # each emission moves randomly by up to this fraction of the device interval
+MAX_BATCH = 1000  # devices generated together when several are due at once
+
+
 class null(PluginInterface):
     def __init__(self, api: ApiBackend, flow: Flow):
         self.protocol = "BLE"
@@ -25,7 +32,11 @@ class null(PluginInterface):
         self.active = False
 
         self.device_queue = Queue()
+        self.scheduler = Scheduler()
         self.workers = []
+        self.stop_event = threading.Event()
+        self.stop_lock = threading.Lock()
+        QUEUE_DEPTH.set_function(self.device_queue.qsize)
 
         # Read the sensor configuration file path from the main config
         config_file_path = self.config.get('settings', 'sensor_config_file')
@@ -34,11 +45,11 @@ class null(PluginInterface):
         with open(config_file_path, 'r') as f:
             sensor_configs = yaml.safe_load(f)
 
-        for sensor_info in sensor_configs['sensors']:
-            device = self.Device(sensor_info)
-            self.devices[device.mac_address] = device
+        # Compiled once: identity columns, intervals and signal parameters of all devices
+        self.table = DeviceTable(sensor_configs['sensors'] or [], self.config.get('settings', 'hub_serial_no'))
+        self.devices = {address: self.Device(self.table, row) for address, row in self.table.rows.items()}
 
-    def associate_flow_node(self, device):
+    def associate_flow_node(self, device=None):
         pass
 
 
@@ -46,22 +57,28 @@ class null(PluginInterface):
         """Worker thread that processes devices from the queue"""
         while self.active:
             try:
-                device, current_time = queue.get(timeout=1.0)
+                item = queue.get(timeout=1.0)
+                if item is None:
+                    # Wake-up from stop()
+                    queue.task_done()
+                    break
+                row, timestamp, gateway_time, due, values = item
                 
                 try:
-                    device.generate_emulated_data()
-                    device.last_execution_time = current_time
-                    
-                    jsn_data = self.prepare_json_data(device, current_time)
-                    
-                    self.api.send_collected_data(jsn_data)
-                    logging.debug(f"Data from {device.device_name}: {device.data}")
+                    sent = self.api.send_collected_data(self.table.payload(row, values, gateway_time))
+                    MESSAGES_SENT.labels("ok" if sent else "failed").inc()
+                    self.table.last_sent[row] = timestamp
+                    logging.debug(f"Data from {self.table.names[row]}: {values}")
                     
                 except Exception as e:
-                    logging.error(f"Error processing device {device.device_name}: {str(e)}")
+                    logging.error(f"Error processing device {self.table.names[row]}: {str(e)}")
                 
                 finally:
                     queue.task_done()
+                    # Only now back in the schedule, so a device is never queued twice
+                    interval = self.table.intervals[row]
+                    next_due = max(due + interval, time.monotonic())
+                    self.scheduler.schedule(row, None, next_due, spread=interval * SCHEDULE_JITTER)
                     
             except Empty:
                 continue
@@ -71,12 +88,22 @@ class null(PluginInterface):
                 time.sleep(1)  # Prevent tight loop in case of repeated errors
 
 
-    # New execute method with queue-based processing
     def execute(self) -> None:
-        """Main execution loop using queue-based processing"""
+        """Dispatches devices to the worker threads as they become due"""
         if not self.active:
             logging.info("Starting null plugin with queue-based processing")
             self.active = True
+            self.stop_event.clear()
+            # Fresh queue: wake-ups from a previous stop() may still be queued
+            self.device_queue = Queue()
+            QUEUE_DEPTH.set_function(self.device_queue.qsize)
+
+            # First emissions are spread over the jitter window to avoid a thundering herd,
+            # without leaving devices with long intervals silent for most of an interval
+            self.scheduler = Scheduler()
+            now = time.monotonic()
+            for row, interval in enumerate(self.table.intervals):
+                self.scheduler.schedule(row, None, now + random.uniform(0, interval * SCHEDULE_JITTER))
             
             # Create worker threads
             num_workers = min(4, len(self.devices))
@@ -95,62 +122,86 @@ class null(PluginInterface):
             
             logging.info(f"Started {num_workers} worker threads")
             
-            # Main loop
+            # Main loop: sleeps until the next device is due
             try:
-                while self.active:
-                    current_time = datetime.now(tz=None)
-                    
-                    # Add devices that need processing to the queue
-                    for device in self.devices.values():
-                        if device.last_execution_time is None or \
-                        (current_time - device.last_execution_time).total_seconds() >= device.interval:
-                            self.device_queue.put((device, current_time))
-                    
-                    time.sleep(1)
+                while self.active and not self.stop_event.is_set():
+                    entry = self.scheduler.pop_due()
+                    if entry is None:
+                        break  # Scheduler closed by stop() or drain()
+                    # Take every other device that is due as well and generate them together
+                    batch = [entry]
+                    while len(batch) < MAX_BATCH:
+                        entry = self.scheduler.pop_due(timeout=0)
+                        if entry is None:
+                            break
+                        batch.append(entry)
+                    self.dispatch(batch)
+                    # execute() runs until stopped: each dispatched batch counts as a successful execute
+                    plugin_stats.record_execute()
                     
             except Exception as e:
                 logging.error(f"Main loop error: {str(e)}")
-                self.active = False
                 
             finally:
                 # Cleanup when stopping
                 self.stop()
 
 
+    def dispatch(self, batch) -> None:
+        """Generates values for a batch of (row, None, due) entries and queues them for upload"""
+        current_time = datetime.now(tz=None)
+        timestamp = current_time.timestamp()
+        gateway_time = current_time.isoformat()
+        rows = [row for row, _, _ in batch]
+        values = self.table.signals.generate_rounded(timestamp, rows)
+        for (row, _, due), device_values in zip(batch, values):
+            self.device_queue.put((row, timestamp, gateway_time, due, device_values))
+
+
+    def drain(self, timeout=0.5) -> bool:
+        """Stop enqueuing devices and wait for the queued ones to be sent"""
+        self.stop_event.set()
+        self.scheduler.close()
+        deadline = time.monotonic() + timeout
+        while self.device_queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+
     def stop(self) -> None:
         """Stop the plugin and clean up resources"""
-        logging.info("Stopping null plugin")
-        self.active = False
-        
-        # Wait for queue to be empty
-        self.device_queue.join()
-        
-        # Stop worker threads
-        for worker in self.workers:
-            if worker.is_alive():
-                worker.join(timeout=5.0)
-        
-        self.workers = []
-        logging.info("Null plugin stopped")
-
-
-    def prepare_json_data(self, device: Any, current_time: datetime) -> Dict:
-        return {
-            "devid": device.mac_address,
-            "gtwid": self.config.get('settings', 'hub_serial_no'),
-            "gtwtime": current_time.isoformat(),
-            "orgid": 111111,
-            "primary": {
-                "type": "raw",
-                "value": [
-                    round(device.data['data']['temperature'], 2),
-                    round(device.data['data']['humidity'], 2),
-                    round(device.data['data']['energy'], 2),
-                    round(device.data['data']['brightness'], 2),
-                    round(device.data['data']['conductivity'], 2)
-                ]
-            }
-        }
+        with self.stop_lock:
+            if not self.workers and not self.active:
+                return
+            logging.info("Stopping null plugin")
+            self.stop_event.set()
+            self.scheduler.close()
+            self.active = False
+
+            # Drop whatever was not picked up and wake idle workers
+            try:
+                while True:
+                    self.device_queue.get_nowait()
+                    self.device_queue.task_done()
+            except Empty:
+                pass
+            for _ in self.workers:
+                self.device_queue.put(None)
+
+            # Stop worker threads
+            for worker in self.workers:
+                if worker.is_alive():
+                    worker.join(timeout=5.0)
+
+            self.workers = []
+            logging.info("Null plugin stopped")
+
+
+    def import_state(self, state) -> None:
+        """Nothing to adopt: the devices are defined by sensors.yaml, which was just read again."""
+        pass
 
 
     def display_devices(self) -> None:
@@ -166,98 +217,26 @@ class null(PluginInterface):
 
 
     class Device(PluginInterface.DeviceInterface):
-        def __init__(self, sensor_info):
-            self.config = config()
-            self.manufacturer = "ONiO"
-            self.ip = ""
-            self.mac_address = sensor_info['address']
-            self.serial_no = sensor_info['serial_no']
-            self.model_no = sensor_info['model_no']
-            self.device_name = sensor_info['name']
-            self.com_protocol = "BLE"
-            self.firmware = sensor_info.get('firmware', "1.0.0")
-            self.device_description = sensor_info['description']
-            self.interval = sensor_info.get('interval', 10)
-            self.last_execution_time = None
-
-            # Data patterns
-            self.data_patterns = sensor_info.get('data', {})
-            self.data_point_types = list(self.data_patterns.keys())
-
-            self.data = {
-                "device_id": self.mac_address,
-                "device_name": self.device_name,
-                "timestamp": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
-                "firmware": self.firmware,
-                "data": {
-                    "temperature": 0,
-                    "humidity": 0,
-                    "energy": 0,
-                    "brightness": 0,
-                    "conductivity": 0
-                }
-            }
-
-
-        def generate_emulated_data(self) -> None:
-            current_time = datetime.now()
-            for data_point, data_info in self.data_patterns.items():
-                pattern = data_info['pattern']
-                params = data_info['params']
-                value = self.generate_value(pattern, params, current_time)
-                self.data['data'][data_point] = value
-            self.data['timestamp'] = current_time.strftime("%Y-%m-%dT%H:%M:%S")
-
-
-        def generate_value(self, pattern, params, current_time):
-            time_unit = params.get('time_unit', 'seconds')
-            noise = params.get('noise', 0)
-
-            # Convert time to appropriate units
-            if time_unit == 'seconds':
-                time_value = current_time.timestamp()
-            elif time_unit == 'minutes':
-                time_value = current_time.timestamp() / 60
-            elif time_unit == 'hours':
-                time_value = current_time.timestamp() / 3600
-            else:
-                time_value = current_time.timestamp()
-
-            if pattern == 'sinus':
-                offset = params.get('offset', 0)
-                amplitude = params.get('amplitude', 1)
-                period = params.get('period', 1)
-                value = offset + amplitude * sin(2 * pi * time_value / period)
-            elif pattern == 'cosine':
-                offset = params.get('offset', 0)
-                amplitude = params.get('amplitude', 1)
-                period = params.get('period', 1)
-                value = offset + amplitude * cos(2 * pi * time_value / period)
-            elif pattern == 'square':
-                min_value = params.get('min_value', 0)
-                max_value = params.get('max_value', 1)
-                period = params.get('period', 1)
-                cycle = int(time_value / (period / 2)) % 2
-                value = max_value if cycle == 0 else min_value
-            elif pattern == 'sawtooth':
-                min_value = params.get('min_value', 0)
-                max_value = params.get('max_value', 1)
-                period = params.get('period', 1)
-                fraction = (time_value % period) / period
-                value = min_value + (max_value - min_value) * fraction
-            elif pattern == 'pyramid':
-                min_value = params.get('min_value', 0)
-                max_value = params.get('max_value', 1)
-                period = params.get('period', 1)
-                half_period = period / 2
-                time_in_period = time_value % period
-                if time_in_period < half_period:
-                    fraction = time_in_period / half_period
-                    value = min_value + (max_value - min_value) * fraction
-                else:
-                    fraction = (time_in_period - half_period) / half_period
-                    value = max_value - (max_value - min_value) * fraction
-            else:
-                value = 0  # Default value for unknown patterns
-
-            return value
+        """View of one row of the DeviceTable; holds no data of its own."""
+        __slots__ = ('table', 'row')
+
+        manufacturer = "ONiO"
+        ip = ""
+        com_protocol = "BLE"
+
+        def __init__(self, table, row):
+            self.table = table
+            self.row = row
+
+        mac_address = property(lambda self: self.table.addresses[self.row])
+        device_name = property(lambda self: self.table.names[self.row])
+        device_description = property(lambda self: self.table.descriptions[self.row])
+        serial_no = property(lambda self: self.table.serial_nos[self.row])
+        model_no = property(lambda self: self.table.model_nos[self.row])
+        firmware = property(lambda self: self.table.firmwares[self.row])
+        interval = property(lambda self: self.table.intervals[self.row])
+
+        @property
+        def last_execution_time(self):
+            timestamp = self.table.last_sent[self.row]
+            return datetime.fromtimestamp(timestamp) if timestamp else None
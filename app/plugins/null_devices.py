@@ -0,0 +1,110 @@
+import sys
+import time
+from array import array
+from plugins.null_signals import SignalTable
+
+ORG_ID = 111111
+
+
+class DeviceTable:
+    """
+    Emulated sensors from sensors.yaml, stored column-wise.
+
+    One list per identity field (repeated strings such as model numbers are interned
+    and shared), the interval and the time of the last upload in float arrays, and an
+    address -> row index. The signal definitions are compiled into a SignalTable and
+    not kept. Devices are referred to by row; payload() builds an upload from the row,
+    the generated values and the fields shared by every device, which are computed
+    once here instead of per message.
+    """
+
+    def __init__(self, sensor_configs, gateway_id, default_interval=10):
+        self.gateway_id = gateway_id
+        self.addresses = []
+        self.names = []
+        self.descriptions = []
+        self.serial_nos = []
+        self.model_nos = []
+        self.firmwares = []
+        self.intervals = array('d')
+        self.last_sent = array('d')  # Unix time of the last upload, 0 if none
+        self.rows = {}
+        patterns = []
+
+        for sensor_info in sensor_configs:
+            address = sensor_info['address']
+            if address in self.rows:
+                continue  # Addresses must be unique, the first entry wins
+            self.rows[address] = len(self.addresses)
+            self.addresses.append(address)
+            self.names.append(sys.intern(str(sensor_info['name'])))
+            self.descriptions.append(sys.intern(str(sensor_info['description'])))
+            self.serial_nos.append(str(sensor_info['serial_no']))
+            self.model_nos.append(sys.intern(str(sensor_info['model_no'])))
+            self.firmwares.append(sys.intern(str(sensor_info.get('firmware', "1.0.0"))))
+            patterns.append(sensor_info.get('data') or {})
+            self.intervals.append(sensor_info.get('interval', default_interval))
+            self.last_sent.append(0.0)
+
+        self.signals = SignalTable(patterns)
+
+
+    def __len__(self):
+        return len(self.addresses)
+
+
+    def payload(self, row, values, gateway_time) -> dict:
+        """Upload for one device; gateway_time is the ISO timestamp shared by the batch."""
+        return {
+            "devid": self.addresses[row],
+            "gtwid": self.gateway_id,
+            "gtwtime": gateway_time,
+            "orgid": ORG_ID,
+            "primary": {"type": "raw", "value": values},
+        }
+
+
+def benchmark(count=10000, seconds=2.0) -> dict:
+    """Bytes per device for the table and device views, and payloads built per second, for count devices."""
+    import tracemalloc
+    from datetime import datetime
+    from plugins.null import null
+    from plugins.null_signals import PATTERNS
+
+    sensors = [{
+        'name': f"sensor{i}", 'address': f"b1:0e:{i >> 16 & 0xff:02x}:{i >> 8 & 0xff:02x}:{i & 0xff:02x}:00",
+        'serial_no': f"onio-0005-{i:05d}", 'model_no': "onio-sensor-node", 'description': "Multi Sensor Emulator",
+        'interval': 10,
+        'data': {'temperature': {'pattern': PATTERNS[i % len(PATTERNS)],
+                                 'params': {'offset': 25, 'amplitude': 5, 'period': 60, 'time_unit': 'minutes'}}},
+    } for i in range(count)]
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    table = DeviceTable(sensors, "benchmark")
+    devices = {address: null.Device(table, row) for address, row in table.rows.items()}
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    table_bytes = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+
+    rows = list(range(count))
+    built = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        current_time = datetime.now(tz=None)
+        gateway_time = current_time.isoformat()
+        for row, values in zip(rows, table.signals.generate_rounded(current_time.timestamp(), rows)):
+            table.payload(row, values, gateway_time)
+        built += count
+    elapsed = time.perf_counter() - start
+
+    return {
+        'devices': len(devices),
+        'bytes_per_device': round(table_bytes / count),
+        'payloads_per_second': round(built / elapsed),
+    }
+
+
+if __name__ == "__main__":
+    # python -m plugins.null_devices [count], from the app directory
+    print(benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10000))
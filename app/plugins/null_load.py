@@ -0,0 +1,223 @@
+import json
+import math
+import time
+import logging
+import threading
+from datetime import datetime
+from hashlib import md5
+from queue import Queue, Empty, Full
+from core.backend import ApiBackend
+from core.mock_backend import MockBackend
+from plugins.null_signals import SignalTable, PATTERNS, DATA_POINTS
+
+REPORT_FILE = "log/logs/load_test_report.json"
+TICK = 0.01  # seconds between pacing decisions
+SCOPE = "backend client"  # the null plugin, flows and the hub loop are not part of the measurement
+
+
+def percentile(sorted_values, fraction) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def load_test_patterns(count) -> list:
+    """Signal definitions for synthetic devices, cycling through all patterns."""
+    patterns = []
+    for i in range(count):
+        pattern = PATTERNS[i % len(PATTERNS)]
+        patterns.append({
+            point: {'pattern': pattern, 'params': {'offset': 20, 'amplitude': 5, 'min_value': 0, 'max_value': 100,
+                                                   'period': 60 + i % 60, 'noise': 0.2}}
+            for point in DATA_POINTS
+        })
+    return patterns
+
+
+class LoadTest:
+    """
+    Drives ApiBackend.send_collected_data with emulated sensor data at a controlled rate.
+
+    A pacing thread offers messages for `devices` synthetic sensors at the target rate,
+    ramped up linearly over `ramp` seconds, into a bounded queue drained by `senders`
+    threads. A full queue means the backend (or the hub) cannot keep up: the message is
+    dropped and counted as backpressure. The report has the offered and achieved rates,
+    latency percentiles of successful and failed sends and the backpressure counts.
+
+    Only the backend client and the server behind it are measured: messages bypass the
+    null plugin's scheduler and workers, flows and the hub loop.
+    """
+
+    def __init__(self, api, serial_no, devices=100, rate=10.0, ramp=0.0, duration=60.0, senders=8, queue_size=1000):
+        self.api = api
+        self.serial_no = serial_no
+        self.device_count = devices
+        self.rate = rate
+        self.ramp = ramp
+        self.duration = duration
+        self.sender_count = senders
+        self.queue = Queue(maxsize=queue_size)
+        self.signals = SignalTable(load_test_patterns(devices))
+        self.addresses = [f"1d:00:{i >> 16 & 0xff:02x}:{i >> 8 & 0xff:02x}:{i & 0xff:02x}:00" for i in range(devices)]
+        self.lock = threading.Lock()
+        self.latencies = []  # seconds, successful sends
+        self.failed_latencies = []
+        self.offered = 0
+        self.dropped = 0
+        self.max_queue_depth = 0
+        self.timeline = []  # (second, sent ok during that second)
+        self.done = threading.Event()
+
+
+    def target_rate(self, elapsed) -> float:
+        if self.ramp > 0 and elapsed < self.ramp:
+            return self.rate * elapsed / self.ramp
+        return self.rate
+
+
+    def pace(self, start) -> None:
+        credit = 0.0
+        next_device = 0
+        last = start
+        while True:
+            now = time.monotonic()
+            elapsed = now - start
+            if elapsed >= self.duration:
+                break
+            credit += self.target_rate(elapsed) * (now - last)
+            last = now
+            count = int(credit)
+            if count:
+                credit -= count
+                current_time = datetime.now(tz=None)
+                rows = [(next_device + i) % self.device_count for i in range(count)]
+                next_device = (next_device + count) % self.device_count
+                for row, values in zip(rows, self.signals.generate_rounded(current_time.timestamp(), rows)):
+                    self.offer(self.payload(row, values, current_time))
+                self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+            time.sleep(TICK)
+
+
+    def offer(self, payload) -> None:
+        self.offered += 1
+        try:
+            self.queue.put_nowait(payload)
+        except Full:
+            self.dropped += 1
+
+
+    def payload(self, row, values, current_time) -> dict:
+        return {
+            "devid": self.addresses[row],
+            "gtwid": self.serial_no,
+            "gtwtime": current_time.isoformat(),
+            "orgid": 111111,
+            "primary": {"type": "raw", "value": values},
+        }
+
+
+    def send(self, start) -> None:
+        while not (self.done.is_set() and self.queue.empty()):
+            try:
+                payload = self.queue.get(timeout=0.1)
+            except Empty:
+                continue
+            sent_at = time.monotonic()
+            ok = self.api.send_collected_data(payload)
+            latency = time.monotonic() - sent_at
+            with self.lock:
+                if ok:
+                    self.latencies.append(latency)
+                    second = int(sent_at - start)
+                    if self.timeline and self.timeline[-1][0] == second:
+                        self.timeline[-1][1] += 1
+                    else:
+                        self.timeline.append([second, 1])
+                else:
+                    self.failed_latencies.append(latency)
+
+
+    def run(self) -> dict:
+        logging.info(f"Load test of the {SCOPE} only: {self.device_count} devices, {self.rate} msg/s, "
+                     f"ramp {self.ramp}s, duration {self.duration}s, {self.sender_count} senders")
+        start = time.monotonic()
+        senders = [threading.Thread(target=self.send, args=(start,), name=f"LoadSender-{i}", daemon=True)
+                   for i in range(self.sender_count)]
+        for sender in senders:
+            sender.start()
+        self.pace(start)
+        self.done.set()
+        for sender in senders:
+            sender.join(timeout=30)
+        elapsed = time.monotonic() - start
+        return self.report(elapsed)
+
+
+    def report(self, elapsed) -> dict:
+        latencies = sorted(self.latencies)
+        failed = len(self.failed_latencies)
+        return {
+            'scope': SCOPE,
+            'devices': self.device_count,
+            'target_rate': self.rate,
+            'ramp_seconds': self.ramp,
+            'duration_seconds': round(elapsed, 2),
+            'offered': self.offered,
+            'sent_ok': len(latencies),
+            'failed': failed,
+            'error_rate': round(failed / max(1, len(latencies) + failed), 4),
+            'dropped_backpressure': self.dropped,
+            'max_queue_depth': self.max_queue_depth,
+            'achieved_rate': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 0.50) * 1000, 2),
+                'p90': round(percentile(latencies, 0.90) * 1000, 2),
+                'p99': round(percentile(latencies, 0.99) * 1000, 2),
+                'max': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            },
+            'failed_latency_ms_p50': round(percentile(sorted(self.failed_latencies), 0.50) * 1000, 2),
+            'throughput_per_second': [count for _, count in self.timeline],
+        }
+
+
+def write_report(report, path=REPORT_FILE) -> None:
+    try:
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+    except OSError as e:
+        logging.error(f"Failed to write load test report: {e}")
+
+
+def run_load_test(serial_no, devices, rate, ramp, duration, mock=False, mock_latency=0.0, mock_error_rate=0.0) -> dict:
+    """
+    Runs a load test of the backend client against the configured server, or a local mock
+    backend, and reports the result.
+    """
+    api = ApiBackend()
+    backend = None
+    if mock:
+        backend = MockBackend(latency=mock_latency, error_rate=mock_error_rate)
+        backend.start()
+        # In memory only: the hub's config.ini keeps pointing at the real server
+        api.config.config.set('server', 'server_url', backend.url)
+
+    if not api.get_token(md5(serial_no.encode()).hexdigest()):
+        logging.error("Load test aborted: could not get a token")
+        if backend:
+            backend.stop()
+        return {}
+
+    report = LoadTest(api, serial_no, devices=devices, rate=rate, ramp=ramp, duration=duration).run()
+    if backend:
+        report['mock_backend'] = backend.stats()
+        backend.stop()
+
+    latency = report['latency_ms']
+    logging.info(f"Load test: offered {report['offered']}, sent {report['sent_ok']}, failed {report['failed']}, "
+                 f"dropped {report['dropped_backpressure']} (max queue {report['max_queue_depth']})")
+    logging.info(f"Load test: achieved {report['achieved_rate']} msg/s of {rate} target, latency ms "
+                 f"p50 {latency['p50']} p90 {latency['p90']} p99 {latency['p99']} max {latency['max']}")
+    write_report(report)
+    return report
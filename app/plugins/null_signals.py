@@ -0,0 +1,158 @@
+import logging
+import random
+from math import sin, cos, pi, floor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # Pure Python fallback below, one device at a time
+
+
+DATA_POINTS = ('temperature', 'humidity', 'energy', 'brightness', 'conductivity')
+PATTERNS = ('sinus', 'cosine', 'square', 'sawtooth', 'pyramid')
+TIME_UNITS = {'seconds': 1, 'minutes': 60, 'hours': 3600}
+PARAMETERS = ('offset', 'amplitude', 'period', 'min_value', 'max_value', 'divisor', 'noise')
+
+
+def signal_value(pattern, t, offset, amplitude, period, min_value, max_value) -> float:
+    """Scalar version of the patterns; t is the timestamp in the pattern's time unit."""
+    if pattern == 'sinus':
+        return offset + amplitude * sin(2 * pi * t / period)
+    if pattern == 'cosine':
+        return offset + amplitude * cos(2 * pi * t / period)
+    if pattern == 'square':
+        return max_value if floor(t / (period / 2)) % 2 == 0 else min_value
+    if pattern == 'sawtooth':
+        return min_value + (max_value - min_value) * ((t % period) / period)
+    if pattern == 'pyramid':
+        half_period = period / 2
+        time_in_period = t % period
+        if time_in_period < half_period:
+            return min_value + (max_value - min_value) * (time_in_period / half_period)
+        return max_value - (max_value - min_value) * ((time_in_period - half_period) / half_period)
+    return 0  # Default value for unknown patterns
+
+
+def signal_array(pattern, t, p):
+    """NumPy version of signal_value over parameter arrays p."""
+    if pattern == 'sinus':
+        return p['offset'] + p['amplitude'] * np.sin(2 * np.pi * t / p['period'])
+    if pattern == 'cosine':
+        return p['offset'] + p['amplitude'] * np.cos(2 * np.pi * t / p['period'])
+    if pattern == 'square':
+        return np.where(np.floor(t / (p['period'] / 2)) % 2 == 0, p['max_value'], p['min_value'])
+    if pattern == 'sawtooth':
+        return p['min_value'] + (p['max_value'] - p['min_value']) * ((t % p['period']) / p['period'])
+    if pattern == 'pyramid':
+        half_period = p['period'] / 2
+        time_in_period = t % p['period']
+        rising = time_in_period < half_period
+        fraction = np.where(rising, time_in_period, time_in_period - half_period) / half_period
+        span = p['max_value'] - p['min_value']
+        return np.where(rising, p['min_value'] + span * fraction, p['max_value'] - span * fraction)
+    return np.zeros_like(t)
+
+
+fallback_logged = False
+
+
+def log_fallback() -> None:
+    global fallback_logged
+    if not fallback_logged:
+        fallback_logged = True
+        logging.warning("NumPy is not installed: emulated signals are computed one device at a time")
+
+
+class SignalTable:
+    """
+    Signal definitions of all emulated devices, stored column-wise per data point.
+
+    Every data point has one array per pattern parameter and a pattern code per device
+    (-1 for "not emulated", which stays 0 as before). generate() evaluates a batch of
+    devices at one timestamp with one vectorized expression per pattern, adds Gaussian
+    noise with the configured standard deviation, and returns an (n, len(points))
+    matrix in upload order. Without NumPy the same result is computed per device.
+    """
+
+    def __init__(self, device_patterns, points=DATA_POINTS):
+        """device_patterns: per device, the `data` mapping from sensors.yaml."""
+        self.points = points
+        self.count = len(device_patterns)
+        columns = {point: {name: [] for name in PARAMETERS + ('pattern',)} for point in points}
+        for patterns in device_patterns:
+            for point in points:
+                info = (patterns or {}).get(point)
+                params = (info or {}).get('params', {})
+                column = columns[point]
+                column['pattern'].append(PATTERNS.index(info['pattern']) if info and info.get('pattern') in PATTERNS else -1)
+                column['offset'].append(params.get('offset', 0))
+                column['amplitude'].append(params.get('amplitude', 1))
+                column['period'].append(params.get('period', 1))
+                column['min_value'].append(params.get('min_value', 0))
+                column['max_value'].append(params.get('max_value', 1))
+                column['divisor'].append(TIME_UNITS.get(params.get('time_unit', 'seconds'), 1))
+                column['noise'].append(params.get('noise', 0))
+
+        if np is None:
+            log_fallback()
+        if np is not None:
+            self.columns = {
+                point: {name: np.asarray(values, dtype=np.int8 if name == 'pattern' else np.float64)
+                        for name, values in column.items()}
+                for point, column in columns.items()
+            }
+            self.rng = np.random.default_rng()
+        else:
+            self.columns = columns
+
+
+    def generate(self, timestamp, rows=None):
+        """Values for the given device rows (all devices if None) at a Unix timestamp, shape (rows, points)."""
+        if np is None:
+            return self.generate_python(timestamp, range(self.count) if rows is None else rows)
+
+        rows = np.arange(self.count) if rows is None else np.asarray(rows, dtype=np.intp)
+        out = np.zeros((len(rows), len(self.points)))
+        for index, point in enumerate(self.points):
+            column = self.columns[point]
+            codes = column['pattern'][rows]
+            for code in np.unique(codes):
+                if code < 0:
+                    continue
+                selected = rows[codes == code]
+                params = {name: column[name][selected] for name in PARAMETERS}
+                t = timestamp / params['divisor']
+                values = signal_array(PATTERNS[code], t, params)
+                noise = params['noise']
+                if noise.any():
+                    values = values + self.rng.normal(0.0, 1.0, len(selected)) * noise
+                out[codes == code, index] = values
+        return out
+
+
+    def generate_python(self, timestamp, rows):
+        out = []
+        for row in rows:
+            values = []
+            for point in self.points:
+                column = self.columns[point]
+                code = column['pattern'][row]
+                if code < 0:
+                    values.append(0)
+                    continue
+                t = timestamp / column['divisor'][row]
+                value = signal_value(PATTERNS[code], t, column['offset'][row], column['amplitude'][row],
+                                     column['period'][row], column['min_value'][row], column['max_value'][row])
+                if column['noise'][row]:
+                    value += random.gauss(0.0, column['noise'][row])
+                values.append(value)
+            out.append(values)
+        return out
+
+
+    def generate_rounded(self, timestamp, rows=None, decimals=2) -> list:
+        """generate() as nested lists rounded for the upload payload, one row per device."""
+        values = self.generate(timestamp, rows)
+        if np is not None:
+            return np.round(values, decimals).tolist()
+        return [[round(value, decimals) for value in row] for row in values]
@@ -2,7 +2,12 @@ import logging
 from core.plugin_interface import PluginInterface
 from core.backend import ApiBackend
 from core.flow import Flow
-from bleak import BleakScanner, BleakError
+from core import metrics, plugin_stats
+from core.device_state import DeviceStateStore
+from core.ble import create_scanner
+from config.config import ConfigSettings
+from plugins.onio_ble_decoder import decode, DEVICE_TYPES
+from bleak import BleakError
 from datetime import datetime
 import asyncio
 import threading
@@ -10,6 +15,16 @@ import subprocess
 import time
 import dbus
 
+ADVERTISEMENTS = metrics.counter('onio_ble_advertisements', 'BLE advertisements received by the ONiO scanner')
+ONIO_ADVERTISEMENTS = metrics.counter('onio_ble_onio_advertisements', 'Advertisements matching an ONiO device type')
+DUPLICATE_ADVERTISEMENTS = metrics.counter('onio_ble_duplicate_advertisements', 'ONiO advertisements dropped as repeats')
+DROPPED_ADVERTISEMENTS = metrics.counter('onio_ble_dropped_advertisements', 'ONiO advertisements dropped because a device queue was full')
+
+DEDUPE_WINDOW = 1.0  # seconds in which an identical payload from the same device is a repeat of one advertisement
+DEVICE_QUEUE_SIZE = 16
+STATE_DEFAULTS = {'heartbeat': 60.0, 'deadband_humidity': 1.0, 'deadband_z_acceleration': 4.0}
+
+
 class onio_ble(PluginInterface):
     def __init__(self, api: ApiBackend, flow: Flow):
         self.protocol = "BLE"
@@ -17,8 +32,13 @@ class onio_ble(PluginInterface):
         self.active = False
         self.scanner = None
         self.scan_thread = None
+        self.scan_loop = None
+        self.scan_task = None
         self.stop_event = threading.Event()
-        self.processing_lock = asyncio.Lock()
+        self.device_queues = {}  # address -> asyncio.Queue, drained by one task per device
+        self.device_tasks = {}
+        self.last_payloads = {}  # address -> (raw payload, time.monotonic()) for dedupe
+        self.state = self.create_state_store()
         self.last_scan_time = 0
         self.scan_failures = 0
         self.MAX_FAILURES = 3
@@ -31,15 +51,25 @@ class onio_ble(PluginInterface):
         self._dbus_reconnect_threshold = 180  # Reconnect after this many scans
         self._current_scan_count = 0
         
-        self.DEVICE_TYPES = {
-            0xAA: "Blomsterpinne",
-            0xBB: "ONiO-Accelerometer-button",
-            0xCC: "ONiO-Magnetometer"
-        }
+        self.DEVICE_TYPES = DEVICE_TYPES
         self.api = api
         self.flow = flow
 
 
+    def create_state_store(self) -> DeviceStateStore:
+        """
+        Emission policy from the [onio_ble] section of config.ini, if present: heartbeat
+        (seconds, 0 = only on change) and deadband_<field> for numeric fields
+        """
+        config = ConfigSettings().config
+        settings = dict(STATE_DEFAULTS)
+        if config.has_section('onio_ble'):
+            settings.update({key: config.getfloat('onio_ble', key) for key in config.options('onio_ble')
+                             if key == 'heartbeat' or key.startswith('deadband_')})
+        deadbands = {key[len('deadband_'):]: value for key, value in settings.items() if key.startswith('deadband_')}
+        return DeviceStateStore(deadbands=deadbands, heartbeat=settings['heartbeat'])
+
+
     async def reset_dbus_connection(self):
         """Reset D-Bus connection to clear pending replies"""
         logging.info("Resetting D-Bus connection...")
@@ -104,6 +134,9 @@ class onio_ble(PluginInterface):
 
     async def scanning_loop(self):
         logging.info("Starting ONiO BLE scanning loop...")
+        # Lets stop() cancel a scan cycle in progress instead of waiting it out
+        self.scan_loop = asyncio.get_running_loop()
+        self.scan_task = asyncio.current_task()
         
         while not self.stop_event.is_set():
             try:
@@ -123,6 +156,8 @@ class onio_ble(PluginInterface):
                         async with asyncio.timeout(10):
                             await self.scan_cycle()
                             self._current_scan_count += 1
+                        # The scan loop runs until stopped: each completed cycle counts as a successful execute
+                        plugin_stats.record_execute()
                     except asyncio.TimeoutError:
                         logging.error("Complete scan cycle timeout - forcing reset")
                         await self.reset_dbus_connection()
@@ -149,50 +184,42 @@ class onio_ble(PluginInterface):
                     await asyncio.sleep(self.PAUSE_DURATION)
 
         await self.cleanup()
+        self.scan_loop = None
+        self.scan_task = None
         self.active = False
 
 
     async def scan_cycle(self):
-        if self.processing_lock.locked():
-            return
-
         try:
-            async with self.processing_lock:
-                try:
-                    if self.scanner:
-                        await self.cleanup_scanner()
-                    
-                    self.scanner = BleakScanner(detection_callback=self.detection_callback)
-                    
-                    # Start the scanner without waiting for completion
-                    await self.scanner.start()
-                    
-                    # Let it scan for the duration
-                    await asyncio.sleep(self.SCAN_DURATION)
-                    
-                    # Stop the scanner
-                    if self.scanner:
-                        await self.scanner.stop()
-                    
-                    self.scan_failures = 0
-                    
-                except BleakError as e:
-                    if "LimitsExceeded" in str(e):
-                        logging.error("D-Bus connection limits exceeded - triggering reset")
-                        await self.reset_dbus_connection()
-                    else:
-                        logging.error(f"Bleak error during scan: {e}")
-                        self.scan_failures += 1
-                    await self.cleanup_scanner()
-                except Exception as e:
-                    logging.error(f"Error in scan cycle: {e}")
-                    self.scan_failures += 1
-                    await self.cleanup_scanner()
-                    
-        except asyncio.TimeoutError:
-            logging.error("Timeout acquiring processing lock")
             if self.scanner:
                 await self.cleanup_scanner()
+            
+            self.scanner = create_scanner(detection_callback=self.detection_callback)
+            
+            # Start the scanner without waiting for completion
+            await self.scanner.start()
+            
+            # Let it scan for the duration
+            await asyncio.sleep(self.SCAN_DURATION)
+            
+            # Stop the scanner
+            if self.scanner:
+                await self.scanner.stop()
+            
+            self.scan_failures = 0
+            
+        except BleakError as e:
+            if "LimitsExceeded" in str(e):
+                logging.error("D-Bus connection limits exceeded - triggering reset")
+                await self.reset_dbus_connection()
+            else:
+                logging.error(f"Bleak error during scan: {e}")
+                self.scan_failures += 1
+            await self.cleanup_scanner()
+        except Exception as e:
+            logging.error(f"Error in scan cycle: {e}")
+            self.scan_failures += 1
+            await self.cleanup_scanner()
 
 
     async def cleanup_scanner(self):
@@ -209,110 +236,95 @@ class onio_ble(PluginInterface):
 
     async def cleanup(self):
         await self.cleanup_scanner()
+        for task in self.device_tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.device_tasks.values(), return_exceptions=True)
+        self.device_tasks = {}
+        self.device_queues = {}
+        self.last_payloads = {}
         self.active = False
         self.scan_failures = 0
         self.last_scan_time = 0
 
 
     async def detection_callback(self, device, advertising_data):
+        ADVERTISEMENTS.inc()
         try:
-            if not self.filter_device(advertising_data):
+            frame = decode(advertising_data.manufacturer_data)
+            if frame is None:
                 return
+            ONIO_ADVERTISEMENTS.inc()
 
             logging.debug(f"Found ONiO device: {device.address}")
-            
-            if self.scanner:
-                try:
-                    await self.scanner.stop()
-                    self.scanner = None
-                except Exception as e:
-                    logging.debug(f"Error stopping scanner: {e}")
-
-            await self.process_device_data(device, advertising_data)
+            self.enqueue(device.address, advertising_data, frame)
 
         except Exception as e:
             logging.error(f"Error in detection callback: {e}")
 
 
+    def enqueue(self, device_addr, advertising_data, frame) -> None:
+        """Records a decoded advertisement and queues it for the flow if it changed the device state; repeats are dropped."""
+        device_type, fields = frame
+        now = time.monotonic()
+        last = self.last_payloads.get(device_addr)
+        # BlueZ reports every received copy; the payload (with its counter) only changes with a new advertisement
+        if last is not None and last[0] == fields['raw_data'] and now - last[1] < DEDUPE_WINDOW:
+            DUPLICATE_ADVERTISEMENTS.inc()
+            return
+        self.last_payloads[device_addr] = (fields['raw_data'], now)
+
+        if device_addr not in self.devices:
+            device_name = self.DEVICE_TYPES.get(device_type, f"Unknown-ONiO-{device_type:02x}")
+            self.devices[device_addr] = self.Device(device_addr, device_name)
+
+        processed_data = {**fields, 'rssi': advertising_data.rssi}
+        self.devices[device_addr].update_data(processed_data)
+        # Only readings that changed meaningfully (or the periodic heartbeat) run the flow. A new
+        # advertisement reporting a pressed button is a press of its own, even with the same state.
+        if self.state.update(device_addr, processed_data, now, event=bool(fields.get('button_state'))) is None:
+            return
+
+        queue = self.device_queues.get(device_addr)
+        if queue is None:
+            queue = self.device_queues[device_addr] = asyncio.Queue(maxsize=DEVICE_QUEUE_SIZE)
+            self.device_tasks[device_addr] = asyncio.create_task(self.device_worker(device_addr, queue))
+        if queue.full():
+            # A device whose flow is slow loses its oldest data, never the newest
+            queue.get_nowait()
+            DROPPED_ADVERTISEMENTS.inc()
+        queue.put_nowait(processed_data)
+
+
+    async def device_worker(self, device_addr, queue) -> None:
+        """Runs the flow for one device's advertisements in order, independent of other devices"""
+        while True:
+            processed_data = await queue.get()
+            await self.process_device_data(device_addr, processed_data)
+
+
     def filter_device(self, adv_data) -> bool:
         try:
-            if not adv_data.manufacturer_data:
-                return False
-
-            manufacturer_data_bytes = b''
-            for key, value in adv_data.manufacturer_data.items():
-                manufacturer_data_bytes += bytes([key & 0xFF, key >> 8]) + value
-            
-            for i in range(len(manufacturer_data_bytes) - 2):
-                if (manufacturer_data_bytes[i] == 0xFE and 
-                    manufacturer_data_bytes[i + 1] == 0xE5 and 
-                    manufacturer_data_bytes[i + 2] in self.DEVICE_TYPES):
-                    return True
-            return False
+            return decode(adv_data.manufacturer_data) is not None
         except Exception as e:
             logging.error(f"Error in filter_device: {e}")
             return False
 
 
-    async def process_device_data(self, device, advertising_data):
-        async with self.processing_lock:
-            try:
-                manufacturer_data_bytes = b''
-                for key, value in advertising_data.manufacturer_data.items():
-                    manufacturer_data_bytes += bytes([key & 0xFF, key >> 8]) + value
-
-                for i in range(len(manufacturer_data_bytes) - 2):
-                    if (manufacturer_data_bytes[i] == 0xFE and 
-                        manufacturer_data_bytes[i + 1] == 0xE5 and 
-                        manufacturer_data_bytes[i + 2] in self.DEVICE_TYPES):
-                        
-                        device_type = manufacturer_data_bytes[i + 2]
-                        data_payload = manufacturer_data_bytes[i + 3:]
-                        device_addr = device.address
-                        device_name = self.DEVICE_TYPES.get(device_type, f"Unknown-ONiO-{device_type:02x}")
-                        
-                        if device_addr not in self.devices:
-                            self.devices[device_addr] = self.Device(device_addr, device_name)
-
-                        processed_data = await self.process_payload(device_type, data_payload, advertising_data)
-                        
-                        if processed_data:
-                            await self.flow.receive_device_data_to_flow(device_addr, processed_data)
-                            self.devices[device_addr].update_data(processed_data)
-                        return
-
-            except Exception as e:
-                logging.error(f"Error processing device data: {e}")
-            finally:
-                await asyncio.sleep(1)
-
-
-    async def process_payload(self, device_type, data_payload, advertising_data):
+    async def process_device_data(self, device_addr, processed_data):
         try:
-            processed_data = {
-                'raw_data': [hex(b) for b in data_payload],
-                'rssi': advertising_data.rssi,
-                'device_type': self.DEVICE_TYPES.get(device_type)
-            }
-
-            if device_type == 0xAA and len(data_payload) >= 4:
-                processed_data['humidity'] = data_payload[2]
-            
-            elif device_type in [0xBB, 0xCC] and len(data_payload) >= 2:
-                z = int(data_payload[3].to_bytes(1, 'big').hex(), 16)
-                processed_data.update({
-                    'button_state': data_payload[0],
-                    'z_acceleration': z if z < 128 else z - 256,
-                })
-
-            return processed_data
+            await self.flow.receive_device_data_to_flow(device_addr, processed_data)
         except Exception as e:
-            logging.error(f"Error processing payload: {e}")
-            return None
+            logging.error(f"Error processing device data: {e}")
 
 
     def stop_scanning(self):
         self.stop_event.set()
+        scan_loop, scan_task = self.scan_loop, self.scan_task
+        if scan_loop is not None and scan_task is not None:
+            try:
+                scan_loop.call_soon_threadsafe(scan_task.cancel)
+            except RuntimeError:
+                pass  # Loop already closed
         if self.scan_thread and self.scan_thread.is_alive():
             try:
                 logging.info("Stopping scan thread...")
@@ -321,6 +333,11 @@ class onio_ble(PluginInterface):
                 logging.error(f"Error stopping scan thread: {e}")
         self.active = False
 
+
+    def stop(self) -> None:
+        self.stop_scanning()
+
+
     def __del__(self):
         logging.info("ONiO BLE plugin object deleted")
         self.stop_scanning()
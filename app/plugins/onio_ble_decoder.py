@@ -0,0 +1,81 @@
+import struct
+import sys
+import time
+
+MARKER = b'\xfe\xe5'  # ONiO company ID 0xE5FE, little endian as in the advertisement
+
+DEVICE_TYPES = {
+    0xAA: "Blomsterpinne",
+    0xBB: "ONiO-Accelerometer-button",
+    0xCC: "ONiO-Magnetometer",
+}
+
+# Device type -> (layout of the payload after the type byte, field names)
+LAYOUTS = {
+    0xAA: (struct.Struct('<2xBx'), ('humidity',)),
+    0xBB: (struct.Struct('<B2xb'), ('button_state', 'z_acceleration')),
+    0xCC: (struct.Struct('<B2xb'), ('button_state', 'z_acceleration')),
+}
+
+HEX = tuple(hex(i) for i in range(256))
+
+
+def manufacturer_bytes(manufacturer_data) -> bytes:
+    """Manufacturer data as sent over the air: 2 byte company ID (little endian) and value, per entry."""
+    if len(manufacturer_data) == 1:
+        (key, value), = manufacturer_data.items()
+        return key.to_bytes(2, 'little') + value
+    return b''.join(key.to_bytes(2, 'little') + value for key, value in manufacturer_data.items())
+
+
+def find_frame(data):
+    """(device type, payload memoryview) of the first `0xFE 0xE5 <known type>` in data, or None."""
+    index = data.find(MARKER)
+    while index != -1:
+        if index + 2 < len(data) and data[index + 2] in DEVICE_TYPES:
+            return data[index + 2], memoryview(data)[index + 3:]
+        index = data.find(MARKER, index + 1)
+    return None
+
+
+def decode(manufacturer_data):
+    """
+    Decodes the ONiO frame of an advertisement's manufacturer data.
+
+    Returns (device type, fields) or None when there is no ONiO frame. Fields are the
+    raw payload bytes as hex strings and the values of the type's layout; a payload
+    too short for its layout yields no layout fields.
+    """
+    if not manufacturer_data:
+        return None
+    frame = find_frame(manufacturer_bytes(manufacturer_data))
+    if frame is None:
+        return None
+    device_type, payload = frame
+    fields = {'raw_data': list(map(HEX.__getitem__, payload)), 'device_type': DEVICE_TYPES[device_type]}
+    layout = LAYOUTS.get(device_type)
+    if layout is not None and len(payload) >= layout[0].size:
+        fields.update(zip(layout[1], layout[0].unpack_from(payload)))
+    return device_type, fields
+
+
+def benchmark(count=100000) -> dict:
+    """Advertisements decoded per second over a mix of button, sensor and foreign advertisements."""
+    samples = [
+        {0xE5FE: bytes([0xBB, 0x01, 0x10, 0x20, 0xF3])},
+        {0xE5FE: bytes([0xAA, 0x05, 0x06, 0x42, 0x00, 0x11])},
+        {0x004C: bytes([0x02, 0x15]) + bytes(21)},  # iBeacon, no ONiO frame
+        {0x0006: bytes(27), 0xE5FE: bytes([0xCC, 0x00, 0x01, 0x02, 0x80])},
+    ]
+    decoded = 0
+    start = time.perf_counter()
+    for i in range(count):
+        if decode(samples[i % len(samples)]) is not None:
+            decoded += 1
+    elapsed = time.perf_counter() - start
+    return {'advertisements': count, 'onio_frames': decoded, 'per_second': round(count / elapsed)}
+
+
+if __name__ == "__main__":
+    # python -m plugins.onio_ble_decoder [count], from the app directory
+    print(benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000))
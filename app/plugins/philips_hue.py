@@ -2,23 +2,12 @@ import logging
 from core.plugin_interface import PluginInterface
 from core.backend import ApiBackend
 from core.flow import Flow
-from bleak import BleakClient
+from core.gatt_pool import ConnectionPool
+from core.ble_pairing import PAIRING
 import asyncio
-import pexpect
-import sys
 import random
 import time
 
-# Configure Logging
-logging.basicConfig(
-    level=logging.INFO,  # Set to INFO to reduce verbosity; switch to DEBUG when needed
-    format='%(asctime)s - %(levelname)s\t- %(message)s',
-    handlers=[
-        logging.FileHandler("app.log"),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
-
 # Philips Hue Play Light Bar UUIDs
 LIGHT_CHARACTERISTIC = "932c32bd-0002-47a2-835a-a8d455b859dd"
 BRIGHTNESS_CHARACTERISTIC = "932c32bd-0003-47a2-835a-a8d455b859dd"
@@ -27,6 +16,11 @@ COLOR_CHARACTERISTIC = "932c32bd-0005-47a2-835a-a8d455b859dd"
 COMBINED_CHARACTERISTIC = "932c32bd-0007-47a2-835a-a8d455b859dd"
 FIRMWARE_CHARACTERISTIC = "00002a28-0000-1000-8000-00805f9b34fb"
 
+# Hot links to the lights, shared by the periodic reads and flow commands.
+# Reading the on/off state doubles as the health check.
+POOL = ConnectionPool("philips_hue", idle_timeout=300.0,
+                      health_check=lambda client: client.read_gatt_char(LIGHT_CHARACTERISTIC))
+
 
 def color_by_name(name: str = None) -> bytearray:
     color_map = {
@@ -66,7 +60,9 @@ class philips_hue(PluginInterface):
         asyncio.run(self.run_devices())
         self.active = False
 
-    def associate_flow_node(self, device):
+    def associate_flow_node(self, device=None):
+        if device is None:
+            return  # Every node belongs to a light
         # Check each node in the flow table
         for node in self.flow.flow_table:
             if node.node_data.get('mac_address') == device.mac_address:
@@ -91,6 +87,11 @@ class philips_hue(PluginInterface):
                 logging.info(f"Data from {device.mac_address} - {device.device_name}: {data}")
 
 
+    def stop(self) -> None:
+        POOL.stop()
+        self.active = False
+
+
     def display_devices(self) -> None:
         for id, device in self.devices.items():
             logging.info(f"  {id} - {device.device_name} - {device.device_description}")
@@ -120,8 +121,6 @@ class philips_hue(PluginInterface):
                 "color": 0x000000
             }
 
-            self.is_paired = False
-            self.is_trusted = False
             self.is_connected = False
             self.connection_attempts = 0
         
@@ -129,37 +128,26 @@ class philips_hue(PluginInterface):
         async def connect_and_read(self):
             try:
                 # Step 1: Pair and Trust the Device
-                if not self.is_paired or not self.is_trusted:
+                if not PAIRING.is_trusted(self.mac_address):
                     logging.info(f"Initiating pairing and trusting with {self.mac_address} - {self.device_name}")
                     paired_and_trusted = await pair_and_trust(self.mac_address)
 
-                    if paired_and_trusted:
-                        self.is_paired = True
-                        self.is_trusted = True
-                    else:
+                    if not paired_and_trusted:
                         logging.error(f"Failed to pair with {self.mac_address} - {self.device_name}")
                         return None
                 else:
                     logging.info(f"Device {self.mac_address} is already paired and trusted.")
 
-                # Step 2: Connect and Read Data using Bleak
-                async with BleakClient(self.mac_address) as client:
-                    if not client.is_connected:
-                        logging.error(f"Bleak failed to connect to {self.mac_address} - {self.device_name}")
-                        return None
-
-                    self.is_connected = True
-                    logging.info(f"Connected to {self.mac_address} - {self.device_name}")
-                    self.connection_attempts = 0  # Reset connection attempts
-
-                    # Perform operations
-                    state = await self.read_light_state(client)
-                    # await asyncio.sleep(5.0)
-                    self.is_connected = False  # Reset after operations
-                    return state
+                # Step 2: Read over a pooled connection, which stays open for flow commands
+                state = await POOL.run(self.mac_address, self.read_light_state)
+                logging.info(f"Read {self.mac_address} - {self.device_name}")
+                self.connection_attempts = 0  # Reset connection attempts
+                return state
 
             except Exception as e:
                 logging.error(f"Error in connect_and_read: {e}")
+                # The bond may have been removed: check it over D-Bus on the next attempt
+                PAIRING.forget(self.mac_address)
                 return None
 
         async def read_light_state(self, client):
@@ -203,239 +191,68 @@ class philips_hue(PluginInterface):
 
             return self.state
 
+        async def write(self, client, characteristic, value) -> None:
+            """Writes with the given client, or over the pooled connection to this light."""
+            if client is None:
+                await POOL.run(self.mac_address,
+                               lambda client: client.write_gatt_char(characteristic, value, response=True))
+            else:
+                await client.write_gatt_char(characteristic, value, response=True)
+
         async def toggle_light(self, client=None, data=None):
             logging.info("Toggling Light...")
             if data['z_acceleration'] < 0:
                 logging.info("Button is upside down. trying to change color...")
                 # Change color to random
-                color = color_by_name()
-                async with BleakClient(self.mac_address) as client:
-                    try:
-                        await self.set_color(client, color)
-                    except Exception as e:
-                        logging.error(f"Failed to set color: {e}")
+                await self.set_color(client, color_by_name())
+            elif self.state["light_is_on"]:
+                await self.turn_light_off(client)
             else:
-                if client is None:
-                    async with BleakClient(self.mac_address) as client:
-                        try:
-                            if self.state["light_is_on"]:
-                                await self.turn_light_off(client)
-                                self.state["light_is_on"] = False
-                            else:
-                                await self.turn_light_on(client)
-                                self.state["light_is_on"] = True
-                        except Exception as e:
-                            logging.error(f"Failed to toggle light: {e}")
-                else:
-                    try:
-                        if self.state["light_is_on"]:
-                            await self.turn_light_off(client)
-                            self.state["light_is_on"] = False
-                        else:
-                            await self.turn_light_on(client)
-                            self.state["light_is_on"] = True
-                    except Exception as e:
-                        logging.error(f"Failed to toggle light: {e}")
+                await self.turn_light_on(client)
 
 
         async def turn_light_off(self, client=None):
             logging.info("Turning Light off...")
-            if client is None:
-                async with BleakClient(self.mac_address) as client:
-                    try:
-                        await client.write_gatt_char(LIGHT_CHARACTERISTIC, b"\x00", response=True)
-                        self.state["light_is_on"] = False
-                    except Exception as e:
-                        logging.error(f"Failed to turn off light: {e}")
-            else: 
-                try:
-                    await client.write_gatt_char(LIGHT_CHARACTERISTIC, b"\x00", response=True)
-                    self.state["light_is_on"] = False
-                except Exception as e:
-                    logging.error(f"Failed to turn off light: {e}")
+            try:
+                await self.write(client, LIGHT_CHARACTERISTIC, b"\x00")
+                self.state["light_is_on"] = False
+            except Exception as e:
+                logging.error(f"Failed to turn off light: {e}")
 
         async def turn_light_on(self, client=None):
             logging.info("Turning Light on...")
-            if client is None:
-                async with BleakClient(self.mac_address) as client:
-                    try:
-                        await client.write_gatt_char(LIGHT_CHARACTERISTIC, b"\x01", response=True)
-                        self.state["light_is_on"] = True
-                    except Exception as e:
-                        logging.error(f"Failed to turn on light: {e}")
-            else:
-                try:
-                    await client.write_gatt_char(LIGHT_CHARACTERISTIC, b"\x01", response=True)
-                    self.state["light_is_on"] = True
-                except Exception as e:
-                    logging.error(f"Failed to turn on light: {e}")
+            try:
+                await self.write(client, LIGHT_CHARACTERISTIC, b"\x01")
+                self.state["light_is_on"] = True
+            except Exception as e:
+                logging.error(f"Failed to turn on light: {e}")
 
         async def set_color(self, client=None, color=None):
-            logging.info(f"Setting color to [{', '.join(f'0x{byte:02x}' for byte in color)}] ...")
             if color is None:
                 color = self.state["color"]
-            if client is None:
-                async with BleakClient(self.mac_address) as client:
-                    try:
-                        await client.write_gatt_char(COLOR_CHARACTERISTIC, color, response=True)
-                        self.state["color"] = color
-                    except Exception as e:
-                        logging.error(f"Failed to set color: {e}")
-            else:
-                try:
-                    await client.write_gatt_char(COLOR_CHARACTERISTIC, color, response=True)
-                    self.state["color"] = color
-                except Exception as e:
-                    logging.error(f"Failed to set color: {e}")
+            logging.info(f"Setting color to [{', '.join(f'0x{byte:02x}' for byte in color)}] ...")
+            try:
+                await self.write(client, COLOR_CHARACTERISTIC, color)
+                self.state["color"] = color
+            except Exception as e:
+                logging.error(f"Failed to set color: {e}")
 
         async def set_brightness(self, client=None, brightness=None):
             logging.info(f"Setting brightness to {brightness} % ...")
             if brightness is None:
                 brightness = self.state["brightness"]
-            if client is None:
-                async with BleakClient(self.mac_address) as client:
-                # Brightness range: 0-100 - converts to 1-254
-                    brightness = int((brightness / 100) * 254)
-                    try:
-                        await client.write_gatt_char(BRIGHTNESS_CHARACTERISTIC, bytearray([brightness]), response=True)
-                        self.state["brightness"] = brightness
-                    except Exception as e:
-                        logging.error(f"Failed to set brightness: {e}")
-            else:
-                # Brightness range: 0-100 - converts to 1-254
-                brightness = int((brightness / 100) * 254)
-                try:
-                    await client.write_gatt_char(BRIGHTNESS_CHARACTERISTIC, bytearray([brightness]), response=True)
-                    self.state["brightness"] = brightness
-                except Exception as e:
-                    logging.error(f"Failed to set brightness: {e}")
+            # Brightness range: 0-100 - converts to 1-254
+            brightness = int((brightness / 100) * 254)
+            try:
+                await self.write(client, BRIGHTNESS_CHARACTERISTIC, bytearray([brightness]))
+                self.state["brightness"] = brightness
+            except Exception as e:
+                logging.error(f"Failed to set brightness: {e}")
 
 
 async def pair_and_trust(mac_address, retries=3, delay=5):
     """
-    Automates the pairing and trusting process using bluetoothctl via pexpect.
-    Retries the process up to `retries` times with `delay` seconds between attempts.
+    Pairs and trusts the device through BlueZ over D-Bus, without blocking the event loop.
+    Devices already paired and trusted are answered from the persistent pairing cache.
     """
-    for attempt in range(1, retries + 1):
-        logging.info(f"Pairing attempt {attempt} for {mac_address}")
-        try:
-            # Spawn bluetoothctl
-            child = pexpect.spawn('bluetoothctl', encoding='utf-8', timeout=30)
-            child.logfile = None  # Disable logging to stdout
-
-            # Wait for the bluetoothctl prompt
-            child.expect('#')
-
-            # Turn on the Bluetooth adapter
-            child.sendline('power on')
-            child.expect('#')
-
-            # Set up the agent
-            child.sendline('agent on')
-            child.expect('#')
-            child.sendline('default-agent')
-            child.expect('#')
-
-            # Check if the device is already paired and trusted
-            child.sendline(f'info {mac_address}')
-            index = child.expect([
-                f"Device {mac_address} not found",
-                f"Paired: no",
-                f"Paired: yes",
-                pexpect.EOF,
-                pexpect.TIMEOUT
-            ])
-
-            if index == 0 or index == 1:
-                logging.info(f"Device {mac_address} is not paired. Proceeding to pair.")
-            elif index == 2:
-                logging.info(f"Device {mac_address} is already paired.")
-                # Check if trusted
-                child.sendline(f'info {mac_address}')
-                child.expect('#')
-                info_output = child.before
-                if "Trusted: yes" in info_output:
-                    logging.info(f"Device {mac_address} is already trusted.")
-                    child.sendline('exit')
-                    child.close()
-                    return True
-                else:
-                    logging.info(f"Device {mac_address} is not trusted. Proceeding to trust.")
-            else:
-                logging.error(f"Unexpected response while checking info for {mac_address}")
-                child.sendline('exit')
-                child.close()
-                return False
-
-            # Initiate pairing only if not already paired
-            child.sendline(f'pair {mac_address}')
-            index = child.expect([
-                'Pairing successful',
-                'Device has been paired',
-                'Authentication Failed',
-                'Failed to pair',
-                'Agent request PIN code',
-                'Agent request Passkey',
-                pexpect.EOF,
-                pexpect.TIMEOUT
-            ])
-
-            if index in [0, 1]:
-                logging.info(f"Successfully paired with {mac_address}")
-            elif index in [2, 3]:
-                logging.error(f"Failed to pair with {mac_address}")
-                child.sendline('exit')
-                child.close()
-                return False
-            elif index == 4:
-                # Handle PIN code request if needed
-                pin_code = '0000'  # Replace with the actual PIN if required
-                child.sendline(pin_code)
-                child.expect('#')
-                logging.info(f"Sent PIN code to {mac_address}")
-            elif index == 5:
-                # Handle Passkey request if needed
-                passkey = '123456'  # Replace with the actual Passkey if required
-                child.sendline(passkey)
-                child.expect('#')
-                logging.info(f"Sent Passkey to {mac_address}")
-            else:
-                logging.error(f"Unexpected response during pairing with {mac_address}")
-                child.sendline('exit')
-                child.close()
-                return False
-
-            # Trust the device
-            child.sendline(f'trust {mac_address}')
-            index = child.expect([
-                f"Changing {mac_address} trust succeeded",
-                f"Device {mac_address} not available",
-                pexpect.EOF,
-                pexpect.TIMEOUT
-            ])
-
-            if index == 0:
-                logging.info(f"Successfully trusted {mac_address}")
-            else:
-                logging.error(f"Failed to trust {mac_address}")
-                child.sendline('exit')
-                child.close()
-                return False
-
-            # Exit bluetoothctl
-            child.sendline('exit')
-            child.close()
-            return True
-
-        except pexpect.exceptions.EOF:
-            logging.error("Unexpected EOF during pairing/trusting process.")
-        except pexpect.exceptions.TIMEOUT:
-            logging.error("Timeout occurred during pairing/trusting process.")
-        except Exception as e:
-            logging.error(f"Exception during pairing/trusting: {e}")
-
-        logging.warning(f"Attempt {attempt} failed. Retrying in {delay} seconds...")
-        await asyncio.sleep(delay)
-
-    logging.error(f"All {retries} pairing attempts failed for {mac_address}")
-    return False
+    return await PAIRING.ensure_paired(mac_address, retries=retries, delay=delay)
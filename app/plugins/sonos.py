@@ -71,7 +71,9 @@ class sonos(PluginInterface):
             self.active = False
 
 
-    def associate_flow_node(self, device):
+    def associate_flow_node(self, device=None):
+        if device is None:
+            return  # Every node belongs to a speaker
         # Check each node in the flow table
         library = {
             'play': device.play,
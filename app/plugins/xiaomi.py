@@ -3,10 +3,9 @@ from core.plugin_interface import PluginInterface
 from core.backend import ApiBackend
 from config.config import ConfigSettings as config
 from core.flow import Flow
-import asyncio
-from bleak import BleakClient
+from core.ble import create_client, connection_limit
+from core.gatt_poller import GattPoller
 from datetime import datetime
-import time
 
 # Xiaomi service and characteristic UUIDs
 SERVIDE_UUID = "00001204-0000-1000-8000-00805f9b34fb"
@@ -21,42 +20,44 @@ class xiaomi(PluginInterface):
         self.protocol = "BLE"
         self.devices = {}
         self.active = False
-        self.last_update = None
         self.update_interval = 900
         self.api = api
         self.flow = flow
         self.config = config()
+        # Connects to several sensors at once, each on its own staggered schedule
+        self.poller = GattPoller("xiaomi", lambda device: device.connect_and_read(), self.send_data,
+                                 interval=self.update_interval, concurrency=connection_limit())
 
-    def associate_flow_node(self, device):
+    def associate_flow_node(self, device=None):
         pass
 
     def execute(self) -> None:
-        if self.last_update == None or (datetime.now() - self.last_update).seconds > self.update_interval:
-            self.active = True
-            self.last_update = datetime.now()
-            for _, device in self.devices.items():
-                data = asyncio.run(device.connect_and_read())
-                if not data:
-                    logging.error(f"Failed to read data from {device.mac_address} - {device.device_name}")
-                    continue
-                jsn_data = {
-                    "devid": device.mac_address,
-                    "gtwid": self.config.get('settings', 'hub_serial_no'),
-                    "gtwtime": datetime.now(tz=None).isoformat(),
-                    "orgid": 111111,
-                    "primary": {
-                        "type": "raw",
-                        "value": [
-                            round(data['temperature'], 2),
-                            round(data['humidity'], 2),
-                            round(data['energy'], 2),
-                            round(data['brightness'], 2),
-                            round(data['conductivity'], 2)
-                        ]
-                    }
-                }
-                self.api.send_collected_data(jsn_data)
-            self.active = False
+        # The poller keeps running and picks up devices found by later scans
+        self.active = True
+        self.poller.start(lambda: self.devices)
+
+    def send_data(self, device, data) -> None:
+        jsn_data = {
+            "devid": device.mac_address,
+            "gtwid": self.config.get('settings', 'hub_serial_no'),
+            "gtwtime": datetime.now(tz=None).isoformat(),
+            "orgid": 111111,
+            "primary": {
+                "type": "raw",
+                "value": [
+                    round(data['temperature'], 2),
+                    round(data['humidity'], 2),
+                    round(data['energy'], 2),
+                    round(data['brightness'], 2),
+                    round(data['conductivity'], 2)
+                ]
+            }
+        }
+        self.api.send_collected_data(jsn_data)
+
+    def stop(self) -> None:
+        self.poller.stop()
+        self.active = False
 
     def display_devices(self) -> None:
         for id, device in self.devices.items():
@@ -81,36 +82,30 @@ class xiaomi(PluginInterface):
             self.device_description = 'Temperature, humidity and brightness sensor'
             self.data = {}
 
-        async def connect_and_read(self):
-            
-            try:
-                async with BleakClient(self.mac_address) as client:
-                    logging.info(f"Connected to {self.mac_address} - {self.device_name}")
-
-                    # Write to access characteristic
-                    await client.write_gatt_char(ACCESS_CHAR_UUID, bytearray([0xA0, 0x1F]))
-
-                    # Read data characteristic
-                    data = await client.read_gatt_char(READ_DATA_UUID)
-                    logging.info(f"Data received from Flower Care sensor: {data}")
-                    self.data['temperature'] = int.from_bytes(data[0:2], byteorder='little') / 10.0
-                    self.data['brightness'] = int.from_bytes(data[3:7], byteorder='little')
-                    self.data['humidity'] = data[7]
-                    self.data['conductivity'] = int.from_bytes(data[8:10], byteorder='little')
-
-                    # Read battery characteristic
-                    battery = await client.read_gatt_char(READ_BATTERY_UUID)
-                    self.data['energy'] = battery[0]
-                    self.firmware = battery[2:7].decode('utf-8')
-
-                    self.print_data()
-            except KeyboardInterrupt:
-                return None
-            except Exception as e:
-                logging.error(f"Error reading data from {self.mac_address} - {self.device_name}: {e}")
-            finally:
-                logging.info(f"Disconnected from {self.mac_address} - {self.device_name}")
-                return self.data
+        async def connect_and_read(self) -> dict:
+            """Reads the sensor values. Connection and GATT errors are raised, the poller retries them."""
+            async with create_client(self.mac_address) as client:
+                logging.info(f"Connected to {self.mac_address} - {self.device_name}")
+
+                # Write to access characteristic
+                await client.write_gatt_char(ACCESS_CHAR_UUID, bytearray([0xA0, 0x1F]))
+
+                # Read data characteristic
+                data = await client.read_gatt_char(READ_DATA_UUID)
+                logging.info(f"Data received from Flower Care sensor: {data}")
+                self.data['temperature'] = int.from_bytes(data[0:2], byteorder='little') / 10.0
+                self.data['brightness'] = int.from_bytes(data[3:7], byteorder='little')
+                self.data['humidity'] = data[7]
+                self.data['conductivity'] = int.from_bytes(data[8:10], byteorder='little')
+
+                # Read battery characteristic
+                battery = await client.read_gatt_char(READ_BATTERY_UUID)
+                self.data['energy'] = battery[0]
+                self.firmware = battery[2:7].decode('utf-8')
+
+                self.print_data()
+            logging.info(f"Disconnected from {self.mac_address} - {self.device_name}")
+            return dict(self.data)
 
 
         def print_data(self):
@@ -1,11 +1,16 @@
 #!/usr/bin/env python3
 
 import os
+import json
 import subprocess
 import threading
 import time
-from flask import Flask, request, redirect, render_template, url_for
+from queue import Empty
+from flask import Flask, Response, request, redirect, render_template, url_for
 from config.config import ConfigSettings as config
+from core.system_monitor import SystemMonitor, read_file, DEVICE_MODEL
+from core.wifi_scanner import WifiScanner
+from core import metrics
 import logging
 from waitress import serve
 import signal
@@ -16,9 +21,23 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__, template_folder='/opt/gateway.hub/app/templates', static_folder='/opt/gateway.hub/app/templates/static')
 
+# Each open /events stream holds a waitress thread for as long as the dashboard is open.
+# Streams beyond MAX_EVENT_STREAMS get a 503, so the other routes always keep a thread.
+SERVER_THREADS = 16
+MAX_EVENT_STREAMS = 8
+
 # Event to signal script termination
 stop_event = threading.Event()
 
+# Background sampler for the dashboard metrics
+monitor = SystemMonitor()
+
+# Background Wi-Fi scanner shared by the dashboard and the captive portal
+wifi_scanner = WifiScanner()
+
+metrics.gauge('hub_temperature_celsius', 'SoC temperature').set_function(lambda: monitor.get('temperature'))
+metrics.gauge('hub_memory_usage_percent', 'Used memory').set_function(lambda: monitor.get('memory_usage'))
+
 
 def get_hardware_id() -> str:
     # 1. Try to get the CPU serial number (specific to Raspberry Pi)
@@ -58,53 +77,6 @@ def run_command(command) -> str:
         return ""
 
 
-def scan_wifi_networks(min_signal_strength=-70) -> list:
-    """Scans for available Wi-Fi networks and returns a list of unique networks with signal strength above the specified threshold."""
-    try:
-        # Run the command with a timeout of 5 seconds
-        result = subprocess.run(['iwlist', 'wlan0', 'scan'], capture_output=True, text=True, timeout=5)
-        networks = []
-        ssid_set = set()
-        cells = result.stdout.split('Cell ')
-        for cell in cells:
-            if 'ESSID' in cell:
-                # Extract SSID
-                essid_line = [line for line in cell.split('\n') if 'ESSID' in line]
-                if not essid_line:
-                    continue
-                essid_line = essid_line[0]
-                essid = essid_line.split(':', 1)[1].strip().strip('"')
-
-                # Skip empty SSIDs
-                if not essid:
-                    continue
-
-                # Extract Signal Strength
-                signal_line = [line for line in cell.split('\n') if 'Signal level' in line]
-                if signal_line:
-                    signal_part = signal_line[0].split('Signal level=')[1]
-                    # Handle different signal strength formats
-                    if ' dBm' in signal_part:
-                        signal_strength = int(signal_part.split(' dBm')[0])
-                    else:
-                        signal_strength = int(signal_part)
-
-                    # Filter based on signal strength and duplicates
-                    if signal_strength >= min_signal_strength and essid not in ssid_set:
-                        networks.append((essid, signal_strength))
-                        ssid_set.add(essid)
-
-        # Sort networks by signal strength descending
-        networks.sort(key=lambda x: x[1], reverse=True)
-        return networks
-    except subprocess.TimeoutExpired:
-        logger.error("Wi-Fi scan timed out after 5 seconds.")
-        return []
-    except Exception as e:
-        logger.error(f"Failed to scan Wi-Fi networks: {e}")
-        return []
-
-
 def connect_to_wifi(ssid, password) -> None:
     """Connect to the specified Wi-Fi network using NetworkManager."""
     try:
@@ -177,7 +149,7 @@ def cancel():
 
 @app.route('/captive_portal', defaults={'path': ''}, methods=['GET', 'POST'])
 def captive_portal(path=''):
-    networks = scan_wifi_networks()
+    networks = wifi_scanner.get_networks(max_age=30)
     if request.method == 'POST':
         ssid = request.form.get('ssid')
         password = request.form.get('password')
@@ -191,6 +163,7 @@ def captive_portal(path=''):
             return 'SSID and password are required.', 400
 
         threading.Thread(target=connect_to_wifi, args=(ssid, password)).start()
+        wifi_scanner.request_scan()
         return 'Attempting to connect to network... Please wait.'
     else:
         logger.info("Serving captive portal page...")
@@ -217,61 +190,75 @@ def hotspot_mode():
 def index(path = ''):
     logger.info("Request received for index page.")
 
-    logger.info("Scanning Wi-Fi networks...")
-    networks = scan_wifi_networks()
+    snapshot = monitor.snapshot()
 
-    current_ssid = run_command(['iwgetid', '-r'])
-    rssi = 'N/A'
-    if current_ssid:
-        rssi = run_command(['iwconfig', 'wlan0']).split('Signal level=')[1].split(' dBm')[0]
-    else:
-        current_ssid = "No Wi-Fi"
-    
-    current_ethernet = "Connected" if "100 (connected)" in run_command(['nmcli', 'device', 'show', 'eth0']) else "Disconnected"
-    if not current_ssid:
-        current_ssid = "No Wi-Fi"
-
-    temperature = float(run_command(['vcgencmd', 'measure_temp']).split('=')[1].split('\'')[0])
-    system_voltage = run_command(['vcgencmd', 'measure_volts', 'core']).split('=')[1].split('V')[0]
-    memory_usage_output = run_command(['free', '-m']).split('\n')[1]
-    memory_usage = round(int(memory_usage_output.split()[2]) / int(memory_usage_output.split()[1]) * 100, 0)
-    system_time = run_command(['date'])
-
-    connection_status = run_command(['ping', '-I', 'wlan0', '-c', '1', 'google.com'])
-    if connection_status:
-        connection_status = "Connected"
-    ip_address = run_command(['hostname', '-I'])
-
-    service_status = run_command(['systemctl', 'status', 'SmarthubManager.service'])
-    if "active (running)" in service_status:
-        service_status = "Running"
-    else:
-        service_status = "Stopped"
+    current_ssid = snapshot.get('current_ssid') or "No Wi-Fi"
+    rssi = snapshot.get('signal_strength', 'N/A') if snapshot.get('current_ssid') else 'N/A'
 
     logger.info("Serving index page...")
 
     return render_template("index.html", 
                         serial_number=serial_number, 
-                        networks=networks,
+                        networks=snapshot.get('networks', []),
                         current_ssid=current_ssid, 
-                        temperature=temperature, 
-                        system_voltage=system_voltage, 
-                        memory_usage=memory_usage, 
+                        temperature=snapshot.get('temperature', 0.0), 
+                        system_voltage=snapshot.get('system_voltage', 'N/A'), 
+                        memory_usage=snapshot.get('memory_usage', 0), 
                         hardware_model=hardware_model, 
                         software_version=software_version,
-                        system_time=system_time,
-                        current_ethernet=current_ethernet,
-                        connection_status=connection_status,
-                        ip_address=ip_address,
+                        system_time=time.strftime('%a %b %d %H:%M:%S %Z %Y'),
+                        current_ethernet=snapshot.get('current_ethernet', 'Disconnected'),
+                        connection_status=snapshot.get('connection_status', ''),
+                        ip_address=snapshot.get('ip_address', ''),
                         signal_strength=rssi,
-                        service_status=service_status
+                        service_status=snapshot.get('service_status', 'Stopped')
                         )
 
 
+@app.route('/events')
+def events():
+    """Server-Sent Events stream of dashboard metrics: one full snapshot, then only changes."""
+    subscriber = monitor.subscribe(limit=MAX_EVENT_STREAMS)
+    if subscriber is None:
+        # The dashboard keeps its rendered values and retries later
+        return Response("Too many open dashboards", status=503, headers={'Retry-After': '30'})
+
+    def stream():
+        yield f"event: snapshot\ndata: {json.dumps(monitor.snapshot())}\n\n"
+        while not stop_event.is_set():
+            try:
+                delta = subscriber.get(timeout=15)
+            except Empty:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"data: {json.dumps(delta)}\n\n"
+
+    response = Response(stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # The server closes every response, also for HEAD requests and clients that left before
+    # the first event, when the generator never runs; the slot is released there
+    response.call_on_close(lambda: monitor.unsubscribe(subscriber))
+    return response
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus text format: this server's gauges followed by the last export of the hub process."""
+    body = metrics.merge(metrics.REGISTRY.render(), read_file(metrics.METRICS_FILE))
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/plugins')
+def plugin_stats():
+    """Per-plugin resource accounting from the hub process, as JSON."""
+    return Response(json.dumps(monitor.get('plugin_stats') or {}), mimetype='application/json')
+
+
 @app.route('/restart_services', methods=['GET', 'POST'])
 def restart_services():
     logger.info("Restarting services requested by user.")
     subprocess.run(['systemctl', 'restart', 'SmarthubManager.service'])
+    monitor.refresh('service_status')
     return 'Restarting services...' , 200
 
 
@@ -279,6 +266,7 @@ def restart_services():
 def stop_services():
     logger.info("Stopping services requested by user.")
     subprocess.run(['systemctl', 'stop', 'SmarthubManager.service'])
+    monitor.refresh('service_status')
     return 'Stopping services...' , 200
 
 
@@ -289,12 +277,16 @@ if __name__ == '__main__':
         serial_number = serial_number if serial_number != '' else config().get('settings', 'hub_serial_no')
         logging.error("Failed to get hardware ID - using default serial number: " + serial_number)
 
-    hardware_model = run_command(['cat', '/sys/firmware/devicetree/base/model'])
+    hardware_model = read_file(DEVICE_MODEL).rstrip('\x00')
     software_version = "1.0.0"
 
+    wifi_scanner.start()
+    monitor.add_sampler('networks', 5, wifi_scanner.get_networks)
+    monitor.start()
+
     try:
         logger.info("Starting server...")
-        serve(app, host='0.0.0.0', port=80)
+        serve(app, host='0.0.0.0', port=80, threads=SERVER_THREADS)
     except KeyboardInterrupt:
         logger.warning("Keyboard Interrupt")
         pass
@@ -0,0 +1,110 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from core import ble_capture
+from core.ble_capture import MAGIC, ReplayScanner, ReplaySource, encode, read_capture
+
+SERVICE = '0000fe95-0000-1000-8000-00805f9b34fb'
+
+
+def write_capture(path, records, tail=b''):
+    with open(path, 'wb') as f:
+        f.write(MAGIC + b''.join(encode(*record) for record in records) + tail)
+    return path
+
+
+def capture(tmp_path, offsets=(0.0, 10.0, 20.0, 30.0)):
+    records = [(1700000000.0 + offset, f"AA:BB:CC:DD:EE:{index:02X}", -40 - index, f"sensor-{index}", [],
+                {0xE5FE: bytes([0xBB, index])}) for index, offset in enumerate(offsets)]
+    return write_capture(tmp_path / 'capture.bin', records)
+
+
+def test_encode_and_read_round_trip(tmp_path):
+    records = [
+        (1700000000.25, 'C4:7C:8D:6A:00:01', -67, 'Flower care', [SERVICE], {0x0095: b'\x71\x20', 0xE5FE: b''}),
+        (1700000001.5, 'e4:d8:7f:1a:00:01', -200, None, None, None),  # RSSI clamped to the record's byte
+    ]
+    path = write_capture(tmp_path / 'capture.bin', records)
+
+    assert read_capture(path) == [
+        ble_capture.Advertisement(1700000000.25, 'C4:7C:8D:6A:00:01', -67, 'Flower care', [SERVICE],
+                                  {0x0095: b'\x71\x20', 0xE5FE: b''}),
+        ble_capture.Advertisement(1700000001.5, 'E4:D8:7F:1A:00:01', -128, None, [], {}),
+    ]
+
+
+def test_truncated_last_record_is_left_out(tmp_path):
+    record = (1700000000.0, 'AA:BB:CC:DD:EE:FF', -50, 'button', [SERVICE], {0xE5FE: bytes(8)})
+    complete = encode(*record)
+    # Cut inside the fixed header, the name, the UUIDs, an entry header and an entry value
+    for cut in (5, ble_capture.RECORD.size + 3, len(complete) - 14, len(complete) - 10, len(complete) - 1):
+        path = write_capture(tmp_path / f'capture-{cut}.bin', [record], tail=complete[:cut])
+
+        assert [advertisement.address for advertisement in read_capture(path)] == ['AA:BB:CC:DD:EE:FF']
+
+
+def test_capture_writer_appends_records(tmp_path):
+    path = str(tmp_path / 'capture.bin')
+    writers = [ble_capture.CaptureWriter(path), ble_capture.CaptureWriter(path)]
+    device = SimpleNamespace(address='AA:BB:CC:DD:EE:FF')
+    advertisement = SimpleNamespace(rssi=-50, local_name='button', service_uuids=[], manufacturer_data={})
+    for writer in writers:
+        writer.write(device, advertisement)
+        writer.write(SimpleNamespace(address='not-a-mac'), advertisement)  # Skipped
+        writer.close()
+
+    assert len(read_capture(path)) == 2
+
+
+def test_replay_at_speed_zero_delivers_every_record_in_order(tmp_path):
+    source = ReplaySource(capture(tmp_path), speed=0)
+    received = []
+
+    def sync_callback(device, advertisement_data):
+        received.append(('sync', device.address))
+
+    async def async_callback(device, advertisement_data):
+        await asyncio.sleep(0)
+        received.append(('async', device.address, advertisement_data.manufacturer_data[0xE5FE][1]))
+
+    async def run():
+        scanner = ReplayScanner(source, detection_callback=sync_callback)
+        scanner.register_detection_callback(async_callback)
+        return await scanner.discover(timeout=0, return_adv=True)
+
+    seen = asyncio.run(run())
+
+    addresses = [f"AA:BB:CC:DD:EE:{index:02X}" for index in range(4)]
+    assert received == [entry for index, address in enumerate(addresses)
+                        for entry in (('sync', address), ('async', address, index))]
+    assert list(seen) == addresses
+
+
+def test_replay_timeline_only_plays_what_is_on_air(tmp_path):
+    source = ReplaySource(capture(tmp_path), speed=100)
+    assert source.duration == 30.0
+    # 15 s of capture time have passed: the first two advertisements are over
+    source.started = time.monotonic() - 0.15
+    received = []
+
+    async def run():
+        scanner = ReplayScanner(source, detection_callback=lambda device, data: received.append(
+            (device.address, source.position())))
+        await scanner.discover(timeout=0.5)
+
+    start = time.monotonic()
+    asyncio.run(run())
+
+    assert [address for address, _ in received] == ['AA:BB:CC:DD:EE:02', 'AA:BB:CC:DD:EE:03']
+    # Each advertisement is delivered once its capture time has been reached
+    assert received[0][1] >= 20.0 and received[1][1] >= 30.0
+    assert time.monotonic() - start < 2
+
+
+def test_replay_position_runs_at_speed(tmp_path):
+    source = ReplaySource(capture(tmp_path), speed=50)
+    source.position()
+    time.sleep(0.1)
+
+    assert 4.0 <= source.position() < 10.0
@@ -0,0 +1,74 @@
+from core.device_state import DeviceStateStore
+
+
+def test_first_reading_is_emitted_with_all_compared_fields():
+    store = DeviceStateStore()
+
+    assert store.update('aa', {'humidity': 40, 'rssi': -60, 'raw_data': ['0x1']}, now=0) == ['humidity']
+    assert store.get('aa') == {'humidity': 40, 'rssi': -60, 'raw_data': ['0x1']}
+
+
+def test_unchanged_and_ignored_fields_are_suppressed():
+    store = DeviceStateStore(heartbeat=60)
+    store.update('aa', {'button_state': 0, 'rssi': -60}, now=0)
+
+    assert store.update('aa', {'button_state': 0, 'rssi': -75}, now=1) is None
+    assert store.update('aa', {'button_state': 1, 'rssi': -75}, now=2) == ['button_state']
+    # The latest reading is stored even when it is not emitted
+    store.update('aa', {'button_state': 1, 'rssi': -80}, now=3)
+    assert store.get('aa')['rssi'] == -80
+
+
+def test_deadband_is_measured_from_the_last_emitted_value():
+    store = DeviceStateStore(deadbands={'z_acceleration': 4})
+    store.update('aa', {'z_acceleration': 10}, now=0)
+
+    assert store.update('aa', {'z_acceleration': 13}, now=1) is None
+    assert store.update('aa', {'z_acceleration': 14}, now=2) is None  # 4 from 10 is not more than the deadband
+    assert store.update('aa', {'z_acceleration': 15}, now=3) == ['z_acceleration']
+    assert store.update('aa', {'z_acceleration': 12}, now=4) is None
+    assert store.update('aa', {'z_acceleration': 10}, now=5) == ['z_acceleration']
+
+
+def test_new_fields_count_as_changed():
+    store = DeviceStateStore()
+    store.update('aa', {'humidity': 40}, now=0)
+
+    assert store.update('aa', {'humidity': 40, 'battery': 90}, now=1) == ['battery']
+
+
+def test_heartbeat_emits_unchanged_readings():
+    store = DeviceStateStore(heartbeat=60)
+    store.update('aa', {'humidity': 40}, now=0)
+
+    assert store.update('aa', {'humidity': 40}, now=59) is None
+    assert store.update('aa', {'humidity': 40}, now=60) == []
+    assert store.update('aa', {'humidity': 40}, now=100) is None
+
+
+def test_zero_heartbeat_never_emits_unchanged_readings():
+    store = DeviceStateStore(heartbeat=0)
+    store.update('aa', {'humidity': 40}, now=0)
+
+    assert store.update('aa', {'humidity': 40}, now=10000) is None
+
+
+def test_devices_are_tracked_separately_and_can_be_forgotten():
+    store = DeviceStateStore()
+    store.update('aa', {'humidity': 40}, now=0)
+
+    assert store.update('bb', {'humidity': 40}, now=1) == ['humidity']
+    store.forget('aa')
+    assert store.get('aa') is None
+    assert store.age('aa') is None
+    assert store.update('aa', {'humidity': 40}, now=2) == ['humidity']
+
+
+def test_events_are_emitted_even_when_nothing_compared_changed():
+    store = DeviceStateStore(heartbeat=60)
+    first_press = {'button_state': 1, 'raw_data': ['0x1', '0x10', '0x0', '0x0']}
+    second_press = {'button_state': 1, 'raw_data': ['0x1', '0x11', '0x0', '0x0']}  # Next frame counter
+
+    assert store.update('aa', first_press, now=0, event=True) == ['button_state']
+    assert store.update('aa', second_press, now=5, event=True) == []
+    assert store.update('aa', second_press, now=6) is None
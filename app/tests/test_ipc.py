@@ -0,0 +1,85 @@
+import socket
+import threading
+
+import pytest
+
+from core import ipc
+
+
+@pytest.fixture
+def channels():
+    left, right = socket.socketpair()
+    hub, worker = ipc.Channel(left), ipc.Channel(right)
+    yield hub, worker
+    hub.close()
+    worker.close()
+
+
+def test_messages_keep_their_type_payload_and_order(channels):
+    hub, worker = channels
+
+    assert worker.send(ipc.HELLO, {'protocol': 'BLE', 'scan_filter_method': 'device_name', 'scan_filter': 'x'})
+    assert worker.send(ipc.DATA, {'devid': 'aa:bb', 'primary': {'value': [1.5, None]}})
+    assert worker.send(ipc.STOP)
+
+    assert hub.recv() == (ipc.HELLO, {'protocol': 'BLE', 'scan_filter_method': 'device_name', 'scan_filter': 'x'})
+    assert hub.recv() == (ipc.DATA, {'devid': 'aa:bb', 'primary': {'value': [1.5, None]}})
+    assert hub.recv() == (ipc.STOP, None)
+
+
+def test_large_frames_arrive_whole(channels):
+    hub, worker = channels
+    payload = bytes(range(256)) * 4096  # Larger than a socket buffer: sent and read in pieces
+
+    sender = threading.Thread(target=worker.send, args=(ipc.DATA, payload))
+    sender.start()
+    assert hub.recv() == (ipc.DATA, payload)
+    sender.join()
+
+
+def test_concurrent_senders_do_not_interleave_frames(channels):
+    hub, worker = channels
+    threads = [threading.Thread(target=lambda n=n: [worker.send(ipc.EVENT, (n, i)) for i in range(200)])
+               for n in range(4)]
+    for thread in threads:
+        thread.start()
+
+    received = [hub.recv() for _ in range(800)]
+    for thread in threads:
+        thread.join()
+
+    assert all(message_type == ipc.EVENT for message_type, _ in received)
+    for n in range(4):
+        assert [i for sender, i in (payload for _, payload in received) if sender == n] == list(range(200))
+
+
+def test_recv_returns_none_once_the_peer_is_gone(channels):
+    hub, worker = channels
+    worker.send(ipc.STOP)
+    worker.close()
+
+    assert hub.recv() == (ipc.STOP, None)
+    assert hub.recv() is None
+
+
+def test_truncated_frame_returns_none(channels):
+    hub, worker = channels
+    worker.sock.sendall(ipc.HEADER.pack(100, ipc.DATA) + b'short')
+    worker.sock.shutdown(socket.SHUT_WR)
+
+    assert hub.recv() is None
+
+
+def test_oversized_frame_is_refused(channels):
+    hub, worker = channels
+    worker.sock.sendall(ipc.HEADER.pack(ipc.MAX_FRAME_SIZE + 1, ipc.DATA))
+
+    with pytest.raises(ValueError):
+        hub.recv()
+
+
+def test_send_reports_a_closed_socket(channels):
+    hub, worker = channels
+    hub.close()
+
+    assert not worker.send(ipc.DATA, b'x' * 1024 * 1024)
@@ -0,0 +1,94 @@
+import threading
+
+import pytest
+
+from core import metrics
+
+
+def test_counter_family_is_named_after_its_total_samples():
+    counter = metrics.Counter('hub_things', 'Things seen', ['kind'])
+    counter.labels('a').inc()
+    counter.labels('b').inc(2)
+
+    assert counter.render().splitlines() == [
+        '# HELP hub_things_total Things seen',
+        '# TYPE hub_things_total counter',
+        'hub_things_total{kind="a"} 1',
+        'hub_things_total{kind="b"} 2',
+    ]
+
+
+def test_gauge_and_histogram_rendering():
+    gauge = metrics.Gauge('hub_depth', 'Queue depth')
+    gauge.set_function(lambda: 7)
+    histogram = metrics.Histogram('hub_seconds', 'Durations', buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5.0)
+
+    assert gauge.render().splitlines()[-1] == 'hub_depth 7'
+    assert histogram.render().splitlines()[2:] == [
+        'hub_seconds_bucket{le="0.1"} 1',
+        'hub_seconds_bucket{le="1.0"} 2',
+        'hub_seconds_bucket{le="+Inf"} 3',
+        'hub_seconds_sum 5.55',
+        'hub_seconds_count 3',
+    ]
+
+
+def test_gauge_inc_and_dec_from_many_threads_cancel_out():
+    gauge = metrics.Gauge('hub_in_flight', 'In flight', ['plugin'])
+    child = gauge.labels('x')
+
+    def work():
+        for _ in range(10000):
+            child.inc()
+            child.dec()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert gauge.render().splitlines()[-1] == 'hub_in_flight{plugin="x"} 0'
+
+
+def test_label_values_are_escaped():
+    gauge = metrics.Gauge('hub_names', 'Names', ['name'])
+    gauge.labels('a "quoted"\\name\n').set(1)
+
+    assert gauge.render().splitlines()[-1] == 'hub_names{name="a \\"quoted\\"\\\\name\\n"} 1'
+
+
+def test_labels_must_match_label_names():
+    counter = metrics.Counter('hub_labelled', 'Labelled', ['plugin'])
+
+    with pytest.raises(ValueError):
+        counter.labels('a', 'b')
+
+
+def test_registry_returns_the_registered_metric_and_rejects_conflicts():
+    registry = metrics.Registry()
+    first = registry.register(metrics.Counter('hub_shared', 'Shared', ['plugin']))
+
+    assert registry.register(metrics.Counter('hub_shared', 'Shared', ['plugin'])) is first
+    with pytest.raises(ValueError):
+        registry.register(metrics.Gauge('hub_shared', 'Shared', ['plugin']))
+
+
+def test_merge_keeps_the_first_family_of_each_name():
+    hub = metrics.Registry()
+    hub.register(metrics.Counter('hub_events', 'Events', ['plugin'])).labels('hub').inc()
+    hub.register(metrics.Gauge('hub_only', 'Only in the hub')).set(1)
+    server = metrics.Registry()
+    server.register(metrics.Counter('hub_events', 'Events', ['plugin'])).labels('server').inc(3)
+    server.register(metrics.Gauge('server_only', 'Only in the server')).set(2)
+
+    merged = metrics.merge(hub.render(), server.render()).splitlines()
+
+    assert merged.count('# TYPE hub_events_total counter') == 1
+    assert 'hub_events_total{plugin="hub"} 1' in merged
+    assert 'hub_events_total{plugin="server"} 3' not in merged
+    assert 'hub_only 1' in merged
+    assert 'server_only 2' in merged
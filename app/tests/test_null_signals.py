@@ -0,0 +1,52 @@
+import pytest
+
+from plugins import null_signals
+from plugins.null_signals import SignalTable, PATTERNS, DATA_POINTS
+
+np = pytest.importorskip('numpy')
+
+
+def device_patterns(count):
+    """Every pattern on every data point, with varied parameters, time units and unemulated points."""
+    devices = []
+    for i in range(count):
+        data = {}
+        for index, point in enumerate(DATA_POINTS):
+            if (i + index) % 7 == 0:
+                continue  # Not emulated: stays 0
+            data[point] = {'pattern': PATTERNS[(i + index) % len(PATTERNS)], 'params': {
+                'offset': i % 13, 'amplitude': 1 + i % 5, 'period': 7 + i % 50, 'min_value': -i % 4,
+                'max_value': 10 + i % 9, 'time_unit': ('seconds', 'minutes', 'hours')[i % 3]}}
+        devices.append(data)
+    return devices
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    patterns = device_patterns(200)
+    vectorized = SignalTable(patterns)
+    monkeypatch.setattr(null_signals, 'np', None)
+    scalar = SignalTable(patterns)
+    return vectorized, scalar
+
+
+@pytest.mark.parametrize('timestamp', [0.0, 1.25, 1700000000.5, 1700003599.9])
+def test_vectorized_generate_matches_the_scalar_fallback(tables, monkeypatch, timestamp):
+    vectorized, scalar = tables
+    monkeypatch.setattr(null_signals, 'np', np)
+    for rows in (None, [5, 0, 199, 5, 42]):
+        actual = vectorized.generate(timestamp, rows)
+        monkeypatch.setattr(null_signals, 'np', None)
+        expected = scalar.generate(timestamp, rows)
+        expected_rounded = scalar.generate_rounded(timestamp, rows)
+        monkeypatch.setattr(null_signals, 'np', np)
+
+        assert np.allclose(actual, expected, rtol=1e-9, atol=1e-9)
+        # Values on a rounding boundary may round either way
+        assert np.allclose(vectorized.generate_rounded(timestamp, rows), expected_rounded, rtol=0, atol=0.0101)
+
+
+def test_unemulated_points_stay_zero(tables):
+    vectorized, _ = tables
+
+    assert vectorized.generate(123.0, [0])[0][0] == 0
@@ -0,0 +1,87 @@
+from core.scan_report import ScanReport
+
+
+def record(mac, name='sensor', rssi=-60):
+    return {'mac_address': mac, 'device_name': name, 'rssi': rssi}
+
+
+def delta_report(records, now=0):
+    """A report whose backend takes deltas, with `records` acknowledged in a full payload at `now`."""
+    report = ScanReport(full_resync_interval=3600, deltas=True)
+    report.acknowledge(report.build(records, now=now)['sequence'])
+    return report
+
+
+def test_payloads_are_full_until_deltas_are_enabled():
+    report = ScanReport()
+    records = [record('aa')]
+
+    for now in range(3):
+        payload = report.build(records, now=now)
+        assert payload['full'] and payload['devices'] == records and 'removed' not in payload
+        report.acknowledge(payload['sequence'])
+
+
+def test_an_echoed_sequence_enables_deltas():
+    report = ScanReport()
+    records = [record('aa')]
+    payload = report.build(records, now=0)
+    report.acknowledge(payload['sequence'], echoed=payload['sequence'])
+
+    assert report.build(records, now=1) == {'sequence': 2, 'full': False, 'devices': [], 'removed': []}
+
+
+def test_a_different_echo_does_not_enable_deltas():
+    report = ScanReport()
+    payload = report.build([record('aa')], now=0)
+    report.acknowledge(payload['sequence'], echoed=payload['sequence'] + 1)
+
+    assert report.build([record('aa')], now=1)['full']
+
+
+def test_delta_lists_new_changed_and_removed_devices():
+    report = delta_report([record('aa'), record('bb'), record('cc')])
+
+    payload = report.build([record('aa'), record('bb', name='renamed'), record('dd')], now=1)
+
+    assert not payload['full']
+    assert payload['devices'] == [record('bb', name='renamed'), record('dd')]
+    assert payload['removed'] == ['cc']
+
+
+def test_rssi_alone_is_not_a_change():
+    report = delta_report([record('aa', rssi=-60)])
+
+    assert report.build([record('aa', rssi=-80)], now=1)['devices'] == []
+
+
+def test_unacknowledged_changes_are_reported_again():
+    report = delta_report([record('aa')])
+
+    report.build([record('aa'), record('bb')], now=1)  # Sent, never answered
+    assert report.build([record('aa'), record('bb')], now=2)['devices'] == [record('bb')]
+
+
+def test_rejected_payload_forces_a_full_resync():
+    report = delta_report([record('aa')])
+    payload = report.build([record('aa'), record('bb')], now=1)
+    report.reject(payload['sequence'])
+
+    payload = report.build([record('aa'), record('bb')], now=2)
+    assert payload['full'] and len(payload['devices']) == 2
+
+
+def test_full_resync_after_the_interval():
+    report = delta_report([record('aa')], now=0)
+
+    assert not report.build([record('aa')], now=3599)['full']
+    assert report.build([record('aa')], now=3600)['full']
+
+
+def test_stale_acknowledgement_is_ignored():
+    report = delta_report([record('aa')])
+    first = report.build([record('aa'), record('bb')], now=1)
+    report.build([record('aa'), record('bb')], now=2)
+    report.acknowledge(first['sequence'])  # Answer to a payload that was superseded
+
+    assert report.build([record('aa'), record('bb')], now=3)['devices'] == [record('bb')]
@@ -0,0 +1,98 @@
+import threading
+import time
+
+from core.scheduler import Scheduler
+
+
+def test_items_pop_in_due_order():
+    scheduler = Scheduler()
+    now = time.monotonic()
+    scheduler.schedule('late', 3, now - 1)
+    scheduler.schedule('early', 1, now - 3)
+    scheduler.schedule('middle', 2, now - 2)
+
+    assert [scheduler.pop_due(timeout=0)[1] for _ in range(3)] == [1, 2, 3]
+    assert len(scheduler) == 0
+
+
+def test_a_key_is_scheduled_once_until_popped():
+    scheduler = Scheduler()
+    now = time.monotonic()
+
+    assert scheduler.schedule('device', 'first', now)
+    assert not scheduler.schedule('device', 'second', now)
+    assert scheduler.pop_due(timeout=0)[:2] == ('device', 'first')
+    assert scheduler.schedule('device', 'second', now)
+
+
+def test_pop_due_times_out_before_the_item_is_due():
+    scheduler = Scheduler()
+    scheduler.schedule('device', None, time.monotonic() + 60)
+
+    start = time.monotonic()
+    assert scheduler.pop_due(timeout=0.05) is None
+    assert time.monotonic() - start < 1
+    assert len(scheduler) == 1
+
+
+def test_cancelled_items_are_skipped():
+    scheduler = Scheduler()
+    now = time.monotonic()
+    scheduler.schedule('cancelled', None, now - 1)
+    scheduler.schedule('kept', None, now)
+    scheduler.cancel('cancelled')
+
+    assert scheduler.pop_due(timeout=0)[0] == 'kept'
+    assert scheduler.pop_due(timeout=0) is None
+
+
+def test_overdue_counts_only_live_items_past_their_due_time():
+    scheduler = Scheduler()
+    now = time.monotonic()
+    scheduler.schedule('a', None, now - 1)
+    scheduler.schedule('b', None, now - 1)
+    scheduler.schedule('c', None, now + 60)
+    scheduler.cancel('b')
+
+    assert scheduler.overdue() == 1
+
+
+def test_spread_moves_the_due_time_within_bounds():
+    scheduler = Scheduler()
+    now = time.monotonic()
+    for key in range(100):
+        scheduler.schedule(key, None, now + 100, spread=10)
+
+    dues = [due for due, _, _ in scheduler.heap]
+    assert all(now + 90 <= due <= now + 110 for due in dues)
+    assert len(set(dues)) > 1
+
+
+def test_an_earlier_item_wakes_a_waiting_pop():
+    scheduler = Scheduler()
+    scheduler.schedule('later', None, time.monotonic() + 60)
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(scheduler.pop_due(timeout=5)))
+    waiter.start()
+    time.sleep(0.05)
+
+    start = time.monotonic()
+    scheduler.schedule('now', None, time.monotonic())
+    waiter.join()
+
+    assert result[0][0] == 'now'
+    assert time.monotonic() - start < 1
+
+
+def test_close_wakes_waiters_and_refuses_new_items():
+    scheduler = Scheduler()
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(scheduler.pop_due()))
+    waiter.start()
+    time.sleep(0.05)
+
+    scheduler.close()
+    waiter.join(timeout=1)
+
+    assert result == [None]
+    assert not scheduler.schedule('device', None, time.monotonic())